@@ -0,0 +1,367 @@
+"""Benchmark de la app completa sin servicios externos: Mongo en memoria (mongomock_motor), Neo4j en
+memoria (bench/falsos.py) y Gemini reemplazado por el stub. Levanta la API real con uvicorn en un
+hilo de este mismo proceso, carga un catálogo sintético y la recorre con una mezcla de tráfico
+(catálogo, usuarios, favoritos, recomendaciones, try-on) a concurrencia creciente.
+
+    pip install -r bench/requirements.txt
+    python -m bench.bench_offline --concurrencia 1 8 32 --duracion 5 --salida resultados.json
+    python -m bench.bench_offline --salida despues.json --comparar antes.json
+
+Por cada nivel informa req/s, p50/p95/p99 por endpoint y el pico de RSS del proceso. Después corre
+cada endpoint aislado para tener el RSS de cada uno (--solo-mezcla lo saltea). Con --comparar marca
+las regresiones contra un JSON anterior y termina con código 1 si hay alguna, para usarlo entre commits.
+El generador de carga comparte proceso (y GIL) con la app: los números sirven para comparar
+versiones entre sí, no como capacidad absoluta del servidor.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import httpx
+
+from bench.bench_rps import imagen_png, percentil
+
+MEZCLA = {
+    "listar_prendas": 30,
+    "prendas_por_tipo": 10,
+    "buscar_prendas": 6,
+    "obtener_prenda": 20,
+    "obtener_usuario": 12,
+    "ver_favoritos": 8,
+    "agregar_favorito": 5,
+    "recomendaciones": 8,
+    "probar_prenda": 7,
+}
+# Por debajo de esto el p95 de un endpoint se informa pero no cuenta como regresión
+MUESTRAS_MINIMAS = 50
+TIPOS = ["remera", "pantalon", "campera", "vestido", "buzo"]
+MARCAS = ["zarpado", "norte", "pampa", "delta"]
+
+def preparar_entorno(args, directorio: str):
+    """Variables que lee config.py al importarse: tiene que correr antes de importar la app."""
+    os.environ.update(
+        STORAGE_DIR=os.path.join(directorio, "storage"),
+        CACHE_DIR=os.path.join(directorio, "cache_resultados"),
+        GENAI_STUB="1",
+        GENAI_STUB_LATENCIA_MS=str(args.latencia_ms),
+        GENAI_STUB_LADO=str(args.lado_imagen),
+    )
+    # La cuota de Gemini limitaría el try-on a unas pocas req/s: acá se mide la app, no la cuota
+    for nombre, valor in (
+        ("GENAI_RPM_IMAGEN", "0"), ("GENAI_RPM_DESCRIPCION", "0"), ("ALMACEN_GC_INTERVALO", "0"),
+        ("RECOMENDACIONES_INTERVALO", "5"), ("PERFILADOR_UMBRAL_MS", "0"),
+    ):
+        os.environ.setdefault(nombre, valor)
+
+def rss_mb() -> float:
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except OSError:
+        # Sin /proc (macOS): el pico histórico del proceso
+        import resource
+        pico = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return pico / (2**20 if sys.platform == "darwin" else 1024)
+
+class MedidorRSS:
+    """Muestrea el RSS del proceso mientras corre un nivel y guarda el máximo."""
+
+    def __init__(self, intervalo: float = 0.05):
+        self.intervalo = intervalo
+        self.pico = 0.0
+        self._task = None
+
+    async def __aenter__(self):
+        self.inicio = self.pico = rss_mb()
+        self._task = asyncio.create_task(self._muestrear())
+        return self
+
+    async def __aexit__(self, *exc):
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self.pico = max(self.pico, rss_mb())
+
+    async def _muestrear(self):
+        while True:
+            self.pico = max(self.pico, rss_mb())
+            await asyncio.sleep(self.intervalo)
+
+class Servidor:
+    """uvicorn en un hilo propio (con su event loop), como un servidor aparte."""
+
+    def __init__(self, app):
+        import uvicorn
+        with socket.socket() as s:
+            s.bind(("127.0.0.1", 0))
+            self.puerto = s.getsockname()[1]
+        self.server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=self.puerto, log_level="warning"))
+        self._hilo = threading.Thread(target=self.server.run, name="api", daemon=True)
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.puerto}"
+
+    def iniciar(self):
+        self._hilo.start()
+        limite = time.monotonic() + 30
+        while not self.server.started:
+            if not self._hilo.is_alive() or time.monotonic() > limite:
+                raise RuntimeError("La API no arrancó")
+            time.sleep(0.05)
+
+    def detener(self):
+        self.server.should_exit = True
+        self._hilo.join()
+
+async def sembrar(cliente: httpx.AsyncClient, args, rng: random.Random) -> dict:
+    """Catálogo y usuarios a través de la API (mismo camino que en producción: almacén, variantes,
+    descripción e índice de similitud). Cada usuario arranca con algunos favoritos."""
+    limite = asyncio.Semaphore(8)
+
+    async def prenda(i: int):
+        async with limite:
+            r = await cliente.post("/api/prendas", data={
+                "nombre": f"prenda {i}", "tipo": TIPOS[i % len(TIPOS)], "marca": MARCAS[i % len(MARCAS)],
+                "descripcion": f"prenda de prueba {TIPOS[i % len(TIPOS)]} {i}",
+            }, files={"file": ("p.png", imagen_png((i & 255, (i >> 8) & 255, 128), lado=args.lado_prenda), "image/png")})
+            r.raise_for_status()
+            return r.json()
+
+    async def usuario(i: int):
+        async with limite:
+            r = await cliente.post("/api/usuarios", json={
+                "username": f"usuario{i}", "email": f"usuario{i}@bench.zarpado.com", "password": "bench", "rol": "final",
+            })
+            r.raise_for_status()
+            return r.json()["id"]
+
+    t0 = time.perf_counter()
+    prendas = await asyncio.gather(*(prenda(i) for i in range(args.prendas)))
+    usuarios = await asyncio.gather(*(usuario(i) for i in range(args.usuarios)))
+    for user_id in usuarios:
+        for p in rng.sample(prendas, min(3, len(prendas))):
+            await cliente.post(f"/api/usuarios/{user_id}/favoritos", data={"image_path": p["image_path"], "prenda_id": p["id"]})
+    print(f"🔎 {len(prendas)} prendas y {len(usuarios)} usuarios cargados en {time.perf_counter() - t0:.1f}s")
+    return {"prendas": prendas, "usuarios": usuarios}
+
+def escenarios(datos: dict, rng: random.Random, lado_usuario: int) -> dict:
+    prendas, usuarios = datos["prendas"], datos["usuarios"]
+    contador = iter(range(1 << 24))
+
+    def foto_unica():
+        # Un color distinto por request para que la cache de resultados no responda por Gemini
+        n = next(contador)
+        return imagen_png((n & 255, (n >> 8) & 255, (n >> 16) & 255), lado=lado_usuario)
+
+    def favorito(c):
+        p = rng.choice(prendas)
+        return c.post(f"/api/usuarios/{rng.choice(usuarios)}/favoritos", data={"image_path": p["image_path"], "prenda_id": p["id"]})
+
+    def buscar(c):
+        # Mitad texto solo, mitad texto más filtro
+        params = {"q": f"prenda {rng.choice(MARCAS)}"}
+        if rng.random() < 0.5:
+            params["tipo"] = rng.choice(TIPOS)
+        return c.get("/api/prendas/search", params=params)
+
+    return {
+        "listar_prendas": lambda c: c.get("/api/prendas"),
+        "prendas_por_tipo": lambda c: c.get(f"/api/prendas/tipo/{rng.choice(TIPOS)}"),
+        "buscar_prendas": buscar,
+        "obtener_prenda": lambda c: c.get(f"/api/prendas/{rng.choice(prendas)['id']}"),
+        "obtener_usuario": lambda c: c.get(f"/api/usuarios/{rng.choice(usuarios)}"),
+        "ver_favoritos": lambda c: c.get(f"/api/usuarios/{rng.choice(usuarios)}/favoritos"),
+        "agregar_favorito": favorito,
+        "recomendaciones": lambda c: c.get(f"/api/recomendaciones/{rng.choice(usuarios)}"),
+        "probar_prenda": lambda c: c.post(
+            "/api/probar_prenda",
+            data={"user_id": rng.choice(usuarios), "prenda_id": rng.choice(prendas)["id"]},
+            files={"file_usuario": ("u.png", foto_unica(), "image/png")},
+        ),
+    }
+
+def resumen(latencias: list, errores: int, segundos: float) -> dict:
+    return {
+        "requests": len(latencias),
+        "errores": errores,
+        "rps": round(len(latencias) / segundos, 1),
+        "p50_ms": round(percentil(latencias, 50), 1) if latencias else None,
+        "p95_ms": round(percentil(latencias, 95), 1) if latencias else None,
+        "p99_ms": round(percentil(latencias, 99), 1) if latencias else None,
+    }
+
+async def correr(cliente, pedidos: dict, elegir, concurrencia: int, duracion: float) -> dict:
+    latencias = {nombre: [] for nombre in pedidos}
+    errores = dict.fromkeys(pedidos, 0)
+    fin = time.perf_counter() + duracion
+
+    async def usuario_virtual():
+        while time.perf_counter() < fin:
+            nombre = elegir()
+            t0 = time.perf_counter()
+            try:
+                r = await pedidos[nombre](cliente)
+                if r.status_code >= 400:
+                    errores[nombre] += 1
+            except httpx.HTTPError:
+                errores[nombre] += 1
+            latencias[nombre].append((time.perf_counter() - t0) * 1000)
+
+    async with MedidorRSS() as rss:
+        t0 = time.perf_counter()
+        await asyncio.gather(*(usuario_virtual() for _ in range(concurrencia)))
+        segundos = time.perf_counter() - t0
+    todas = [l for ls in latencias.values() for l in ls]
+    return {
+        "concurrencia": concurrencia,
+        **resumen(todas, sum(errores.values()), segundos),
+        "rss_inicio_mb": round(rss.inicio, 1),
+        "rss_pico_mb": round(rss.pico, 1),
+        "endpoints": {n: resumen(latencias[n], errores[n], segundos) for n in pedidos if latencias[n]},
+    }
+
+def imprimir(titulo: str, res: dict):
+    print(f"\n== {titulo} c={res['concurrencia']}: {res['rps']} req/s, errores={res['errores']}, "
+          f"RSS {res['rss_inicio_mb']} -> {res['rss_pico_mb']} MB")
+    for nombre, e in res["endpoints"].items():
+        print(f"   {nombre:18} {e['rps']:>8} req/s  p50={e['p50_ms']}ms  p95={e['p95_ms']}ms  p99={e['p99_ms']}ms  errores={e['errores']}")
+
+async def medir(args, url: str) -> dict:
+    rng = random.Random(args.semilla)
+    limites = httpx.Limits(max_connections=max(args.concurrencia) * 2)
+    async with httpx.AsyncClient(base_url=url, timeout=120, limits=limites) as cliente:
+        datos = await sembrar(cliente, args, rng)
+        pedidos = escenarios(datos, rng, args.lado_usuario)
+        nombres, pesos = list(MEZCLA), list(MEZCLA.values())
+
+        def mezcla():
+            return rng.choices(nombres, pesos)[0]
+
+        if args.calentamiento:
+            await correr(cliente, pedidos, mezcla, min(args.concurrencia), args.calentamiento)
+
+        resultados = {"mezcla": [], "aislados": {}}
+        for conc in args.concurrencia:
+            res = await correr(cliente, pedidos, mezcla, conc, args.duracion)
+            resultados["mezcla"].append(res)
+            imprimir("mezcla", res)
+        if not args.solo_mezcla:
+            for nombre in nombres:
+                resultados["aislados"][nombre] = []
+                for conc in args.concurrencia:
+                    res = await correr(cliente, pedidos, lambda: nombre, conc, args.duracion)
+                    resultados["aislados"][nombre].append(res)
+                    imprimir(nombre, res)
+    return resultados
+
+def version_codigo() -> str:
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+        sucio = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], capture_output=True, text=True).stdout.strip()
+        return commit + ("-sucio" if sucio else "")
+    except (OSError, subprocess.CalledProcessError):
+        return "desconocido"
+
+def comparar(base: dict, actual: dict, tolerancia: float) -> list:
+    """Regresiones más allá de `tolerancia`: req/s de cada corrida y p95 de cada endpoint.
+    En la mezcla las req/s de un endpoint dependen de cuánto tarda el resto, así que solo
+    se compara el total del nivel."""
+    regresiones = []
+    ignorar = {"salida", "comparar", "tolerancia", "solo_mezcla"}
+    distintos = {
+        k for k, v in actual["meta"]["parametros"].items()
+        if k not in ignorar and base.get("meta", {}).get("parametros", {}).get(k) != v
+    }
+    if distintos:
+        print(f"⚠️ Las corridas usan parámetros distintos ({', '.join(sorted(distintos))}): la comparación no es pareja")
+
+    def anotar(titulo, conc, nombre, metrica, antes, despues, peor):
+        cambio = despues / antes - 1
+        print(f"{'❌' if peor(cambio) else '  '} {titulo:16} c={conc:<4} {nombre:18} {metrica} {antes} -> {despues} ({cambio:+.0%})")
+        if peor(cambio):
+            regresiones.append({"escenario": titulo, "concurrencia": conc, "endpoint": nombre, metrica: cambio})
+
+    pares = [("mezcla", base.get("mezcla", []), actual.get("mezcla", []))]
+    pares += [(n, base.get("aislados", {}).get(n, []), corridas) for n, corridas in actual.get("aislados", {}).items()]
+    for titulo, antes, despues in pares:
+        antes = {r["concurrencia"]: r for r in antes}
+        for r in despues:
+            b = antes.get(r["concurrencia"])
+            if not b:
+                continue
+            if b["rps"]:
+                anotar(titulo, r["concurrencia"], "total", "req/s", b["rps"], r["rps"], lambda c: c < -tolerancia)
+            for nombre, e in r["endpoints"].items():
+                eb = b["endpoints"].get(nombre)
+                if eb and eb["p95_ms"] and e["p95_ms"]:
+                    # Diferencias de 1-2 ms en endpoints rápidos, o un p95 de pocas muestras, son ruido
+                    lento = e["p95_ms"] - eb["p95_ms"] > 2 and min(e["requests"], eb["requests"]) >= MUESTRAS_MINIMAS
+                    anotar(titulo, r["concurrencia"], nombre, "p95_ms", eb["p95_ms"], e["p95_ms"],
+                           lambda c: c > tolerancia and lento)
+    print(f"{'❌' if regresiones else '✅'} {len(regresiones)} regresiones")
+    return regresiones
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark offline de la API (Mongo, Neo4j y Gemini locales)")
+    parser.add_argument("--concurrencia", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--duracion", type=float, default=5)
+    parser.add_argument("--calentamiento", type=float, default=2, help="segundos de mezcla descartados al principio")
+    parser.add_argument("--prendas", type=int, default=200)
+    parser.add_argument("--usuarios", type=int, default=50)
+    parser.add_argument("--latencia-ms", type=int, default=300, help="latencia simulada de Gemini")
+    parser.add_argument("--lado-imagen", type=int, default=1024, help="lado de la imagen que devuelve el stub")
+    parser.add_argument("--lado-prenda", type=int, default=512)
+    parser.add_argument("--lado-usuario", type=int, default=512)
+    parser.add_argument("--semilla", type=int, default=1)
+    parser.add_argument("--solo-mezcla", action="store_true", help="no correr cada endpoint aislado")
+    parser.add_argument("--salida", help="archivo JSON donde guardar los resultados")
+    parser.add_argument("--comparar", help="JSON de una corrida anterior para marcar regresiones")
+    parser.add_argument("--tolerancia", type=float, default=0.25, help="empeoramiento relativo aceptado")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="zarpado_bench_") as directorio:
+        preparar_entorno(args, directorio)
+        from bench import falsos
+        falsos.instalar()
+        import main as app_main
+
+        servidor = Servidor(app_main.app)
+        servidor.iniciar()
+        try:
+            resultados = asyncio.run(medir(args, servidor.url))
+        finally:
+            servidor.detener()
+
+    salida = {
+        "meta": {
+            "commit": version_codigo(),
+            "fecha": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "plataforma": platform.platform(),
+            "cpus": os.cpu_count(),
+            "parametros": vars(args),
+        },
+        **resultados,
+    }
+    if args.salida:
+        with open(args.salida, "w", encoding="utf-8") as f:
+            json.dump(salida, f, indent=2)
+        print(f"\n✅ Resultados en {args.salida}")
+    if args.comparar:
+        with open(args.comparar, encoding="utf-8") as f:
+            base = json.load(f)
+        print(f"\n== Comparación contra {base.get('meta', {}).get('commit', args.comparar)}")
+        if comparar(base, salida, args.tolerancia):
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
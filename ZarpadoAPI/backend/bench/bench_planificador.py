@@ -0,0 +1,106 @@
+"""Ejercita el planificador de llamadas a Gemini contra el proveedor falso (ClienteStub), sin red.
+
+    python -m bench.bench_planificador --llamadas 200 --rpm 600 --fallas 0.1 --fallas-429 0.05
+
+Escenarios: carriles de prioridad (backfill encolado primero y las interactivas igual pasan
+antes), single-flight (pedidos con la misma clave), reintentos con fallas inyectadas y circuit
+breaker con el proveedor caído. Imprime las métricas del planificador de cada uno.
+"""
+import argparse
+import asyncio
+import json
+import time
+from types import SimpleNamespace
+
+from fastapi import HTTPException
+
+from utils.gemini import ClienteStub
+from utils.planificador import PlanificadorModelos, INTERACTIVA, BACKFILL
+
+MODELO = "stub"
+
+def planificador(args, fallos_circuito: int = 1000) -> PlanificadorModelos:
+    return PlanificadorModelos(
+        limites={MODELO: (args.rpm, args.rafaga)},
+        reintentos=args.reintentos,
+        backoff_base=0.05,
+        backoff_max=0.5,
+        deadlines={INTERACTIVA: 30, BACKFILL: 120},
+        fallos_circuito=fallos_circuito,
+        espera_circuito=1,
+    )
+
+def generar(cliente: ClienteStub, timeout: float):
+    config = SimpleNamespace(http_options=SimpleNamespace(timeout=int(timeout * 1000)))
+    return cliente.models.generate_content(model=MODELO, contents=[], config=config)
+
+async def llamar(p: PlanificadorModelos, cliente: ClienteStub, prioridad: int = INTERACTIVA, clave: str = None):
+    t0 = time.perf_counter()
+    try:
+        await p.llamar(MODELO, generar, cliente, prioridad=prioridad, clave=clave)
+        return prioridad, time.perf_counter() - t0, None
+    except HTTPException as e:
+        return prioridad, time.perf_counter() - t0, e.status_code
+
+def resumen(nombre: str, p: PlanificadorModelos, resultados: list):
+    errores = {}
+    for _, _, codigo in resultados:
+        if codigo:
+            errores[codigo] = errores.get(codigo, 0) + 1
+    print(f"\n== {nombre}: {len(resultados)} llamadas, errores {errores or 'ninguno'}")
+    print(json.dumps(p.estadisticas()[MODELO], indent=2))
+
+async def carriles(args):
+    p = planificador(args)
+    cliente = ClienteStub(args.latencia_ms)
+    # Backfill primero, interactivas después: con la cuota saturada las interactivas tienen que esperar menos
+    tareas = [asyncio.create_task(llamar(p, cliente, BACKFILL)) for _ in range(args.llamadas)]
+    await asyncio.sleep(0)
+    tareas += [asyncio.create_task(llamar(p, cliente, INTERACTIVA)) for _ in range(args.llamadas // 4)]
+    resultados = await asyncio.gather(*tareas)
+    resumen("carriles", p, resultados)
+    for prioridad, nombre in ((INTERACTIVA, "interactiva"), (BACKFILL, "backfill")):
+        tiempos = sorted(t for pr, t, _ in resultados if pr == prioridad)
+        print(f"{nombre}: p50 {tiempos[len(tiempos) // 2] * 1000:.0f} ms, max {tiempos[-1] * 1000:.0f} ms")
+
+async def coalescencia(args):
+    p = planificador(args)
+    cliente = ClienteStub(args.latencia_ms)
+    resultados = await asyncio.gather(*(llamar(p, cliente, clave=f"k{i % 5}") for i in range(args.llamadas)))
+    resumen("single-flight (5 claves distintas)", p, resultados)
+
+async def reintentos(args):
+    p = planificador(args)
+    cliente = ClienteStub(args.latencia_ms, args.fallas, args.fallas_429)
+    resultados = await asyncio.gather(*(llamar(p, cliente) for _ in range(args.llamadas)))
+    resumen(f"reintentos ({args.fallas:.0%} 503, {args.fallas_429:.0%} 429)", p, resultados)
+
+async def circuito(args):
+    p = planificador(args, fallos_circuito=5)
+    caido = ClienteStub(args.latencia_ms, fallas=1)
+    resultados = await asyncio.gather(*(llamar(p, caido) for _ in range(args.llamadas)))
+    resumen("circuit breaker (proveedor caído)", p, resultados)
+    # Pasada la espera, una llamada de prueba exitosa lo vuelve a cerrar
+    await asyncio.sleep(1.1)
+    await llamar(p, ClienteStub(args.latencia_ms))
+    print(f"después de la prueba: circuito {p.estadisticas()[MODELO]['circuito']}")
+
+async def main_async(args):
+    await carriles(args)
+    await coalescencia(args)
+    await reintentos(args)
+    await circuito(args)
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark del planificador de llamadas al modelo")
+    parser.add_argument("--llamadas", type=int, default=100)
+    parser.add_argument("--rpm", type=float, default=1200)
+    parser.add_argument("--rafaga", type=int, default=5)
+    parser.add_argument("--reintentos", type=int, default=3)
+    parser.add_argument("--latencia-ms", type=int, default=50)
+    parser.add_argument("--fallas", type=float, default=0.2)
+    parser.add_argument("--fallas-429", type=float, default=0.1)
+    asyncio.run(main_async(parser.parse_args()))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+"""Mide requests/segundo de la API corriendo en `--url` con distintos niveles de concurrencia.
+
+Para comparar antes/después se corre el mismo comando contra cada versión del backend
+(con Mongo real y `GENAI_STUB=1` para que probar_prenda no dependa de Gemini):
+
+    GENAI_STUB=1 GENAI_STUB_LATENCIA_MS=300 uvicorn main:app --port 8000
+    python -m bench.bench_rps --url http://127.0.0.1:8000 --concurrencia 1 16 64 --duracion 10 --salida antes.json
+
+Los ids de usuario y prenda se toman del primer elemento de /api/usuarios y /api/prendas si no se pasan.
+"""
+import argparse
+import asyncio
+import io
+import json
+import statistics
+import time
+
+import httpx
+from PIL import Image
+
+def imagen_png(color, lado=512) -> bytes:
+    buf = io.BytesIO()
+    Image.new("RGB", (lado, lado), color).save(buf, format="PNG")
+    return buf.getvalue()
+
+def escenarios(user_id: str, prenda_id: str):
+    contador = iter(range(1 << 24))
+
+    def foto_unica():
+        # Un color distinto por request para que la cache de resultados no responda por Gemini
+        n = next(contador)
+        return imagen_png((n & 255, (n >> 8) & 255, (n >> 16) & 255), lado=256)
+
+    return {
+        "listar_prendas": lambda c: c.get("/api/prendas"),
+        "obtener_prenda": lambda c: c.get(f"/api/prendas/{prenda_id}"),
+        "obtener_usuario": lambda c: c.get(f"/api/usuarios/{user_id}"),
+        "ver_favoritos": lambda c: c.get(f"/api/usuarios/{user_id}/favoritos"),
+        "probar_prenda": lambda c: c.post(
+            "/api/probar_prenda",
+            data={"user_id": user_id, "prenda_id": prenda_id},
+            files={"file_usuario": ("u.png", foto_unica(), "image/png")},
+        ),
+    }
+
+def percentil(valores, p):
+    if not valores:
+        return None
+    ordenados = sorted(valores)
+    return ordenados[min(len(ordenados) - 1, int(round(p / 100 * (len(ordenados) - 1))))]
+
+async def correr(cliente, pedido, concurrencia: int, duracion: float) -> dict:
+    latencias = []
+    errores = 0
+    fin = time.perf_counter() + duracion
+
+    async def usuario_virtual():
+        nonlocal errores
+        while time.perf_counter() < fin:
+            t0 = time.perf_counter()
+            try:
+                r = await pedido(cliente)
+                if r.status_code >= 400:
+                    errores += 1
+            except httpx.HTTPError:
+                errores += 1
+            latencias.append((time.perf_counter() - t0) * 1000)
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(usuario_virtual() for _ in range(concurrencia)))
+    total = time.perf_counter() - t0
+    return {
+        "concurrencia": concurrencia,
+        "requests": len(latencias),
+        "errores": errores,
+        "rps": round(len(latencias) / total, 1),
+        "p50_ms": round(statistics.median(latencias), 1) if latencias else None,
+        "p95_ms": round(percentil(latencias, 95), 1) if latencias else None,
+    }
+
+async def main_async(args):
+    limites = httpx.Limits(max_connections=max(args.concurrencia) * 2)
+    async with httpx.AsyncClient(base_url=args.url, timeout=120, limits=limites) as cliente:
+        user_id = args.user_id or (await cliente.get("/api/usuarios")).json()[0]["id"]
+        prenda_id = args.prenda_id or (await cliente.get("/api/prendas")).json()[0]["id"]
+        todos = escenarios(user_id, prenda_id)
+        elegidos = args.endpoints or list(todos)
+
+        resultados = {}
+        for nombre in elegidos:
+            resultados[nombre] = []
+            for conc in args.concurrencia:
+                res = await correr(cliente, todos[nombre], conc, args.duracion)
+                resultados[nombre].append(res)
+                print(f"{nombre:16} c={conc:<4} {res['rps']:>8} req/s  p50={res['p50_ms']}ms  p95={res['p95_ms']}ms  errores={res['errores']}")
+
+    if args.salida:
+        with open(args.salida, "w", encoding="utf-8") as f:
+            json.dump(resultados, f, indent=2)
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de requests/segundo")
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--concurrencia", type=int, nargs="+", default=[1, 16, 64])
+    parser.add_argument("--duracion", type=float, default=10)
+    parser.add_argument("--endpoints", nargs="*")
+    parser.add_argument("--user-id")
+    parser.add_argument("--prenda-id")
+    parser.add_argument("--salida", help="archivo JSON donde guardar los resultados")
+    asyncio.run(main_async(parser.parse_args()))
+
+if __name__ == "__main__":
+    main()
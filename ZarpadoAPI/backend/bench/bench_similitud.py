@@ -0,0 +1,48 @@
+"""Latencia de /prendas/{id}/similares a nivel índice, con un catálogo sintético.
+
+    python -m bench.bench_similitud --prendas 100000 --consultas 200
+"""
+import argparse
+import statistics
+import tempfile
+import time
+
+import numpy as np
+
+from utils.similitud import DIM, IndiceSimilitud
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark del índice de similitud")
+    parser.add_argument("--prendas", type=int, default=100000)
+    parser.add_argument("--consultas", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--lote", type=int, default=16)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    with tempfile.TemporaryDirectory() as directorio:
+        indice = IndiceSimilitud(directorio)
+        t0 = time.perf_counter()
+        for i in range(args.prendas):
+            v = rng.random(DIM, dtype=np.float32)
+            indice.agregar(f"{i:024x}", v / np.linalg.norm(v), sincronizar=False)
+        indice.sincronizar()
+        print(f"alta de {args.prendas} prendas: {time.perf_counter() - t0:.1f}s")
+
+        ids = [f"{i:024x}" for i in rng.integers(0, args.prendas, args.consultas)]
+        indice.similares(ids[0], args.k)
+        latencias = []
+        for prenda_id in ids:
+            t = time.perf_counter()
+            indice.similares(prenda_id, args.k)
+            latencias.append((time.perf_counter() - t) * 1000)
+        latencias.sort()
+        print(f"consulta individual: p50={statistics.median(latencias):.2f}ms p95={latencias[int(len(latencias) * 0.95) - 1]:.2f}ms")
+
+        t = time.perf_counter()
+        for i in range(0, len(ids), args.lote):
+            indice.similares_lote(ids[i:i + args.lote], args.k)
+        print(f"en lotes de {args.lote}: {(time.perf_counter() - t) * 1000 / len(ids):.2f}ms por prenda")
+
+if __name__ == "__main__":
+    main()
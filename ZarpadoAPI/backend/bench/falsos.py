@@ -0,0 +1,145 @@
+"""Reemplazos locales de Mongo y Neo4j para correr la app entera sin servicios (bench_offline).
+
+Mongo es mongomock_motor (en memoria, misma API async que motor). Neo4j es un grafo en memoria
+que entiende solo las consultas de utils/recomendaciones.py y las resuelve en Python con el mismo
+puntaje, así el precálculo de recomendaciones corre igual que contra la base real.
+"""
+from collections import defaultdict
+
+from utils.recomendaciones import (
+    CONSULTAS_INTERACCION, CONSULTA_QUITAR_FAVORITO, CONSULTA_TOP_PRENDA, CONSULTA_TOP_USUARIO, PESOS,
+)
+
+class _Resultado:
+    def __init__(self, filas: list):
+        self._filas = filas
+
+    async def data(self) -> list:
+        return self._filas
+
+    async def consume(self):
+        pass
+
+class GrafoEnMemoria:
+    """relaciones[usuario][prenda][tipo] = veces"""
+
+    def __init__(self):
+        self.relaciones = defaultdict(lambda: defaultdict(dict))
+        self._tipos = {consulta: tipo for tipo, consulta in CONSULTAS_INTERACCION.items()}
+
+    def ejecutar(self, consulta: str, params: dict) -> list:
+        if consulta in self._tipos:
+            for f in params["filas"]:
+                rel = self.relaciones[f["user_id"]][f["prenda_id"]]
+                rel[self._tipos[consulta]] = rel.get(self._tipos[consulta], 0) + f["veces"]
+            return []
+        if consulta == CONSULTA_QUITAR_FAVORITO:
+            for f in params["filas"]:
+                rel = self.relaciones.get(f["user_id"], {}).get(f["prenda_id"])
+                if rel:
+                    rel.pop("FAVORITO", None)
+                    if not rel:
+                        del self.relaciones[f["user_id"]][f["prenda_id"]]
+            return []
+        if consulta == CONSULTA_TOP_PRENDA:
+            return self._top(self._usuarios_por_prenda(), self._top_prenda, params)
+        if consulta == CONSULTA_TOP_USUARIO:
+            return self._top(self.relaciones, self._top_usuario, params)
+        if consulta.lstrip().startswith("CREATE CONSTRAINT"):
+            return []
+        raise ValueError(f"Consulta no soportada por el grafo en memoria: {consulta[:60]}")
+
+    def _usuarios_por_prenda(self) -> dict:
+        por_prenda = defaultdict(dict)
+        for u, prendas in self.relaciones.items():
+            for p, tipos in prendas.items():
+                por_prenda[p][u] = tipos
+        return por_prenda
+
+    def _top(self, nodos: dict, puntajes, params: dict) -> list:
+        ids = sorted(i for i in nodos if i > params["desde"])[:params["lote"]]
+        contexto = self._usuarios_por_prenda()
+        filas = []
+        for i in ids:
+            puntaje = puntajes(i, contexto)
+            top = sorted(puntaje, key=lambda q: (-puntaje[q], q))[:params["k"]]
+            filas.append({"id": i, "top": top})
+        return filas
+
+    def _top_prenda(self, p: str, por_prenda: dict) -> dict:
+        # Un término por cada par de relaciones (r1, r2), como el MATCH de Cypher
+        puntaje = defaultdict(int)
+        for u, tipos_p in por_prenda.get(p, {}).items():
+            peso_p = sum(PESOS[t] for t in tipos_p)
+            for q, tipos_q in self.relaciones[u].items():
+                if q != p:
+                    puntaje[q] += peso_p * sum(PESOS[t] for t in tipos_q)
+        return puntaje
+
+    def _top_usuario(self, u: str, por_prenda: dict) -> dict:
+        propias = self.relaciones[u]
+        puntaje = defaultdict(int)
+        for p, tipos_u in propias.items():
+            for o, tipos_o in por_prenda[p].items():
+                if o == u:
+                    continue
+                caminos = len(tipos_u) * len(tipos_o)
+                for q, tipos_q in self.relaciones[o].items():
+                    if q not in propias:
+                        puntaje[q] += caminos * sum(PESOS[t] for t in tipos_q)
+        return puntaje
+
+class _Transaccion:
+    def __init__(self, grafo: GrafoEnMemoria):
+        self._grafo = grafo
+
+    async def run(self, consulta: str, **params):
+        return _Resultado(self._grafo.ejecutar(consulta, params))
+
+class _Sesion(_Transaccion):
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        pass
+
+    async def execute_read(self, fn, *args, **kwargs):
+        return await fn(_Transaccion(self._grafo), *args, **kwargs)
+
+    execute_write = execute_read
+
+class DriverFalso:
+    def __init__(self, grafo: GrafoEnMemoria):
+        self.grafo = grafo
+
+    async def verify_connectivity(self):
+        pass
+
+    def session(self, **kwargs):
+        return _Sesion(self.grafo)
+
+    async def close(self):
+        pass
+
+def _sin_sort(metodo):
+    # pymongo >= 4.11 pasa `sort` a los builders de bulk_write y mongomock todavía no lo acepta
+    def envoltura(self, *args, sort=None, **kwargs):
+        return metodo(self, *args, **kwargs)
+    return envoltura
+
+def instalar() -> GrafoEnMemoria:
+    """Apunta db.mongo y db.neo4j a los reemplazos. Hay que llamarla antes de arrancar la app."""
+    import mongomock.collection
+    from mongomock_motor import AsyncMongoMockClient
+
+    from db import mongo, neo4j
+
+    for nombre in ("add_update", "add_replace"):
+        metodo = getattr(mongomock.collection.BulkOperationBuilder, nombre)
+        setattr(mongomock.collection.BulkOperationBuilder, nombre, _sin_sort(metodo))
+
+    cliente = AsyncMongoMockClient()
+    mongo.AsyncIOMotorClient = lambda url, **kwargs: cliente
+    grafo = GrafoEnMemoria()
+    neo4j._crear_driver = lambda: DriverFalso(grafo)
+    return grafo
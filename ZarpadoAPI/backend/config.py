@@ -1,10 +1,130 @@
+import hashlib
 import os
+import tempfile
 
 STORAGE_DIR = os.environ.get("STORAGE_DIR", "/app/storage")
 
+# Procesos que sirven la API (gunicorn.conf.py lo define antes de cargar la app). Los límites que son
+# por proceso (cuota de Gemini, hilos de imágenes) se reparten entre todos.
+WORKERS = max(1, int(os.environ.get("WEB_CONCURRENCY", 1)))
+# Archivo con el que los workers eligen cuál corre las tareas periódicas (recolector, recomendaciones).
+# Fuera de STORAGE_DIR para que no se sirva en /media, y con el hash de la carpeta para que dos
+# instancias en la misma máquina no compartan líder.
+LIDER_LOCK = os.environ.get("LIDER_LOCK", os.path.join(
+    tempfile.gettempdir(), f"zarpado_{hashlib.sha1(os.path.abspath(STORAGE_DIR).encode()).hexdigest()[:10]}.lock"
+))
+
 USER_IMG_DIR = os.path.join(STORAGE_DIR, "usuarios")
 PRENDA_IMG_DIR = os.path.join(STORAGE_DIR, "prendas")
 HISTORIAL_DIR = os.path.join(STORAGE_DIR, "historial")
 
 for d in [USER_IMG_DIR, PRENDA_IMG_DIR, HISTORIAL_DIR]:
-    os.makedirs(d, exist_ok=True)
\ No newline at end of file
+    os.makedirs(d, exist_ok=True)
+
+# Almacén direccionado por contenido: objetos/ab/cd/<sha256>.<ext>. usuarios/, prendas/ e historial/
+# quedan para los archivos anteriores a la migración (scripts/migrar_almacen.py)
+ALMACEN_DIR = os.path.join(STORAGE_DIR, "objetos")
+# Recolector de archivos huérfanos: cada cuánto barre (0 = no barrer en esta instancia), antigüedad
+# mínima para borrar algo que nadie referencia, archivos por lote y pausa entre lotes
+ALMACEN_GC_INTERVALO = int(os.environ.get("ALMACEN_GC_INTERVALO", 6 * 3600))
+ALMACEN_GC_GRACIA = int(os.environ.get("ALMACEN_GC_GRACIA", 3600))
+ALMACEN_GC_LOTE = int(os.environ.get("ALMACEN_GC_LOTE", 500))
+ALMACEN_GC_PAUSA = float(os.environ.get("ALMACEN_GC_PAUSA", 0.05))
+
+os.makedirs(ALMACEN_DIR, exist_ok=True)
+
+# Cache de resultados de probar_prenda: fuera de STORAGE_DIR para que no se sirva en /media (un
+# acierto se copia al almacén, así que nadie lo pide por URL). En el mismo disco que STORAGE_DIR
+# los resultados se enlazan en lugar de copiarse.
+CACHE_DIR = os.environ.get("CACHE_DIR", os.path.join(os.path.dirname(os.path.abspath(STORAGE_DIR)), "cache_resultados"))
+CACHE_MAX_BYTES = int(os.environ.get("CACHE_MAX_BYTES", 512 * 1024 * 1024))
+CACHE_MAX_EDAD = int(os.environ.get("CACHE_MAX_EDAD", 7 * 24 * 3600))
+CACHE_LRU_ITEMS = int(os.environ.get("CACHE_LRU_ITEMS", 256))
+
+os.makedirs(CACHE_DIR, exist_ok=True)
+
+TRY_ON_WORKERS = int(os.environ.get("TRY_ON_WORKERS", 4))
+TRY_ON_COLA_MAX = int(os.environ.get("TRY_ON_COLA_MAX", 100))
+TRY_ON_TRABAJOS_TTL = int(os.environ.get("TRY_ON_TRABAJOS_TTL", 15 * 60))
+
+IMAGEN_WORKERS = int(os.environ.get("IMAGEN_WORKERS", max(1, (os.cpu_count() or 2) // WORKERS)))
+# Hilos del threadpool de Starlette/anyio (E/S bloqueante: Gemini, disco). El default de anyio es 40.
+THREADPOOL_HILOS = int(os.environ.get("THREADPOOL_HILOS", 64))
+
+UPLOAD_MAX_BYTES = int(os.environ.get("UPLOAD_MAX_BYTES", 15 * 1024 * 1024))
+# Límites de la imagen de una prenda al cargarla al catálogo (se leen del encabezado, antes de decodificar)
+PRENDA_MIN_LADO = int(os.environ.get("PRENDA_MIN_LADO", 128))
+PRENDA_MAX_PIXELES = int(os.environ.get("PRENDA_MAX_PIXELES", 40_000_000))
+# Casi duplicados: pHash a esta distancia (bits de 64) o menos y colores con coseno de al menos esto
+DUPLICADO_MAX_HAMMING = int(os.environ.get("DUPLICADO_MAX_HAMMING", 6))
+DUPLICADO_MIN_COLOR = float(os.environ.get("DUPLICADO_MIN_COLOR", 0.9))
+# Lado mayor (px) de las imágenes que se mandan al modelo
+IMAGEN_MAX_LADO = int(os.environ.get("IMAGEN_MAX_LADO", 1536))
+IMAGEN_CALIDAD_JPEG = int(os.environ.get("IMAGEN_CALIDAD_JPEG", 90))
+# Resultado de probar_prenda: si el modelo devuelve un JPEG de hasta este lado se guarda tal cual;
+# si no, se recodifica una vez a JPEG progresivo con esta calidad
+RESULTADO_MAX_LADO = int(os.environ.get("RESULTADO_MAX_LADO", 2048))
+RESULTADO_CALIDAD_JPEG = int(os.environ.get("RESULTADO_CALIDAD_JPEG", 85))
+
+LISTADO_LIMITE_DEFAULT = int(os.environ.get("LISTADO_LIMITE_DEFAULT", 50))
+LISTADO_LIMITE_MAX = int(os.environ.get("LISTADO_LIMITE_MAX", 200))
+# Cada cuánto se recarga desde Mongo el índice de búsqueda del catálogo (cambios hechos por otros
+# workers o scripts); 0 = solo al arrancar
+BUSQUEDA_REFRESCO = int(os.environ.get("BUSQUEDA_REFRESCO", 300))
+
+# Tokens firmados (HS256). Sin JWT_SECRET se genera uno al azar: los tokens no sobreviven un reinicio
+# ni sirven entre réplicas, así que en producción hay que definirlo.
+JWT_SECRET = os.environ.get("JWT_SECRET")
+JWT_ALGORITMO = os.environ.get("JWT_ALGORITMO", "HS256")
+ACCESS_TOKEN_TTL = int(os.environ.get("ACCESS_TOKEN_TTL", 15 * 60))
+REFRESH_TOKEN_TTL = int(os.environ.get("REFRESH_TOKEN_TTL", 30 * 24 * 3600))
+# Cada cuánto se recarga desde Mongo la lista de tokens revocados (revocaciones hechas en otras réplicas)
+REVOCADOS_REFRESCO = int(os.environ.get("REVOCADOS_REFRESCO", 30))
+
+# Recomendaciones: tamaño de los top-K precalculados, cada cuánto se recalculan (0 = no recalcular
+# en esta instancia) y cache en memoria de las respuestas
+RECOMENDACIONES_K = int(os.environ.get("RECOMENDACIONES_K", 20))
+RECOMENDACIONES_INTERVALO = int(os.environ.get("RECOMENDACIONES_INTERVALO", 10 * 60))
+RECOMENDACIONES_CACHE_TTL = int(os.environ.get("RECOMENDACIONES_CACHE_TTL", 5 * 60))
+RECOMENDACIONES_CACHE_ITEMS = int(os.environ.get("RECOMENDACIONES_CACHE_ITEMS", 10000))
+# Las interacciones (pruebas, favoritos) se acumulan y se escriben en el grafo por lotes
+INTERACCIONES_LOTE = int(os.environ.get("INTERACCIONES_LOTE", 500))
+INTERACCIONES_FLUSH = float(os.environ.get("INTERACCIONES_FLUSH", 2))
+INTERACCIONES_MAX_PENDIENTES = int(os.environ.get("INTERACCIONES_MAX_PENDIENTES", 100000))
+
+# Índice de similitud visual/texto de las prendas (matriz mapeada en memoria). Como CACHE_DIR, al
+# lado de STORAGE_DIR y no adentro: todo lo que está ahí se sirve en /media
+INDICE_SIMILITUD_DIR = os.environ.get(
+    "INDICE_SIMILITUD_DIR", os.path.join(os.path.dirname(os.path.abspath(STORAGE_DIR)), "indice_similitud")
+)
+
+# Llamadas simultáneas al modelo de imagen por proceso (entre todos los requests)
+GENERACIONES_MAX = int(os.environ.get("GENERACIONES_MAX", 16))
+# Probar varias prendas en un request: máximo de prendas (no más que el historial, que guarda 5)
+# y cuántas se generan a la vez dentro del mismo request
+TRY_ON_LOTE_MAX = int(os.environ.get("TRY_ON_LOTE_MAX", 5))
+TRY_ON_LOTE_CONCURRENCIA = int(os.environ.get("TRY_ON_LOTE_CONCURRENCIA", 3))
+
+# Llamadas a Gemini: timeout de cada request HTTP, cuota por modelo (requests por minuto y ráfaga;
+# 0 = sin límite), reintentos con backoff exponencial y jitter, deadline total por carril y circuit
+# breaker (tras N fallas seguidas del proveedor se rechaza al instante durante X segundos)
+GENAI_TIMEOUT_MS = int(os.environ.get("GENAI_TIMEOUT_MS", 60 * 1000))
+GENAI_RPM_IMAGEN = float(os.environ.get("GENAI_RPM_IMAGEN", 60))
+GENAI_RAFAGA_IMAGEN = int(os.environ.get("GENAI_RAFAGA_IMAGEN", 10))
+GENAI_RPM_DESCRIPCION = float(os.environ.get("GENAI_RPM_DESCRIPCION", 300))
+GENAI_RAFAGA_DESCRIPCION = int(os.environ.get("GENAI_RAFAGA_DESCRIPCION", 20))
+GENAI_REINTENTOS = int(os.environ.get("GENAI_REINTENTOS", 3))
+GENAI_BACKOFF_BASE = float(os.environ.get("GENAI_BACKOFF_BASE", 0.5))
+GENAI_BACKOFF_MAX = float(os.environ.get("GENAI_BACKOFF_MAX", 8))
+GENAI_DEADLINE_INTERACTIVO = float(os.environ.get("GENAI_DEADLINE_INTERACTIVO", 90))
+GENAI_DEADLINE_BACKFILL = float(os.environ.get("GENAI_DEADLINE_BACKFILL", 10 * 60))
+CIRCUITO_FALLOS = int(os.environ.get("CIRCUITO_FALLOS", 5))
+CIRCUITO_ESPERA = float(os.environ.get("CIRCUITO_ESPERA", 30))
+
+# Instrumentación: header Server-Timing con las etapas de cada request y profiler por muestreo para
+# requests más lentos que PERFILADOR_UMBRAL_MS (0 = apagado). Los perfiles no van a STORAGE_DIR
+# porque todo lo que está ahí se sirve en /media.
+SERVER_TIMING = os.environ.get("SERVER_TIMING", "1") == "1"
+PERFILADOR_UMBRAL_MS = int(os.environ.get("PERFILADOR_UMBRAL_MS", 0))
+PERFILADOR_INTERVALO_MS = int(os.environ.get("PERFILADOR_INTERVALO_MS", 10))
+PERFILADOR_DIR = os.environ.get("PERFILADOR_DIR", "/tmp/zarpado_perfiles")
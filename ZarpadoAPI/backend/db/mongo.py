@@ -1,18 +1,96 @@
-from pymongo import MongoClient
+from motor.motor_asyncio import AsyncIOMotorClient
+import asyncio
 import os
+import time
 from dotenv import load_dotenv
 
+from utils.metricas import pool_mongo
+
 load_dotenv()
 
 MONGO_URL = os.environ.get("MONGO_URL", "mongodb://mongo:27017")
+MONGO_DB = os.environ.get("MONGO_DB", "zarpado_db")
+MONGO_MAX_POOL = int(os.environ.get("MONGO_MAX_POOL", 100))
+MONGO_MIN_POOL = int(os.environ.get("MONGO_MIN_POOL", 10))
+MONGO_TIMEOUT_MS = int(os.environ.get("MONGO_TIMEOUT_MS", 5000))
+# Cuánto se espera al arrancar a que Mongo responda (reintentando con backoff) antes de seguir sin él
+MONGO_ESPERA_ARRANQUE = float(os.environ.get("MONGO_ESPERA_ARRANQUE", 60))
+
+client = None
+db = None
+
+async def conectar(espera: float = MONGO_ESPERA_ARRANQUE) -> bool:
+    """Crea el cliente async y espera a que Mongo responda. Se llama desde el lifespan de la app
+    (o al inicio de un script). Si no responde en `espera` segundos se sigue igual: motor reconecta
+    solo y /salud/listo informa que no está listo."""
+    global client, db
+    print(f"🔗 Intentando conectar a MongoDB en: {MONGO_URL}")
+    client = AsyncIOMotorClient(
+        MONGO_URL,
+        maxPoolSize=MONGO_MAX_POOL,
+        minPoolSize=MONGO_MIN_POOL,
+        serverSelectionTimeoutMS=MONGO_TIMEOUT_MS,
+        event_listeners=[pool_mongo],
+    )
+    db = client[MONGO_DB]
+    limite = time.monotonic() + espera
+    pausa = 0.25
+    while True:
+        try:
+            await client.admin.command('ping')
+            print("✅ Conectado a MongoDB")
+            return True
+        except Exception as e:
+            if time.monotonic() + pausa > limite:
+                print(f"❌ Error conectando a MongoDB: {e}")
+                return False
+            print(f"⚠️ MongoDB no responde todavía, reintento en {pausa:.1f}s: {e}")
+            await asyncio.sleep(pausa)
+            pausa = min(pausa * 2, 5)
 
-print(f"🔗 Intentando conectar a MongoDB en: {MONGO_URL}")
+async def ping(timeout: float = 2) -> bool:
+    try:
+        await asyncio.wait_for(client.admin.command('ping'), timeout)
+        return True
+    except Exception:
+        return False
 
-try:
-    client = MongoClient(MONGO_URL)
-    client.admin.command('ping')
-    db = client["zarpado_db"]
-    print("✅ Conectado a MongoDB")
-except Exception as e:
-    print(f"❌ Error conectando a MongoDB: {e}")
+async def crear_indices():
+    try:
+        # (campo, _id) sirve tanto para el filtro como para el orden de la paginación por cursor
+        await db["prendas"].create_index([("tipo", 1), ("_id", 1)])
+        await db["prendas"].create_index([("marca", 1), ("_id", 1)])
+        # Popularidad para las recomendaciones sin grafo (arranque en frío o Neo4j caído)
+        await db["prendas"].create_index([("popularidad", -1), ("_id", 1)])
+        await db["prendas"].create_index([("tipo", 1), ("popularidad", -1), ("_id", 1)])
+        await db["prendas"].create_index([("marca", 1), ("popularidad", -1), ("_id", 1)])
+        await db["tokens_revocados"].create_index("expira", expireAfterSeconds=0)
+        # Espejo de los trabajos de probar_prenda cuando hay varios workers (utils/trabajos.py)
+        await db["trabajos"].create_index("expira", expireAfterSeconds=0)
+        print("✅ Índices de MongoDB listos")
+    except Exception as e:
+        print(f"❌ Error creando índices en MongoDB: {e}")
+    await crear_indice_email()
+
+async def crear_indice_email():
+    """Email único: dos registros a la vez con el mismo email no pueden pasar los dos."""
+    try:
+        indices = await db["usuarios"].index_information()
+        if "email_1" in indices and not indices["email_1"].get("unique"):
+            # El índice de antes no era único y con el mismo nombre no se puede recrear
+            await db["usuarios"].drop_index("email_1")
+        await db["usuarios"].create_index("email", unique=True)
+    except Exception as e:
+        print(f"❌ No se pudo crear el índice único de email (¿hay emails repetidos en usuarios?): {e}")
+
+def cerrar():
+    global client, db
+    if client is not None:
+        client.close()
+    client = None
     db = None
+
+def get_db():
+    if db is None:
+        raise RuntimeError("MongoDB no está inicializado, falta llamar a conectar()")
+    return db
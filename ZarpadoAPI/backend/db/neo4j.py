@@ -1,4 +1,4 @@
-from neo4j import GraphDatabase
+import asyncio
 import os
 from dotenv import load_dotenv
 
@@ -7,14 +7,73 @@ load_dotenv()
 NEO4J_URI = os.environ.get("NEO4J_URI", "bolt://localhost:7687")
 NEO4J_USER = os.environ.get("NEO4J_USER", "neo4j")
 NEO4J_PASSWORD = os.environ.get("NEO4J_PASSWORD", "password123")
+# Tope de la espera entre reintentos de conexión (backoff exponencial desde 1 s)
+NEO4J_REINTENTO_MAX = float(os.environ.get("NEO4J_REINTENTO_MAX", 60))
 
-try:
-    driver = GraphDatabase.driver(NEO4J_URI, auth=(NEO4J_USER, NEO4J_PASSWORD))
-    driver.verify_connectivity()
-    print("✅ Conectado a Neo4j")
-except Exception as e:
-    print(f"❌ Error conectando a Neo4j: {e}")
-    raise e
+driver = None
+_task = None
+
+def _crear_driver():
+    # El paquete neo4j tarda en importarse y es opcional para la app: se carga recién acá
+    from neo4j import AsyncGraphDatabase
+    return AsyncGraphDatabase.driver(NEO4J_URI, auth=(NEO4J_USER, NEO4J_PASSWORD))
+
+async def _intentar() -> bool:
+    global driver
+    nuevo = _crear_driver()
+    try:
+        await nuevo.verify_connectivity()
+        async with nuevo.session() as session:
+            await session.run("CREATE CONSTRAINT usuario_id IF NOT EXISTS FOR (u:Usuario) REQUIRE u.id IS UNIQUE")
+            await session.run("CREATE CONSTRAINT prenda_id IF NOT EXISTS FOR (p:Prenda) REQUIRE p.id IS UNIQUE")
+        driver = nuevo
+        print("✅ Conectado a Neo4j")
+        return True
+    except Exception as e:
+        await nuevo.close()
+        print(f"❌ Error conectando a Neo4j: {e}")
+        return False
+
+async def _conectar_con_reintentos():
+    espera = 1
+    while not await _intentar():
+        await asyncio.sleep(espera)
+        espera = min(espera * 2, NEO4J_REINTENTO_MAX)
+
+async def conectar():
+    """Conecta en segundo plano, reintentando con backoff hasta que Neo4j responda: el arranque no
+    lo espera. Mientras no esté, las recomendaciones usan popularidad."""
+    global _task
+    print(f"🔗 Intentando conectar a Neo4j en: {NEO4J_URI}")
+    if _task is None:
+        _task = asyncio.create_task(_conectar_con_reintentos())
+
+async def cerrar():
+    global driver, _task
+    if _task is not None:
+        _task.cancel()
+        await asyncio.gather(_task, return_exceptions=True)
+        _task = None
+    if driver is not None:
+        await driver.close()
+    driver = None
+
+def disponible() -> bool:
+    return driver is not None
 
 def get_neo4j_session():
     return driver.session()
+
+def estado_pool() -> dict:
+    """Conexiones abiertas y en uso del pool del driver. No hay API pública para esto: se lee el pool
+    interno y si cambia en otra versión del driver se informa vacío."""
+    if driver is None:
+        return {}
+    try:
+        conexiones = driver._pool.connections
+        return {
+            "abiertas": sum(len(c) for c in conexiones.values()),
+            "en_uso": sum(driver._pool.in_use_connection_count(a) for a in list(conexiones)),
+        }
+    except AttributeError:
+        return {}
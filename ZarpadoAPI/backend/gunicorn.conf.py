@@ -0,0 +1,26 @@
+"""Configuración de gunicorn para producción: `gunicorn -c gunicorn.conf.py main:app`.
+
+Cada worker es un proceso con su propio event loop (UvicornWorker) y corre el lifespan de la app:
+abre sus conexiones a Mongo, Neo4j y el modelo, y las cierra al apagarse.
+"""
+import multiprocessing
+import os
+
+workers = int(os.environ.get("WEB_CONCURRENCY", multiprocessing.cpu_count()))
+# config.py lo lee al importarse: reparte entre workers la cuota de Gemini y los hilos de imágenes
+os.environ["WEB_CONCURRENCY"] = str(workers)
+
+worker_class = "uvicorn_worker.UvicornWorker"
+bind = os.environ.get("BIND", "0.0.0.0:8000")
+
+# La app se importa una sola vez en el master y los workers la heredan al hacer fork: arrancan
+# más rápido y comparten las páginas de los módulos. Las conexiones se abren después, en el lifespan.
+preload_app = True
+
+# Una generación con Gemini puede tardar bastante: el timeout solo mata workers con el loop trabado
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", 120))
+# Al apagar, tiempo para terminar los requests y trabajos en curso antes de matar al worker
+graceful_timeout = int(os.environ.get("GUNICORN_GRACEFUL_TIMEOUT", 30))
+keepalive = int(os.environ.get("GUNICORN_KEEPALIVE", 5))
+
+accesslog = os.environ.get("GUNICORN_ACCESSLOG") or None
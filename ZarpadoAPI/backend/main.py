@@ -1,14 +1,67 @@
+import asyncio
 import os
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
-from fastapi.staticfiles import StaticFiles
 
-from routers import users, prendas, imagen
-from config import STORAGE_DIR
+import anyio.to_thread
 
-app = FastAPI()
+from routers import auth, users, prendas, imagen, recomendacion, metricas, salud
+from config import STORAGE_DIR, THREADPOOL_HILOS
+from db import mongo, neo4j
+from utils import gemini
+from utils.media import MediaStaticFiles
+from utils.metricas import MiddlewareMetricas, perfilador
+from utils.almacen import recolector
+from utils.auth import lista_revocacion
+from utils.busqueda import indice_catalogo
+from utils.ejecutores import iniciar_pool_imagenes, cerrar_pool_imagenes
+from utils.lider import lider
+from utils.recomendaciones import recomendaciones
+from utils.trabajos import cola_trabajos
 
-app.mount("/media", StaticFiles(directory=STORAGE_DIR), name="media")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Todo lo que abre conexiones, hilos o tasks se crea acá y no al importar: con gunicorn --preload
+    # la app se importa una vez en el proceso principal y cada worker arranca lo suyo después del fork
+    gemini.verificar_configuracion()
+    anyio.to_thread.current_default_thread_limiter().total_tokens = THREADPOOL_HILOS
+    # El SDK de Gemini se importa en un hilo mientras sigue el arranque
+    cliente_modelo = asyncio.create_task(anyio.to_thread.run_sync(gemini.cliente))
+    await mongo.conectar()
+    await mongo.crear_indices()
+    await lista_revocacion.iniciar()
+    await indice_catalogo.iniciar()
+    await neo4j.conectar()
+    await recomendaciones.iniciar()
+    iniciar_pool_imagenes()
+    await cola_trabajos.iniciar()
+    await recolector.iniciar()
+    perfilador.iniciar()
+    salud.estado["iniciado"] = True
+    yield
+    salud.estado["cerrando"] = True
+    perfilador.detener()
+    await recolector.detener()
+    await cola_trabajos.detener()
+    cerrar_pool_imagenes()
+    await lista_revocacion.detener()
+    await indice_catalogo.detener()
+    await recomendaciones.detener()
+    await neo4j.cerrar()
+    await asyncio.gather(cliente_modelo, return_exceptions=True)
+    gemini.cerrar()
+    lider.soltar()
+    mongo.cerrar()
 
+app = FastAPI(lifespan=lifespan)
+app.add_middleware(MiddlewareMetricas)
+
+app.mount("/media", MediaStaticFiles(directory=STORAGE_DIR), name="media")
+
+app.include_router(auth.router,    prefix="/api", tags=["auth"])
 app.include_router(users.router,   prefix="/api", tags=["usuarios"])
 app.include_router(prendas.router, prefix="/api", tags=["prendas"])
-app.include_router(imagen.router,  prefix="/api", tags=["imagen"])
\ No newline at end of file
+app.include_router(imagen.router,  prefix="/api", tags=["imagen"])
+app.include_router(recomendacion.router, prefix="/api", tags=["recomendaciones"])
+app.include_router(metricas.router)
+app.include_router(salud.router)
\ No newline at end of file
@@ -0,0 +1,18 @@
+from pydantic import BaseModel, EmailStr
+from typing import Optional
+
+class LoginIn(BaseModel):
+    email: EmailStr
+    password: str
+
+class RefreshIn(BaseModel):
+    refresh_token: str
+
+class LogoutIn(BaseModel):
+    refresh_token: Optional[str] = None
+
+class TokensOut(BaseModel):
+    access_token: str
+    refresh_token: str
+    token_type: str = "bearer"
+    expires_in: int
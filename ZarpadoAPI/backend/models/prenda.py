@@ -1,4 +1,4 @@
-from typing import Optional
+from typing import Dict, List, Optional
 from pydantic import BaseModel
 
 class PrendaCreate(BaseModel):
@@ -14,3 +14,32 @@ class PrendaOut(BaseModel):
     descripcion: str
     marca: str
     image_path: Optional[str] = None
+    descripcion_ia: Optional[str] = None
+    variantes: Optional[Dict[str, Dict[str, str]]] = None
+
+class PrendaDuplicada(BaseModel):
+    id: str
+    distancia: int
+
+class PrendaCargada(PrendaOut):
+    # Prendas con una imagen casi igual a la que se cargó (ver si_duplicada)
+    duplicados: List[PrendaDuplicada] = []
+
+class PrendaResumen(BaseModel):
+    id: str
+    nombre: str
+    tipo: str
+    marca: str
+    image_path: Optional[str] = None
+    variantes: Optional[Dict[str, Dict[str, str]]] = None
+
+class PrendaSimilar(PrendaResumen):
+    similitud: float
+
+class PrendaEncontrada(PrendaResumen):
+    puntaje: float
+
+class BusquedaPrendas(BaseModel):
+    total: int
+    resultados: List[PrendaEncontrada]
+    facetas: Dict[str, Dict[str, int]]
@@ -0,0 +1,6 @@
+from pydantic import BaseModel
+from models.prenda import PrendaResumen
+
+class RecomendacionesOut(BaseModel):
+    fuente: str  # "grafo", "popularidad" o "mixta"
+    prendas: list[PrendaResumen]
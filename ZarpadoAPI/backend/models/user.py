@@ -1,11 +1,12 @@
-from typing import List, Optional
+from typing import Dict, List, Literal, Optional
 from pydantic import BaseModel, EmailStr
 
 class UserCreate(BaseModel):
     username: str
     email: EmailStr
     password: str
-    rol: str  # "final" o "admin"
+    # El registro público solo crea usuarios finales; los admin se promueven con scripts.promover_admin
+    rol: Literal["final"] = "final"
 
 class UserOut(BaseModel):
     id: str
@@ -13,5 +14,14 @@ class UserOut(BaseModel):
     email: EmailStr
     rol: str
     profile_image_path: Optional[str]
+    profile_variantes: Optional[Dict[str, Dict[str, str]]] = None
     historial: List[str] = []
     favoritos: List[str] = []
+
+class UserResumen(BaseModel):
+    id: str
+    username: str
+    email: EmailStr
+    rol: str
+    profile_image_path: Optional[str] = None
+    profile_variantes: Optional[Dict[str, Dict[str, str]]] = None
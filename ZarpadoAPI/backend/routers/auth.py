@@ -0,0 +1,54 @@
+from fastapi import APIRouter, HTTPException, Depends
+from fastapi.concurrency import run_in_threadpool
+from bson.objectid import ObjectId
+from db.mongo import get_db
+from models.auth import LoginIn, RefreshIn, LogoutIn, TokensOut
+from utils.metricas import span
+from utils.auth import (
+    decodificar_token, emitir_tokens, es_hash, get_current_user, hashear_password,
+    lista_revocacion, verificar_password,
+)
+
+router = APIRouter()
+
+@router.post("/auth/login", response_model=TokensOut)
+async def login(datos: LoginIn):
+    with span("mongo_usuario"):
+        usuario = await get_db()["usuarios"].find_one({"email": datos.email}, {"password": 1, "rol": 1})
+    # scrypt es CPU puro: fuera del event loop
+    with span("password"):
+        valido = usuario and await run_in_threadpool(verificar_password, datos.password, usuario.get("password"))
+    if not valido:
+        raise HTTPException(status_code=401, detail="Email o contraseña incorrectos")
+    if not es_hash(usuario["password"]):
+        nuevo = await run_in_threadpool(hashear_password, datos.password)
+        await get_db()["usuarios"].update_one({"_id": usuario["_id"]}, {"$set": {"password": nuevo}})
+    return emitir_tokens(str(usuario["_id"]), usuario["rol"])
+
+@router.post("/auth/refresh", response_model=TokensOut)
+async def refrescar(datos: RefreshIn):
+    payload = decodificar_token(datos.refresh_token, "refresh")
+    # Cada refresh token se usa una sola vez; si llega dos veces, el segundo pedido falla
+    if not await lista_revocacion.consumir(payload["jti"], payload["exp"]):
+        raise HTTPException(status_code=401, detail="Token revocado")
+    # Única consulta a la base: el rol pudo cambiar o el usuario pudo haberse borrado
+    usuario = await get_db()["usuarios"].find_one({"_id": ObjectId(payload["sub"])}, {"rol": 1})
+    if not usuario:
+        raise HTTPException(status_code=401, detail="Usuario inválido")
+    return emitir_tokens(payload["sub"], usuario["rol"])
+
+@router.post("/auth/logout")
+async def logout(datos: LogoutIn = None, user=Depends(get_current_user)):
+    await lista_revocacion.revocar(user["jti"], user["exp"])
+    if datos and datos.refresh_token:
+        try:
+            payload = decodificar_token(datos.refresh_token, "refresh")
+        except HTTPException:
+            payload = None
+        if payload and payload["sub"] == user["id"]:
+            await lista_revocacion.revocar(payload["jti"], payload["exp"])
+    return {"msg": "Sesión cerrada"}
+
+@router.get("/auth/yo")
+async def yo(user=Depends(get_current_user)):
+    return {"id": user["id"], "rol": user["rol"]}
@@ -1,85 +1,71 @@
-import os
-import uuid
-from io import BytesIO
+import json
+import asyncio
 
-from fastapi import APIRouter, UploadFile, File, Form, HTTPException
-from PIL import Image
+from fastapi import APIRouter, BackgroundTasks, UploadFile, File, Form, HTTPException, Request, Response
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import FileResponse, StreamingResponse
 from bson.objectid import ObjectId
-from google import genai
-from google.genai import types
+from pymongo import ReturnDocument
 
-from db.mongo import db
-from config import HISTORIAL_DIR
-
-from dotenv import load_dotenv
-load_dotenv()
+from db.mongo import get_db
+from config import GENERACIONES_MAX, TRY_ON_LOTE_MAX, TRY_ON_LOTE_CONCURRENCIA
+from utils.almacen import almacen, liberar
+from utils.cache_resultados import cache_resultados, clave_resultado
+from utils.ejecutores import en_pool_imagenes
+from utils.metricas import span
+from utils.imagenes import ImagenNormalizada, codificar_resultado, leer_upload, normalizar_imagen, normalizar_archivo
+from utils.gemini import descripcion_prenda, generar_contenido, parte_imagen, planificador, MODELO_IMAGEN
+from utils.recomendaciones import recomendaciones
+from utils.variantes import enlazar_variantes, generar_variantes_seguro, url_media
+from utils.trabajos import cola_trabajos, ColaLlena, ESTADOS_FINALES
 
 router = APIRouter()
 
-GENAI_API_KEY = os.environ.get("GOOGLE_API_KEY")
-if not GENAI_API_KEY:
-    raise RuntimeError("No se encontró GOOGLE_API_KEY en el entorno.")
-
-client = genai.Client(api_key=GENAI_API_KEY)
-
-def get_mime_type_bytes(data: bytes) -> str:
-    header = data[:12]
-    if header.startswith(b"\xff\xd8"):
-        return "image/jpeg"
-    if header.startswith(b"\x89PNG"):
-        return "image/png"
-    if header[:4] == b"RIFF" and header[8:12] == b"WEBP":
-        return "image/webp"
-    return "application/octet-stream"
-
-def convert_pil_to_jpeg_bytes(img: Image.Image) -> bytes:
-    buf = BytesIO()
-    img.convert("RGB").save(buf, format="JPEG")
-    return buf.getvalue()
-
-def descripcion_prenda(imagen_prenda: Image.Image) -> str:
-    response = client.models.generate_content(
-        model="gemini-2.0-flash",
-        contents=[
-            "SOLO DAME LA DESCRIPCION EL TIPO DE PRENDA Y CARACTERISTICAS SOBRE SALIENTES, "
-            "Ejemplo de salida (Anorak: Ligero, de nailon, con cremallera corta, capucha con cordón y detalles en bloques de color (azul y negro) en los hombros y las mangas. Logotipo KINGOFTHEKONGO, ADIDAS, etc.). "
-            "LA SALIDA ESPERADA TIENE QUE SER EN INGLÉS",
-            imagen_prenda
-        ],
-        config=types.GenerateContentConfig(response_modalities=['Text'])
-    )
-    return response.candidates[0].content.parts[0].text
+# Subir la versión cada vez que cambie el prompt para no servir resultados viejos de la cache
+VERSION_PROMPT = "v1"
+HISTORIAL_MAX = 5
 
-@router.post("/probar_prenda")
-async def probar_prenda(
-    user_id: str = Form(...),
-    file_prenda: UploadFile = File(...),
-    file_usuario: UploadFile = File(...)
-):
-    contenido_prenda = await file_prenda.read()
-    contenido_usuario = await file_usuario.read()
+# Tope de llamadas simultáneas al modelo de imagen entre todos los requests de este proceso
+generaciones_globales = asyncio.Semaphore(GENERACIONES_MAX)
 
-    mime_prenda = get_mime_type_bytes(contenido_prenda)
+def decodificar_imagen(contenido: bytes, error: str) -> ImagenNormalizada:
     try:
-        if mime_prenda != "image/jpeg":
-            tmp = Image.open(BytesIO(contenido_prenda)).convert("RGB")
-            contenido_prenda = convert_pil_to_jpeg_bytes(tmp)
-        img_prenda = Image.open(BytesIO(contenido_prenda))
+        return normalizar_imagen(contenido)
     except Exception:
-        raise HTTPException(status_code=400, detail="La imagen de la prenda no es válida")
+        raise HTTPException(status_code=400, detail=error)
 
-    mime_usuario = get_mime_type_bytes(contenido_usuario)
+def decodificar_archivo(path: str) -> ImagenNormalizada:
     try:
-        if mime_usuario != "image/jpeg":
-            tmp2 = Image.open(BytesIO(contenido_usuario)).convert("RGB")
-            contenido_usuario = convert_pil_to_jpeg_bytes(tmp2)
-        img_usuario = Image.open(BytesIO(contenido_usuario))
+        return normalizar_archivo(path)
+    except OSError:
+        raise HTTPException(status_code=404, detail="Imagen de la prenda no encontrada")
     except Exception:
-        raise HTTPException(status_code=400, detail="La imagen del usuario no es válida")
+        raise HTTPException(status_code=400, detail="La imagen de la prenda no es válida")
 
-    prenda = descripcion_prenda(img_prenda)
+def validar_user_id(user_id: str):
+    # Antes de leer uploads o generar nada: ObjectId() con un id mal formado sería un 500
+    if not ObjectId.is_valid(user_id):
+        raise HTTPException(status_code=400, detail="user_id inválido")
 
-    prompt = (f"""Replace the {prenda} worn by the subject in Image 2 with the exact {prenda} from Image 1, ensuring a realistic and seamless integration. The face and background of Image 2 MUST remain completely unaltered.
+async def cargar_prenda_catalogo(prenda_id: str):
+    if not ObjectId.is_valid(prenda_id):
+        raise HTTPException(status_code=400, detail="prenda_id inválido")
+    prenda_doc = await get_db()["prendas"].find_one({"_id": ObjectId(prenda_id)}, {"image_path": 1, "descripcion_ia": 1})
+    if not prenda_doc or not prenda_doc.get("image_path"):
+        raise HTTPException(status_code=404, detail="Prenda no encontrada")
+    return prenda_doc.get("descripcion_ia"), prenda_doc["image_path"]
+
+async def describir_y_guardar(prenda_norm: ImagenNormalizada, prenda_id: str, image_path: str) -> str:
+    prenda = await descripcion_prenda(parte_imagen(prenda_norm), clave=prenda_norm.sha256)
+    if prenda_id:
+        await get_db()["prendas"].update_one(
+            {"_id": ObjectId(prenda_id), "image_path": image_path},
+            {"$set": {"descripcion_ia": prenda}}
+        )
+    return prenda
+
+def construir_prompt(prenda: str) -> str:
+    return (f"""Replace the {prenda} worn by the subject in Image 2 with the exact {prenda} from Image 1, ensuring a realistic and seamless integration. The face and background of Image 2 MUST remain completely unaltered.
 
 I. Prenda Extraction and Preservation (Image1):
 
@@ -113,51 +99,376 @@ f"La salida esperada es la image2 con la nueva prenda {prenda} integrada de form
 f"The expected output is the image2 with the new {prenda} integrated realistically and naturally, keeping the face and background unchanged. The result should be an image that looks authentic and professional, as if the {prenda} had always been in the original image."
 )
 
-    response = client.models.generate_content(
-        model="gemini-2.0-flash-exp-image-generation",
-        contents=[
+async def generar_imagen(prompt: str, prenda: ImagenNormalizada, usuario: ImagenNormalizada, clave: str = None) -> bytes:
+    """Los bytes de la imagen que devolvió el modelo, sin decodificar. Con `clave` (la de la cache
+    de resultados) dos pedidos iguales en vuelo comparten la respuesta."""
+    response = await generar_contenido(
+        MODELO_IMAGEN,
+        [
             prompt,
-            img_prenda,    
-            img_usuario    
+            parte_imagen(prenda),
+            parte_imagen(usuario)
         ],
-        config=types.GenerateContentConfig(response_modalities=['Text', 'Image'])
+        ['Text', 'Image'],
+        clave=clave,
     )
 
-    img_result = None
     for part in response.candidates[0].content.parts:
         if hasattr(part, "inline_data") and part.inline_data:
-            img_result = Image.open(BytesIO(part.inline_data.data))
-            break
+            return part.inline_data.data
 
-    if img_result is None:
-        raise HTTPException(status_code=500, detail="Gemini no devolvió imagen resultante")
-
-    filename_result = f"{user_id}_result_{uuid.uuid4().hex}.jpg"
-    path_result = os.path.join(HISTORIAL_DIR, filename_result)
+    raise HTTPException(status_code=500, detail="Gemini no devolvió imagen resultante")
 
+def guardar_resultado(datos: bytes) -> tuple:
+    """Recodifica solo si hace falta (ver codificar_resultado) y guarda en el almacén. Corre en el
+    pool de imágenes: ni la codificación ni la escritura pasan por el event loop.
+    Devuelve (path, bytes del JPEG guardado)."""
+    try:
+        jpeg = codificar_resultado(datos)
+    except Exception:
+        raise HTTPException(status_code=500, detail="Gemini devolvió una imagen inválida")
     try:
-        img_result.save(path_result, "JPEG")
+        return almacen.guardar_bytes(jpeg, "jpg"), jpeg
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"No se pudo guardar la imagen: {e}")
 
-    usuario = db["usuarios"].find_one({"_id": ObjectId(user_id)})
-    if not usuario:
-        raise HTTPException(status_code=404, detail="Usuario no encontrado")
+def copiar_resultado_cacheado(path_cache: str):
+    # Mismo contenido, mismo objeto del almacén: si el resultado sigue ahí no se copia nada
+    try:
+        path_result = almacen.importar_archivo(path_cache, "jpg")
+        variantes = enlazar_variantes(path_cache, path_result)
+    except FileNotFoundError:
+        # Otro worker lo evictó entre medio: se genera de nuevo
+        return None
+    except OSError as e:
+        raise HTTPException(status_code=500, detail=f"No se pudo guardar la imagen: {e}")
+    return path_result, variantes
 
-    historial = usuario.get("historial", [])
-    if len(historial) >= 5:
-        antiguo = historial.pop(0)
-        if os.path.exists(antiguo):
-            os.remove(antiguo)
+async def registrar_historial(user_id: str, *paths_result: str) -> list:
+    """Agrega los resultados al historial en una sola operación atómica y devuelve el historial nuevo.
 
-    historial.append(path_result)
-    db["usuarios"].update_one(
+    `$push` + `$slice` mantiene los últimos HISTORIAL_MAX; el documento previo que devuelve
+    find-and-modify dice qué rutas quedaron afuera para borrarlas del disco."""
+    anterior = await get_db()["usuarios"].find_one_and_update(
         {"_id": ObjectId(user_id)},
-        {"$set": {"historial": historial}}
+        {"$push": {"historial": {"$each": list(paths_result), "$slice": -HISTORIAL_MAX}}},
+        projection={"historial": 1},
+        return_document=ReturnDocument.BEFORE,
     )
+    if not anterior:
+        raise HTTPException(status_code=404, detail="Usuario no encontrado")
+
+    completo = anterior.get("historial", []) + list(paths_result)
+    historial = completo[-HISTORIAL_MAX:]
+    liberar(*completo[:-HISTORIAL_MAX])
+    return historial
 
-    url_result = f"/media/historial/{filename_result}"
+def respuesta_probar_prenda(path_result: str, historial: list, variantes: dict) -> dict:
     return {
-        "img_generada": url_result,
-        "historial": [f"/media/historial/{os.path.basename(p)}" for p in historial]
+        "img_generada": url_media(path_result),
+        "variantes": variantes,
+        "historial": [url_media(p) for p in historial]
     }
+
+async def generar_para_prenda(usuario_norm: ImagenNormalizada, contenido_prenda, prenda_id: str = None, avisar=None):
+    """Genera (o toma de la cache) el resultado de una prenda sobre la foto ya normalizada del usuario.
+    No toca el historial. Devuelve (path, variantes, bytes del JPEG o None si salió de la cache)."""
+    avisar = avisar or (lambda etapa, porcentaje: None)
+    descripcion_guardada = None
+    image_path_prenda = None
+    if prenda_id:
+        with span("mongo_prenda"):
+            descripcion_guardada, image_path_prenda = await cargar_prenda_catalogo(prenda_id)
+        with span("decodificar"):
+            prenda_norm = await en_pool_imagenes(decodificar_archivo, image_path_prenda)
+    else:
+        prenda_norm = await decodificar_prenda(contenido_prenda)
+    del contenido_prenda
+
+    clave = clave_resultado(prenda_norm.sha256, usuario_norm.sha256, MODELO_IMAGEN, VERSION_PROMPT)
+    path_cache = cache_resultados.obtener(clave)
+    if path_cache:
+        with span("cache"):
+            copiado = await run_in_threadpool(copiar_resultado_cacheado, path_cache)
+        if copiado:
+            return (*copiado, None)
+
+    if descripcion_guardada:
+        prenda = descripcion_guardada
+    else:
+        avisar("describiendo", 25)
+        with span("descripcion"):
+            prenda = await describir_y_guardar(prenda_norm, prenda_id, image_path_prenda)
+
+    avisar("generando", 40)
+    with span("generacion"):
+        async with generaciones_globales:
+            datos = await generar_imagen(construir_prompt(prenda), prenda_norm, usuario_norm, clave=clave)
+
+    avisar("guardando", 80)
+    with span("guardar"):
+        path_result, jpeg = await en_pool_imagenes(guardar_resultado, datos)
+    del datos
+    with span("variantes"):
+        # Desde los bytes en memoria: no se vuelve a leer el archivo recién escrito
+        variantes = await en_pool_imagenes(generar_variantes_seguro, path_result, jpeg)
+    with span("cache"):
+        await run_in_threadpool(cache_resultados.guardar, clave, path_result)
+    return path_result, variantes, jpeg
+
+async def decodificar_usuario(contenido_usuario) -> ImagenNormalizada:
+    # Los trabajos en cola ya llegan normalizados
+    if isinstance(contenido_usuario, ImagenNormalizada):
+        return contenido_usuario
+    with span("decodificar"):
+        return await en_pool_imagenes(decodificar_imagen, contenido_usuario, "La imagen del usuario no es válida")
+
+async def decodificar_prenda(contenido_prenda) -> ImagenNormalizada:
+    if isinstance(contenido_prenda, ImagenNormalizada):
+        return contenido_prenda
+    with span("decodificar"):
+        return await en_pool_imagenes(decodificar_imagen, contenido_prenda, "La imagen de la prenda no es válida")
+
+async def ejecutar_probar_prenda(user_id: str, contenido_prenda, contenido_usuario, prenda_id: str = None, progreso=None) -> dict:
+    """Pipeline completo de probar_prenda sin bloquear el event loop: PIL corre en el pool de
+    imágenes, Gemini y el disco en el threadpool y Mongo con el driver async. Las imágenes pueden
+    venir como bytes del upload o ya normalizadas. `progreso(etapa, porcentaje)` es opcional."""
+    def avisar(etapa: str, porcentaje: int):
+        if progreso:
+            progreso(etapa, porcentaje)
+
+    avisar("decodificando", 10)
+    usuario_norm = await decodificar_usuario(contenido_usuario)
+    # Los bytes originales ya no hacen falta: que no sigan vivos durante la llamada al modelo
+    del contenido_usuario
+
+    path_result, variantes, _ = await generar_para_prenda(usuario_norm, contenido_prenda, prenda_id, avisar)
+
+    avisar("historial", 90)
+    with span("historial"):
+        historial = await registrar_historial(user_id, path_result)
+    if prenda_id:
+        recomendaciones.registrar(user_id, prenda_id, "PROBO")
+    return respuesta_probar_prenda(path_result, historial, variantes)
+
+async def registrar_en_segundo_plano(user_id: str, path_result: str, prenda_id: str = None):
+    try:
+        with span("historial"):
+            await registrar_historial(user_id, path_result)
+    except Exception as e:
+        print(f"❌ No se pudo registrar el historial de {user_id}: {e}")
+    if prenda_id:
+        recomendaciones.registrar(user_id, prenda_id, "PROBO")
+
+async def responder_imagen(user_id: str, contenido_prenda, contenido_usuario: bytes, prenda_id: str,
+                           background_tasks: BackgroundTasks) -> Response:
+    """probar_prenda respondiendo el JPEG en el cuerpo: el cliente no necesita un segundo request a
+    /media. El historial se actualiza después de mandar la respuesta."""
+    # El usuario se valida antes de gastar una generación, ya que el historial va después
+    if not await get_db()["usuarios"].find_one({"_id": ObjectId(user_id)}, {"_id": 1}):
+        raise HTTPException(status_code=404, detail="Usuario no encontrado")
+    usuario_norm = await decodificar_usuario(contenido_usuario)
+    del contenido_usuario
+    path_result, _, jpeg = await generar_para_prenda(usuario_norm, contenido_prenda, prenda_id)
+    background_tasks.add_task(registrar_en_segundo_plano, user_id, path_result, prenda_id)
+    headers = {"X-Img-Generada": url_media(path_result)}
+    if jpeg is None:
+        # De la cache: se manda el archivo por bloques, sin cargarlo entero en memoria
+        return FileResponse(path_result, media_type="image/jpeg", headers=headers)
+    return Response(jpeg, media_type="image/jpeg", headers=headers)
+
+async def leer_prenda_form(file_prenda: UploadFile, prenda_id: str):
+    if prenda_id:
+        return None
+    if not file_prenda:
+        raise HTTPException(status_code=400, detail="Falta file_prenda o prenda_id")
+    return await leer_upload(file_prenda)
+
+@router.get("/probar_prenda/planificador")
+def estadisticas_planificador():
+    return planificador.estadisticas()
+
+@router.get("/probar_prenda/cache")
+def estadisticas_cache():
+    return cache_resultados.estadisticas()
+
+@router.post("/probar_prenda")
+async def probar_prenda(
+    background_tasks: BackgroundTasks,
+    user_id: str = Form(...),
+    file_prenda: UploadFile = File(None),
+    file_usuario: UploadFile = File(...),
+    prenda_id: str = Form(None),
+    respuesta: str = Form("json", pattern="^(json|imagen)$")
+):
+    validar_user_id(user_id)
+    with span("leer_upload"):
+        contenido_prenda = await leer_prenda_form(file_prenda, prenda_id)
+        contenido_usuario = await leer_upload(file_usuario)
+    if respuesta == "imagen":
+        return await responder_imagen(user_id, contenido_prenda, contenido_usuario, prenda_id, background_tasks)
+    return await ejecutar_probar_prenda(user_id, contenido_prenda, contenido_usuario, prenda_id)
+
+async def _probar_item(user_id: str, usuario_norm: ImagenNormalizada, indice: int, item: dict, limite: asyncio.Semaphore) -> dict:
+    """Un elemento del lote. Los errores se devuelven en el resultado para no cortar el resto."""
+    if "error" in item:
+        # Ya se sabe que falla (id inválido o fuera del catálogo): no ocupa un lugar del lote
+        codigo, detalle = item["error"]
+        return {"indice": indice, **item["ref"], "ok": False, "codigo": codigo, "error": detalle}
+    async with limite:
+        try:
+            path_result, variantes, _ = await generar_para_prenda(
+                usuario_norm, item.get("contenido"), item.get("prenda_id")
+            )
+        except HTTPException as e:
+            return {"indice": indice, **item["ref"], "ok": False, "codigo": e.status_code, "error": e.detail}
+        except Exception as e:
+            print(f"❌ Error en probar_prenda/lote, elemento {indice}: {e}")
+            return {"indice": indice, **item["ref"], "ok": False, "codigo": 500, "error": "Error generando la imagen"}
+    return {
+        "indice": indice, **item["ref"], "ok": True,
+        "img_generada": url_media(path_result), "variantes": variantes, "path": path_result,
+    }
+
+_historiales_pendientes = set()
+
+async def marcar_prendas_invalidas(items: list):
+    """Marca con su error los ids mal formados (400) y los que no están en el catálogo (404), con
+    una sola consulta, antes de programar ninguna generación."""
+    ids = {i["prenda_id"] for i in items if i.get("prenda_id") and ObjectId.is_valid(i["prenda_id"])}
+    existentes = set()
+    if ids:
+        docs = get_db()["prendas"].find({"_id": {"$in": [ObjectId(i) for i in ids]}, "image_path": {"$ne": None}}, {"_id": 1})
+        existentes = {str(d["_id"]) async for d in docs}
+    for item in items:
+        if "prenda_id" not in item:
+            continue
+        if not ObjectId.is_valid(item["prenda_id"]):
+            item["error"] = (400, "prenda_id inválido")
+            continue
+        # La referencia de la respuesta queda como la mandó el cliente
+        item["prenda_id"] = str(ObjectId(item["prenda_id"]))
+        if item["prenda_id"] not in existentes:
+            item["error"] = (404, "Prenda no encontrada")
+
+@router.post("/probar_prenda/lote")
+async def probar_prenda_lote(
+    user_id: str = Form(...),
+    file_usuario: UploadFile = File(...),
+    files_prenda: list[UploadFile] = File(None),
+    prenda_ids: list[str] = Form(None)
+):
+    """Varias prendas sobre la misma foto. Responde NDJSON: una línea por prenda apenas termina
+    (en cualquier orden, con su `indice`) y una última línea con el historial actualizado."""
+    validar_user_id(user_id)
+    # Se cuenta antes de leer: un lote demasiado grande no llega a cargarse en memoria
+    cantidad = len(files_prenda or []) + len(prenda_ids or [])
+    if not cantidad:
+        raise HTTPException(status_code=400, detail="Falta files_prenda o prenda_ids")
+    if cantidad > TRY_ON_LOTE_MAX:
+        raise HTTPException(status_code=400, detail=f"Como máximo {TRY_ON_LOTE_MAX} prendas por lote")
+    if not await get_db()["usuarios"].find_one({"_id": ObjectId(user_id)}, {"_id": 1}):
+        raise HTTPException(status_code=404, detail="Usuario no encontrado")
+    items = [{"prenda_id": pid, "ref": {"prenda_id": pid}} for pid in prenda_ids or []]
+    for f in files_prenda or []:
+        items.append({"contenido": await leer_upload(f), "ref": {"archivo": f.filename}})
+    await marcar_prendas_invalidas(items)
+
+    # La foto del usuario se decodifica y normaliza una sola vez para todo el lote
+    with span("leer_upload"):
+        contenido_usuario = await leer_upload(file_usuario)
+    usuario_norm = await decodificar_usuario(contenido_usuario)
+    del contenido_usuario
+
+    async def stream():
+        limite = asyncio.Semaphore(TRY_ON_LOTE_CONCURRENCIA)
+        tareas = [asyncio.create_task(_probar_item(user_id, usuario_norm, i, item, limite)) for i, item in enumerate(items)]
+        generados = []
+        registrado = False
+        try:
+            for terminada in asyncio.as_completed(tareas):
+                resultado = await terminada
+                path = resultado.pop("path", None)
+                if path:
+                    generados.append((resultado["indice"], path))
+                    if items[resultado["indice"]].get("prenda_id"):
+                        recomendaciones.registrar(user_id, items[resultado["indice"]]["prenda_id"], "PROBO")
+                yield json.dumps(resultado) + "\n"
+
+            # Un solo update para todo el lote, en el orden en que se pidieron las prendas
+            paths = [p for _, p in sorted(generados)]
+            fin = {"fin": True, "ok": len(paths), "errores": len(items) - len(paths), "historial": None}
+            if paths:
+                registrado = True
+                try:
+                    fin["historial"] = [url_media(p) for p in await registrar_historial(user_id, *paths)]
+                except HTTPException as e:
+                    fin["error"] = e.detail
+            yield json.dumps(fin) + "\n"
+        finally:
+            for t in tareas:
+                t.cancel()
+            if not registrado and generados:
+                # El cliente se desconectó: lo ya generado igual queda en su historial
+                tarea = asyncio.create_task(registrar_historial(user_id, *[p for _, p in sorted(generados)]))
+                _historiales_pendientes.add(tarea)
+                tarea.add_done_callback(_historiales_pendientes.discard)
+
+    return StreamingResponse(stream(), media_type="application/x-ndjson", headers={"Cache-Control": "no-cache"})
+
+@router.post("/probar_prenda/trabajos", status_code=202)
+async def encolar_probar_prenda(
+    user_id: str = Form(...),
+    file_prenda: UploadFile = File(None),
+    file_usuario: UploadFile = File(...),
+    prenda_id: str = Form(None)
+):
+    validar_user_id(user_id)
+    if cola_trabajos.llena():
+        raise HTTPException(status_code=503, detail="Demasiados trabajos en cola, probá de nuevo en unos segundos")
+    contenido_prenda = await leer_prenda_form(file_prenda, prenda_id)
+    contenido_usuario = await leer_upload(file_usuario)
+    # A la cola van las imágenes normalizadas (JPEG de hasta IMAGEN_MAX_LADO px), no los uploads
+    # crudos: si no, cada trabajo en espera retiene hasta 2 × UPLOAD_MAX_BYTES
+    usuario_norm = await decodificar_usuario(contenido_usuario)
+    del contenido_usuario
+    prenda_norm = await decodificar_prenda(contenido_prenda) if contenido_prenda is not None else None
+    del contenido_prenda
+    try:
+        trabajo = cola_trabajos.encolar(ejecutar_probar_prenda, user_id, prenda_norm, usuario_norm, prenda_id)
+    except ColaLlena:
+        raise HTTPException(status_code=503, detail="Demasiados trabajos en cola, probá de nuevo en unos segundos")
+    return {
+        "trabajo_id": trabajo.id,
+        "estado": trabajo.estado,
+        "en_cola": cola_trabajos.profundidad()
+    }
+
+async def obtener_trabajo(trabajo_id: str):
+    trabajo = await cola_trabajos.buscar(trabajo_id)
+    if not trabajo:
+        raise HTTPException(status_code=404, detail="Trabajo no encontrado")
+    return trabajo
+
+@router.get("/probar_prenda/trabajos/{trabajo_id}")
+async def estado_trabajo(trabajo_id: str):
+    return (await obtener_trabajo(trabajo_id)).to_dict()
+
+@router.get("/probar_prenda/trabajos/{trabajo_id}/eventos")
+async def eventos_trabajo(trabajo_id: str, request: Request):
+    trabajo = await obtener_trabajo(trabajo_id)
+
+    async def stream():
+        version = -1
+        while not await request.is_disconnected():
+            if trabajo.version != version:
+                version = trabajo.version
+                yield f"event: estado\ndata: {json.dumps(trabajo.to_dict())}\n\n"
+            else:
+                # Comentario SSE para que los proxies no corten la conexión mientras el trabajo sigue en cola
+                yield ": keepalive\n\n"
+            if trabajo.estado in ESTADOS_FINALES:
+                break
+            await trabajo.esperar_cambio(version, timeout=15)
+
+    return StreamingResponse(stream(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
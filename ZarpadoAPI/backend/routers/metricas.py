@@ -0,0 +1,63 @@
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+
+from db import neo4j
+from utils.cache_resultados import cache_resultados
+from utils.gemini import planificador
+from utils.metricas import metricas
+from utils.recomendaciones import recomendaciones
+from utils.trabajos import cola_trabajos
+
+router = APIRouter()
+
+CONTADORES_MODELO = {
+    "llamadas": "Llamadas al modelo",
+    "exitos": "Llamadas al modelo que terminaron bien",
+    "fallos": "Llamadas al modelo que fallaron tras los reintentos",
+    "reintentos": "Reintentos de llamadas al modelo",
+    "coalescidas": "Pedidos que esperaron una llamada igual ya en curso",
+    "rechazadas_circuito": "Llamadas rechazadas con el circuito abierto",
+    "deadlines": "Llamadas que vencieron su deadline",
+}
+
+@metricas.medidor
+def _medidores_modelos():
+    valores = []
+    for modelo, e in planificador.estadisticas().items():
+        etiquetas = {"modelo": modelo}
+        for clave, ayuda in CONTADORES_MODELO.items():
+            valores.append((f"zarpado_modelo_{clave}_total", "counter", ayuda, etiquetas, e[clave]))
+        valores += [
+            ("zarpado_modelo_en_curso", "gauge", "Llamadas al modelo en curso", etiquetas, e["en_curso"]),
+            ("zarpado_modelo_en_espera", "gauge", "Llamadas esperando cuota", etiquetas, e["en_espera"]),
+            ("zarpado_modelo_circuito_abierto", "gauge", "1 si el circuito del modelo no está cerrado", etiquetas, int(e["circuito"] != "cerrado")),
+        ]
+    return valores
+
+@metricas.medidor
+def _medidores_neo4j():
+    pool = neo4j.estado_pool()
+    valores = [("zarpado_neo4j_disponible", "gauge", "1 si hay conexión con Neo4j", {}, int(neo4j.disponible()))]
+    if pool:
+        valores += [
+            ("zarpado_neo4j_conexiones", "gauge", "Conexiones abiertas en el pool de Neo4j", {}, pool["abiertas"]),
+            ("zarpado_neo4j_conexiones_en_uso", "gauge", "Conexiones de Neo4j en uso", {}, pool["en_uso"]),
+        ]
+    return valores
+
+@metricas.medidor
+def _medidores_app():
+    cache = cache_resultados.estadisticas()
+    reco = recomendaciones.estadisticas()
+    return [
+        ("zarpado_trabajos_en_cola", "gauge", "Trabajos de probar_prenda esperando un worker", {}, cola_trabajos.profundidad()),
+        ("zarpado_trabajos_en_proceso", "gauge", "Trabajos de probar_prenda en proceso", {}, cola_trabajos.en_proceso),
+        ("zarpado_cache_resultados_hits_total", "counter", "Aciertos de la cache de resultados", {}, cache["hits"]),
+        ("zarpado_cache_resultados_misses_total", "counter", "Fallos de la cache de resultados", {}, cache["misses"]),
+        ("zarpado_cache_resultados_bytes", "gauge", "Bytes en la cache de resultados", {}, cache["bytes"]),
+        ("zarpado_interacciones_pendientes", "gauge", "Interacciones sin volcar a Mongo/Neo4j", {}, reco["pendientes"] + reco["pendientes_grafo"]),
+    ]
+
+@router.get("/metrics", response_class=PlainTextResponse, include_in_schema=False)
+def exportar_metricas():
+    return PlainTextResponse(metricas.exportar(), media_type="text/plain; version=0.0.4")
@@ -1,106 +1,167 @@
-from fastapi import APIRouter, HTTPException, UploadFile, File, Form
-from db.mongo import db
+from fastapi import APIRouter, HTTPException, UploadFile, File, Form, BackgroundTasks, Depends, Query, Response
+from fastapi.concurrency import run_in_threadpool
+from db.mongo import get_db
 from bson.objectid import ObjectId
-from models.prenda import PrendaOut
-from config import PRENDA_IMG_DIR
-import os, shutil
+from pymongo import ReturnDocument
+from models.prenda import PrendaOut, PrendaCargada, PrendaResumen, PrendaSimilar, BusquedaPrendas
+from utils.almacen import liberar
+from utils.busqueda import indice_catalogo
+from utils.descripciones import describir_prenda_guardada
+from utils.ejecutores import en_pool_imagenes
+from utils.ingesta import ingerir_upload, detalle_duplicados
+from utils.metricas import span
+from utils.paginacion import parametros_pagina, paginar
+from utils.recomendaciones import recomendaciones
+from utils.similitud import indice_similitud, indexar_prenda, texto_prenda
+from utils.variantes import generar_variantes_seguro
 
 router = APIRouter()
 
-@router.post("/prendas", response_model=PrendaOut)
-def crear_prenda(
+PROYECCION_RESUMEN = {"nombre": 1, "tipo": 1, "marca": 1, "image_path": 1, "variantes.thumb": 1}
+
+@router.post("/prendas", response_model=PrendaCargada)
+async def crear_prenda(
+    background_tasks: BackgroundTasks,
     nombre: str = Form(...),
     tipo: str = Form(...),
     descripcion: str = Form(...),
     marca: str = Form(...),
-    file: UploadFile = File(...)
+    file: UploadFile = File(...),
+    si_duplicada: str = Form("avisar", pattern="^(avisar|rechazar|reutilizar)$")
 ):
-    ext = file.filename.split('.')[-1]
-    filename = f"{nombre}_{marca}_{str(ObjectId())}.{ext}"
-    path = os.path.join(PRENDA_IMG_DIR, filename)
-    with open(path, "wb") as buffer:
-        shutil.copyfileobj(file.file, buffer)
+    with span("guardar"):
+        ingesta = await ingerir_upload(file, si_duplicada)
+    path = ingesta.path
+    with span("variantes"):
+        variantes = await en_pool_imagenes(generar_variantes_seguro, path)
     prenda_dict = {
         "nombre": nombre,
         "tipo": tipo,
         "descripcion": descripcion,
         "marca": marca,
-        "image_path": path
+        "image_path": path,
+        "variantes": variantes
     }
-    res = db["prendas"].insert_one(prenda_dict)
-    prenda_out = {**prenda_dict, "id": str(res.inserted_id)}
+    res = await get_db()["prendas"].insert_one(prenda_dict)
+    indice_catalogo.agregar(prenda_dict)
+    background_tasks.add_task(describir_prenda_guardada, str(res.inserted_id), path)
+    background_tasks.add_task(indexar_prenda, str(res.inserted_id), path, texto_prenda(prenda_dict), ingesta.vector)
+    prenda_out = {**prenda_dict, "id": str(res.inserted_id), "duplicados": detalle_duplicados(ingesta.duplicados)}
     return prenda_out
 
-@router.patch("/prendas/{prenda_id}", response_model=PrendaOut)
-def editar_prenda(
+@router.patch("/prendas/{prenda_id}", response_model=PrendaCargada)
+async def editar_prenda(
     prenda_id: str,
+    background_tasks: BackgroundTasks,
     nombre: str = Form(None),
     tipo: str = Form(None),
     descripcion: str = Form(None),
     marca: str = Form(None),
-    file: UploadFile = File(None)
+    file: UploadFile = File(None),
+    si_duplicada: str = Form("avisar", pattern="^(avisar|rechazar|reutilizar)$")
 ):
     cambios = {}
+    ingesta = None
     if nombre: cambios["nombre"] = nombre
     if tipo: cambios["tipo"] = tipo
     if descripcion: cambios["descripcion"] = descripcion
     if marca: cambios["marca"] = marca
     if file:
-        ext = file.filename.split('.')[-1]
-        filename = f"{prenda_id}_{str(ObjectId())}.{ext}"
-        path = os.path.join(PRENDA_IMG_DIR, filename)
-        with open(path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
-        cambios["image_path"] = path
+        with span("guardar"):
+            ingesta = await ingerir_upload(file, si_duplicada, excluir=prenda_id)
+        path = cambios["image_path"] = ingesta.path
+        with span("variantes"):
+            cambios["variantes"] = await en_pool_imagenes(generar_variantes_seguro, path)
     if not cambios:
         raise HTTPException(status_code=400, detail="Nada para actualizar")
-    res = db["prendas"].update_one({"_id": ObjectId(prenda_id)}, {"$set": cambios})
-    if res.matched_count == 0:
+    update = {"$set": cambios}
+    if file:
+        # La descripción guardada corresponde a la imagen anterior
+        update["$unset"] = {"descripcion_ia": ""}
+    anterior = await get_db()["prendas"].find_one_and_update(
+        {"_id": ObjectId(prenda_id)}, update, projection={"image_path": 1}, return_document=ReturnDocument.BEFORE
+    )
+    if not anterior:
         raise HTTPException(status_code=404, detail="Prenda no encontrada")
-    prenda = db["prendas"].find_one({"_id": ObjectId(prenda_id)})
+    recomendaciones.cache.limpiar()
+    if file:
+        if anterior.get("image_path") != cambios["image_path"]:
+            liberar(anterior.get("image_path"))
+        background_tasks.add_task(describir_prenda_guardada, prenda_id, cambios["image_path"])
+    prenda = await get_db()["prendas"].find_one({"_id": ObjectId(prenda_id)})
+    indice_catalogo.agregar(prenda)
+    if file or {"nombre", "tipo", "marca", "descripcion"} & cambios.keys():
+        background_tasks.add_task(
+            indexar_prenda, prenda_id, prenda["image_path"], texto_prenda(prenda), ingesta.vector if ingesta else None
+        )
     prenda["id"] = str(prenda["_id"])
+    prenda["duplicados"] = detalle_duplicados(ingesta.duplicados) if ingesta else []
     return prenda
 
 @router.delete("/prendas/{prenda_id}")
-def eliminar_prenda(prenda_id: str):
-    prenda = db["prendas"].find_one({"_id": ObjectId(prenda_id)})
+async def eliminar_prenda(prenda_id: str):
+    prenda = await get_db()["prendas"].find_one_and_delete({"_id": ObjectId(prenda_id)}, projection={"image_path": 1})
     if not prenda:
         raise HTTPException(status_code=404, detail="Prenda no encontrada")
-    if prenda.get("image_path"):
-        try:
-            os.remove(prenda["image_path"])
-        except Exception:
-            pass
-    res = db["prendas"].delete_one({"_id": ObjectId(prenda_id)})
-    if res.deleted_count == 0:
-        raise HTTPException(status_code=404, detail="Prenda no encontrada")
+    liberar(prenda.get("image_path"))
+    recomendaciones.cache.limpiar()
+    indice_catalogo.quitar(prenda_id)
+    await run_in_threadpool(indice_similitud.quitar, prenda_id)
     return {"msg": "Prenda eliminada"}
 
+@router.get("/prendas/search", response_model=BusquedaPrendas)
+async def buscar_prendas(
+    response: Response,
+    q: str = Query("", max_length=200),
+    tipo: str = Query(None),
+    marca: str = Query(None),
+    pagina: dict = Depends(parametros_pagina)
+):
+    """Búsqueda por texto en nombre, descripción y marca, con filtros y conteos por tipo y marca.
+    Va antes de /prendas/{prenda_id} para que "search" no se tome como un id."""
+    with span("busqueda"):
+        encontradas, total, facetas, siguiente = await run_in_threadpool(
+            indice_catalogo.buscar, q, tipo, marca, pagina["limit"], pagina["cursor"]
+        )
+    if siguiente:
+        response.headers["X-Next-Cursor"] = siguiente
+    ids = [ObjectId(i) for i, _ in encontradas]
+    docs = await get_db()["prendas"].find({"_id": {"$in": ids}}, PROYECCION_RESUMEN).to_list(None)
+    por_id = {str(d["_id"]): d for d in docs}
+    resultados = [{**por_id[i], "id": i, "puntaje": puntaje} for i, puntaje in encontradas if i in por_id]
+    return {"total": total, "resultados": resultados, "facetas": facetas}
+
 @router.get("/prendas/{prenda_id}", response_model=PrendaOut)
-def obtener_prenda(prenda_id: str):
-    prenda = db["prendas"].find_one({"_id": ObjectId(prenda_id)})
+async def obtener_prenda(prenda_id: str):
+    prenda = await get_db()["prendas"].find_one({"_id": ObjectId(prenda_id)})
     if not prenda:
         raise HTTPException(status_code=404, detail="Prenda no encontrada")
     prenda["id"] = str(prenda["_id"])
     return prenda
 
-@router.get("/prendas", response_model=list[PrendaOut])
-def listar_prendas():
-    prendas = list(db["prendas"].find())
-    for p in prendas:
-        p["id"] = str(p["_id"])
-    return prendas
+@router.get("/prendas", response_model=list[PrendaResumen])
+async def listar_prendas(response: Response, pagina: dict = Depends(parametros_pagina)):
+    return await paginar(get_db()["prendas"], {}, PROYECCION_RESUMEN, pagina, response)
+
+@router.get("/prendas/tipo/{tipo}", response_model=list[PrendaResumen])
+async def listar_por_tipo(tipo: str, response: Response, pagina: dict = Depends(parametros_pagina)):
+    return await paginar(get_db()["prendas"], {"tipo": tipo}, PROYECCION_RESUMEN, pagina, response)
 
-@router.get("/prendas/tipo/{tipo}", response_model=list[PrendaOut])
-def listar_por_tipo(tipo: str):
-    prendas = list(db["prendas"].find({"tipo": tipo}))
-    for p in prendas:
-        p["id"] = str(p["_id"])
-    return prendas
+@router.get("/prendas/marca/{marca}", response_model=list[PrendaResumen])
+async def listar_por_marca(marca: str, response: Response, pagina: dict = Depends(parametros_pagina)):
+    return await paginar(get_db()["prendas"], {"marca": marca}, PROYECCION_RESUMEN, pagina, response)
 
-@router.get("/prendas/marca/{marca}", response_model=list[PrendaOut])
-def listar_por_marca(marca: str):
-    prendas = list(db["prendas"].find({"marca": marca}))
-    for p in prendas:
-        p["id"] = str(p["_id"])
-    return prendas
+@router.get("/prendas/{prenda_id}/similares", response_model=list[PrendaSimilar])
+async def prendas_similares(prenda_id: str, limit: int = Query(10, ge=1, le=100)):
+    """Prendas parecidas por color, forma (pHash) y texto, desde el índice en memoria."""
+    similares = await run_in_threadpool(indice_similitud.similares, prenda_id, limit)
+    if similares is None:
+        raise HTTPException(status_code=404, detail="Prenda no indexada")
+    ids = [ObjectId(i) for i, _ in similares]
+    docs = await get_db()["prendas"].find({"_id": {"$in": ids}}, PROYECCION_RESUMEN).to_list(None)
+    por_id = {str(d["_id"]): d for d in docs}
+    resultado = []
+    for i, similitud in similares:
+        if i in por_id:
+            resultado.append({**por_id[i], "id": i, "similitud": similitud})
+    return resultado
@@ -0,0 +1,101 @@
+from fastapi import APIRouter, HTTPException, Query
+from bson.objectid import ObjectId
+from db.mongo import get_db
+from config import RECOMENDACIONES_K
+from models.recomendacion import RecomendacionesOut
+from routers.prendas import PROYECCION_RESUMEN
+from utils.recomendaciones import recomendaciones
+
+router = APIRouter()
+
+def _como_resumen(doc: dict) -> dict:
+    doc["id"] = str(doc.pop("_id"))
+    return doc
+
+async def _hidratar(clave: str) -> list:
+    """Lista precalculada `clave` con los datos de cada prenda, cacheada en memoria."""
+    prendas = recomendaciones.cache.obtener(clave)
+    if prendas is None:
+        ids = [ObjectId(i) for i in await recomendaciones.precalculadas(clave) if ObjectId.is_valid(i)]
+        docs = await get_db()["prendas"].find({"_id": {"$in": ids}}, PROYECCION_RESUMEN).to_list(None) if ids else []
+        por_id = {d["_id"]: _como_resumen(d) for d in docs}
+        # Se respeta el orden del top-K; las prendas borradas desde el último cálculo se saltean
+        prendas = [por_id[i] for i in ids if i in por_id]
+        recomendaciones.cache.guardar(clave, prendas)
+    return prendas
+
+def _filtro_populares(tipo: str, marca: str) -> dict:
+    filtro = {}
+    if tipo: filtro["tipo"] = tipo
+    if marca: filtro["marca"] = marca
+    return filtro
+
+async def _buscar_populares(filtro: dict, cantidad: int) -> list:
+    cursor = get_db()["prendas"].find(filtro, PROYECCION_RESUMEN).sort([("popularidad", -1), ("_id", 1)])
+    return [_como_resumen(d) for d in await cursor.limit(cantidad).to_list(None)]
+
+async def _populares(tipo: str = None, marca: str = None) -> list:
+    clave = f"popular:{tipo}:{marca}"
+    prendas = recomendaciones.cache.obtener(clave)
+    if prendas is None:
+        prendas = await _buscar_populares(_filtro_populares(tipo, marca), RECOMENDACIONES_K)
+        recomendaciones.cache.guardar(clave, prendas)
+    return prendas
+
+async def _vistas(user_id: str) -> set:
+    """Prendas que el usuario ya probó o tiene en favoritos: no se le recomiendan."""
+    vistas = recomendaciones.cache.obtener(f"vistas:{user_id}")
+    if vistas is None:
+        usuario = await get_db()["usuarios"].find_one({"_id": ObjectId(user_id)}, {"interacciones": 1}) \
+            if ObjectId.is_valid(user_id) else None
+        interacciones = (usuario or {}).get("interacciones", {})
+        vistas = frozenset(interacciones.get("PROBO", [])) | frozenset(interacciones.get("FAVORITO", []))
+        recomendaciones.cache.guardar(f"vistas:{user_id}", vistas)
+    # Las interacciones que todavía no se volcaron a Mongo también cuentan
+    return vistas | recomendaciones.vistas_pendientes(user_id)
+
+async def _armar(personales: list, limit: int, tipo: str, marca: str, excluir: set = frozenset()) -> dict:
+    elegidas = [
+        p for p in personales
+        if (not tipo or p["tipo"] == tipo) and (not marca or p["marca"] == marca) and p["id"] not in excluir
+    ][:limit]
+    cantidad_grafo = len(elegidas)
+    if len(elegidas) < limit:
+        vistas = excluir | {p["id"] for p in elegidas}
+        populares = [p for p in await _populares(tipo, marca) if p["id"] not in vistas]
+        if len(populares) < limit - len(elegidas) and vistas:
+            # Las excluidas se comieron el top cacheado: se busca más allá, sin cachear (depende del usuario)
+            filtro = {**_filtro_populares(tipo, marca), "_id": {"$nin": [ObjectId(i) for i in vistas if ObjectId.is_valid(i)]}}
+            populares = await _buscar_populares(filtro, limit - len(elegidas))
+        elegidas += populares[:limit - len(elegidas)]
+    if cantidad_grafo == 0:
+        fuente = "popularidad"
+    else:
+        fuente = "grafo" if cantidad_grafo == len(elegidas) else "mixta"
+    return {"fuente": fuente, "prendas": elegidas}
+
+@router.get("/recomendaciones/estado")
+def estado_recomendaciones():
+    return recomendaciones.estadisticas()
+
+@router.get("/recomendaciones/prenda/{prenda_id}", response_model=RecomendacionesOut)
+async def recomendar_por_prenda(
+    prenda_id: str,
+    limit: int = Query(10, ge=1, le=RECOMENDACIONES_K),
+    tipo: str = None,
+    marca: str = None,
+):
+    if not ObjectId.is_valid(prenda_id):
+        raise HTTPException(status_code=404, detail="Prenda no encontrada")
+    personales = await _hidratar(f"prenda:{prenda_id}")
+    return await _armar(personales, limit, tipo, marca, excluir={prenda_id})
+
+@router.get("/recomendaciones/{user_id}", response_model=RecomendacionesOut)
+async def recomendar_para_usuario(
+    user_id: str,
+    limit: int = Query(10, ge=1, le=RECOMENDACIONES_K),
+    tipo: str = None,
+    marca: str = None,
+):
+    personales = await _hidratar(f"usuario:{user_id}")
+    return await _armar(personales, limit, tipo, marca, excluir=await _vistas(user_id))
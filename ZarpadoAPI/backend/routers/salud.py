@@ -0,0 +1,33 @@
+import os
+
+from fastapi import APIRouter
+from fastapi.responses import JSONResponse
+
+from db import mongo, neo4j
+from utils import gemini
+
+router = APIRouter()
+
+# Lo marca el lifespan: al empezar el apagado el worker deja de estar listo para que el balanceador
+# no le mande más tráfico mientras termina lo que tiene en curso
+estado = {"iniciado": False, "cerrando": False}
+
+@router.get("/salud/vivo")
+async def vivo():
+    """Liveness: si esto no responde, el event loop está trabado y hay que reiniciar el proceso."""
+    return {"vivo": True, "pid": os.getpid()}
+
+@router.get("/salud/listo")
+async def listo():
+    """Readiness: el worker terminó de arrancar, no se está apagando y Mongo responde. Neo4j y el
+    modelo se informan pero no cuentan: sin ellos la API sigue sirviendo (con popularidad o 503)."""
+    mongo_ok = await mongo.ping()
+    ok = estado["iniciado"] and not estado["cerrando"] and mongo_ok
+    cuerpo = {
+        "listo": ok,
+        "mongo": mongo_ok,
+        "neo4j": neo4j.disponible(),
+        "modelo": {m: e["circuito"] for m, e in gemini.planificador.estadisticas().items()},
+        "pid": os.getpid(),
+    }
+    return JSONResponse(cuerpo, status_code=200 if ok else 503)
@@ -1,39 +1,52 @@
-from fastapi import APIRouter, HTTPException, UploadFile, File, Form
-from db.mongo import db
+from fastapi import APIRouter, HTTPException, UploadFile, File, Form, Depends, Response
+from fastapi.concurrency import run_in_threadpool
+from db.mongo import get_db
 from bson.objectid import ObjectId
-from models.user import UserCreate, UserOut
-from config import USER_IMG_DIR, HISTORIAL_DIR
-import os, shutil, uuid
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+from models.user import UserCreate, UserOut, UserResumen
+from utils.almacen import guardar_upload, liberar
+from utils.auth import hashear_password
+from utils.ejecutores import en_pool_imagenes
+from utils.metricas import span
+from utils.recomendaciones import recomendaciones
+from utils.paginacion import parametros_pagina, paginar
+from utils.variantes import generar_variantes_seguro
 
 router = APIRouter()
 
+# El listado no trae historial ni favoritos: para eso están los endpoints de cada usuario
+PROYECCION_RESUMEN = {"username": 1, "email": 1, "rol": 1, "profile_image_path": 1, "profile_variantes.thumb": 1}
+
 @router.post("/usuarios", response_model=UserOut)
-def crear_usuario(user: UserCreate):
+async def crear_usuario(user: UserCreate):
     user_dict = user.dict()
+    user_dict["password"] = await run_in_threadpool(hashear_password, user.password)
     user_dict["historial"] = []
     user_dict["favoritos"] = []
     user_dict["profile_image_path"] = None
-    res = db["usuarios"].insert_one(user_dict)
+    user_dict["profile_variantes"] = None
+    try:
+        res = await get_db()["usuarios"].insert_one(user_dict)
+    except DuplicateKeyError:
+        raise HTTPException(status_code=409, detail="Ya hay un usuario con ese email")
     user_out = {**user_dict, "id": str(res.inserted_id)}
     return user_out
 
-@router.get("/usuarios", response_model=list[UserOut])
-def obtener_usuarios():
-    usuarios = list(db["usuarios"].find())
-    for u in usuarios:
-        u["id"] = str(u["_id"])
-    return usuarios
+@router.get("/usuarios", response_model=list[UserResumen])
+async def obtener_usuarios(response: Response, pagina: dict = Depends(parametros_pagina)):
+    return await paginar(get_db()["usuarios"], {}, PROYECCION_RESUMEN, pagina, response)
 
 @router.get("/usuarios/{user_id}", response_model=UserOut)
-def obtener_usuario(user_id: str):
-    usuario = db["usuarios"].find_one({"_id": ObjectId(user_id)})
+async def obtener_usuario(user_id: str):
+    usuario = await get_db()["usuarios"].find_one({"_id": ObjectId(user_id)})
     if not usuario:
         raise HTTPException(status_code=404, detail="Usuario no encontrado")
     usuario["id"] = str(usuario["_id"])
     return usuario
 
 @router.patch("/usuarios/{user_id}", response_model=UserOut)
-def editar_usuario(
+async def editar_usuario(
     user_id: str,
     username: str = Form(None),
     email: str = Form(None),
@@ -42,90 +55,139 @@ def editar_usuario(
     cambios = {}
     if username: cambios["username"] = username
     if email: cambios["email"] = email
-    if password: cambios["password"] = password
+    if password: cambios["password"] = await run_in_threadpool(hashear_password, password)
     if not cambios:
         raise HTTPException(status_code=400, detail="Nada para actualizar")
-    res = db["usuarios"].update_one({"_id": ObjectId(user_id)}, {"$set": cambios})
+    try:
+        res = await get_db()["usuarios"].update_one({"_id": ObjectId(user_id)}, {"$set": cambios})
+    except DuplicateKeyError:
+        raise HTTPException(status_code=409, detail="Ya hay un usuario con ese email")
     if res.matched_count == 0:
         raise HTTPException(status_code=404, detail="Usuario no encontrado")
-    usuario = db["usuarios"].find_one({"_id": ObjectId(user_id)})
+    usuario = await get_db()["usuarios"].find_one({"_id": ObjectId(user_id)})
     usuario["id"] = str(usuario["_id"])
     return usuario
 
 @router.delete("/usuarios/{user_id}")
-def eliminar_usuario(user_id: str):
-    res = db["usuarios"].delete_one({"_id": ObjectId(user_id)})
-    if res.deleted_count == 0:
+async def eliminar_usuario(user_id: str):
+    usuario = await get_db()["usuarios"].find_one_and_delete(
+        {"_id": ObjectId(user_id)}, projection={"profile_image_path": 1, "historial": 1}
+    )
+    if not usuario:
         raise HTTPException(status_code=404, detail="Usuario no encontrado")
+    liberar(usuario.get("profile_image_path"), *usuario.get("historial", []))
     return {"msg": "Usuario eliminado"}
 
 @router.patch("/usuarios/{user_id}/profile_image")
-def subir_profile_image(
+async def subir_profile_image(
     user_id: str,
     file: UploadFile = File(...)
 ):
-    ext = file.filename.split('.')[-1]
-    filename = f"{user_id}_profile.{ext}"
-    path = os.path.join(USER_IMG_DIR, filename)
-    with open(path, "wb") as buffer:
-        shutil.copyfileobj(file.file, buffer)
-    db["usuarios"].update_one({"_id": ObjectId(user_id)}, {"$set": {"profile_image_path": path}})
-    return {"profile_image_path": path}
+    with span("guardar"):
+        path = await guardar_upload(file)
+    with span("variantes"):
+        variantes = await en_pool_imagenes(generar_variantes_seguro, path)
+    anterior = await get_db()["usuarios"].find_one_and_update(
+        {"_id": ObjectId(user_id)},
+        {"$set": {"profile_image_path": path, "profile_variantes": variantes}},
+        projection={"profile_image_path": 1},
+        return_document=ReturnDocument.BEFORE,
+    )
+    if not anterior:
+        raise HTTPException(status_code=404, detail="Usuario no encontrado")
+    if anterior.get("profile_image_path") != path:
+        liberar(anterior.get("profile_image_path"))
+    return {"profile_image_path": path, "profile_variantes": variantes}
+
+async def quitar_por_indice(user_id: str, campo: str, idx: int):
+    """Saca el elemento `idx` de la lista `campo` sin pisar cambios concurrentes.
+
+    Mongo no tiene un `$pull` por posición (y un `$pull` del valor se llevaría también sus
+    repetidos, que con el almacén por contenido son comunes): se lee el valor y se rearma la lista
+    sin esa posición con un update de pipeline, solo si el valor sigue ahí. Si otro request movió
+    la lista entre medio, se reintenta. Devuelve (valor quitado, lista nueva)."""
+    usuarios = get_db()["usuarios"]
+    lista_sin = {"$concatArrays": [
+        *([{"$slice": [f"${campo}", idx]}] if idx > 0 else []),
+        # $slice con posición pide un largo positivo: cualquiera mayor que la lista sirve
+        {"$slice": [f"${campo}", idx + 1, 2**31 - 1]},
+    ]}
+    for _ in range(3):
+        usuario = await usuarios.find_one({"_id": ObjectId(user_id)}, {campo: 1})
+        if not usuario:
+            raise HTTPException(status_code=404, detail="Usuario no encontrado")
+        lista = usuario.get(campo, [])
+        if not 0 <= idx < len(lista):
+            raise HTTPException(status_code=400, detail="Índice fuera de rango")
+        valor = lista[idx]
+        nuevo = await usuarios.find_one_and_update(
+            {"_id": ObjectId(user_id), f"{campo}.{idx}": valor},
+            [{"$set": {campo: lista_sin}}],
+            projection={campo: 1},
+            return_document=ReturnDocument.AFTER,
+        )
+        if nuevo:
+            return valor, nuevo.get(campo, [])
+    raise HTTPException(status_code=409, detail="La lista cambió mientras se editaba, reintentá")
 
 @router.get("/usuarios/{user_id}/historial")
-def ver_historial(user_id: str):
-    usuario = db["usuarios"].find_one({"_id": ObjectId(user_id)})
+async def ver_historial(user_id: str):
+    usuario = await get_db()["usuarios"].find_one({"_id": ObjectId(user_id)}, {"historial": 1})
     if not usuario:
         raise HTTPException(status_code=404, detail="Usuario no encontrado")
     return {"historial": usuario.get("historial", [])}
 
 @router.delete("/usuarios/{user_id}/historial/{img_idx}")
-def eliminar_img_historial(user_id: str, img_idx: int):
-    usuario = db["usuarios"].find_one({"_id": ObjectId(user_id)})
-    if not usuario:
-        raise HTTPException(status_code=404, detail="Usuario no encontrado")
-    historial = usuario.get("historial", [])
-    try:
-        img = historial.pop(img_idx)
-        try:
-            os.remove(img)
-        except Exception:
-            pass
-        db["usuarios"].update_one({"_id": ObjectId(user_id)}, {"$set": {"historial": historial}})
-        return {"historial": historial}
-    except IndexError:
-        raise HTTPException(status_code=400, detail="Índice fuera de rango")
+async def eliminar_img_historial(user_id: str, img_idx: int):
+    img, historial = await quitar_por_indice(user_id, "historial", img_idx)
+    if img not in historial:
+        liberar(img)
+    return {"historial": historial}
 
 @router.get("/usuarios/{user_id}/favoritos")
-def ver_favoritos(user_id: str):
-    usuario = db["usuarios"].find_one({"_id": ObjectId(user_id)})
+async def ver_favoritos(user_id: str):
+    usuario = await get_db()["usuarios"].find_one({"_id": ObjectId(user_id)}, {"favoritos": 1})
     if not usuario:
         raise HTTPException(status_code=404, detail="Usuario no encontrado")
     return {"favoritos": usuario.get("favoritos", [])}
 
 @router.post("/usuarios/{user_id}/favoritos")
-def agregar_favorito(
+async def agregar_favorito(
     user_id: str,
-    image_path: str = Form(...)
+    image_path: str = Form(...),
+    prenda_id: str = Form(None)
 ):
-    usuario = db["usuarios"].find_one({"_id": ObjectId(user_id)})
+    # Solo los favoritos del catálogo alimentan las recomendaciones; se guarda de qué prenda es
+    # cada imagen para poder sacar la relación del grafo cuando se quita
+    del_catalogo = bool(prenda_id) and ObjectId.is_valid(prenda_id)
+    cambios = {"favoritos": image_path}
+    if del_catalogo:
+        cambios["favoritos_prenda"] = {"path": image_path, "prenda_id": prenda_id}
+    usuario = await get_db()["usuarios"].find_one_and_update(
+        {"_id": ObjectId(user_id)},
+        {"$addToSet": cambios},
+        projection={"favoritos": 1},
+        return_document=ReturnDocument.AFTER,
+    )
     if not usuario:
         raise HTTPException(status_code=404, detail="Usuario no encontrado")
-    favoritos = usuario.get("favoritos", [])
-    if image_path not in favoritos:
-        favoritos.append(image_path)
-        db["usuarios"].update_one({"_id": ObjectId(user_id)}, {"$set": {"favoritos": favoritos}})
-    return {"favoritos": favoritos}
+    if del_catalogo:
+        recomendaciones.registrar(user_id, prenda_id, "FAVORITO")
+    return {"favoritos": usuario.get("favoritos", [])}
 
 @router.delete("/usuarios/{user_id}/favoritos/{img_idx}")
-def quitar_favorito(user_id: str, img_idx: int):
-    usuario = db["usuarios"].find_one({"_id": ObjectId(user_id)})
-    if not usuario:
-        raise HTTPException(status_code=404, detail="Usuario no encontrado")
-    favoritos = usuario.get("favoritos", [])
-    try:
-        favoritos.pop(img_idx)
-        db["usuarios"].update_one({"_id": ObjectId(user_id)}, {"$set": {"favoritos": favoritos}})
-        return {"favoritos": favoritos}
-    except IndexError:
-        raise HTTPException(status_code=400, detail="Índice fuera de rango")
+async def quitar_favorito(user_id: str, img_idx: int):
+    img, favoritos = await quitar_por_indice(user_id, "favoritos", img_idx)
+    if img not in favoritos:
+        antes = await get_db()["usuarios"].find_one_and_update(
+            {"_id": ObjectId(user_id)},
+            {"$pull": {"favoritos_prenda": {"path": img}}},
+            projection={"favoritos_prenda": 1},
+            return_document=ReturnDocument.BEFORE,
+        )
+        pares = (antes or {}).get("favoritos_prenda", [])
+        quedan = {f["prenda_id"] for f in pares if f["path"] != img}
+        # La prenda deja de ser favorita si no le queda otra imagen guardada
+        for prenda_id in {f["prenda_id"] for f in pares if f["path"] == img} - quedan:
+            recomendaciones.quitar_favorito(user_id, prenda_id)
+    return {"favoritos": favoritos}
@@ -0,0 +1,42 @@
+"""Completa `descripcion_ia` para las prendas del catálogo que todavía no la tienen.
+
+Uso (desde ZarpadoAPI/backend):
+
+    python -m scripts.backfill_descripciones [--todas] [--workers 4]
+"""
+import argparse
+import asyncio
+
+from db import mongo
+from utils.descripciones import describir_prenda_guardada
+
+async def backfill(todas: bool, workers: int):
+    await mongo.conectar()
+    try:
+        filtro = {"image_path": {"$ne": None}}
+        if not todas:
+            filtro["descripcion_ia"] = {"$exists": False}
+        prendas = await mongo.get_db()["prendas"].find(filtro, {"image_path": 1}).to_list(None)
+        print(f"🔎 {len(prendas)} prendas para describir")
+
+        limite = asyncio.Semaphore(workers)
+
+        async def describir(p):
+            async with limite:
+                return await describir_prenda_guardada(str(p["_id"]), p["image_path"])
+
+        resultados = await asyncio.gather(*(describir(p) for p in prendas))
+        ok = sum(1 for r in resultados if r)
+        print(f"✅ {ok}/{len(prendas)} descripciones guardadas")
+    finally:
+        mongo.cerrar()
+
+def main():
+    parser = argparse.ArgumentParser(description="Backfill de descripciones de prendas")
+    parser.add_argument("--todas", action="store_true", help="recalcular también las que ya tienen descripción")
+    parser.add_argument("--workers", type=int, default=4)
+    args = parser.parse_args()
+    asyncio.run(backfill(args.todas, args.workers))
+
+if __name__ == "__main__":
+    main()
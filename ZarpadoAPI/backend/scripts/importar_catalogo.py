@@ -0,0 +1,181 @@
+"""Carga prendas al catálogo en masa desde un directorio o un archivo .zip / .tar(.gz) de imágenes.
+
+Uso (desde ZarpadoAPI/backend; se puede correr con la API andando):
+
+    python -m scripts.importar_catalogo <directorio|archivo> [--marca X] [--tipo X]
+        [--duplicados rechazar|avisar|reutilizar] [--workers 4] [--lote 500]
+
+Si hay un `catalogo.csv` en la raíz (columnas archivo, nombre, tipo, marca, descripcion) se
+cargan las imágenes que nombra con esos datos. Si no, todas las imágenes: el nombre sale del
+archivo, el tipo de la carpeta que lo contiene (o --tipo) y la marca de --marca.
+
+Cada imagen pasa por las mismas validaciones que POST /prendas (formato, tamaño, dimensiones) y
+se busca en el índice de similitud. Los procesos del pool la copian con su hash, la validan, le
+calculan el vector y después generan las variantes; el proceso principal decide los duplicados en
+el orden de la entrada y agrega cada prenda al índice en el momento, así también se detectan las
+repetidas dentro de la misma carga. Con --duplicados rechazar (el default) esas se saltean.
+
+La API ve las prendas nuevas en la búsqueda al próximo refresco (BUSQUEDA_REFRESCO). Las
+descripciones de IA se completan después con `python -m scripts.backfill_descripciones`.
+"""
+import argparse
+import asyncio
+import csv
+import os
+import tarfile
+import tempfile
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+
+from bson.objectid import ObjectId
+from fastapi import HTTPException
+
+from config import UPLOAD_MAX_BYTES
+from db import mongo
+from utils.almacen import almacen
+from utils.ingesta import analizar, buscar_duplicados, imagen_de, POLITICAS
+from utils.similitud import con_texto, indice_similitud, texto_prenda
+from utils.variantes import generar_variantes_seguro
+
+MANIFIESTO = "catalogo.csv"
+EXTENSIONES_IMAGEN = {".jpg", ".jpeg", ".png", ".webp"}
+
+def extraer(origen: str, destino: str):
+    if zipfile.is_zipfile(origen):
+        with zipfile.ZipFile(origen) as z:
+            z.extractall(destino)
+    else:
+        with tarfile.open(origen) as t:
+            # "data" no deja escribir fuera de destino ni crear links o dispositivos
+            t.extractall(destino, filter="data")
+
+def entradas(raiz: str, marca: str, tipo: str) -> list:
+    """Las prendas a cargar en orden: [(ruta, datos)]."""
+    manifiesto = os.path.join(raiz, MANIFIESTO)
+    if os.path.exists(manifiesto):
+        with open(manifiesto, newline="", encoding="utf-8") as f:
+            return [
+                (os.path.join(raiz, fila["archivo"]), {
+                    "nombre": fila.get("nombre") or os.path.splitext(os.path.basename(fila["archivo"]))[0],
+                    "tipo": fila.get("tipo") or tipo,
+                    "marca": fila.get("marca") or marca,
+                    "descripcion": fila.get("descripcion") or "",
+                })
+                for fila in csv.DictReader(f)
+            ]
+    lista = []
+    for carpeta, subcarpetas, archivos in os.walk(raiz):
+        subcarpetas.sort()
+        for nombre in sorted(archivos):
+            stem, ext = os.path.splitext(nombre)
+            if ext.lower() not in EXTENSIONES_IMAGEN or nombre.startswith("."):
+                continue
+            lista.append((os.path.join(carpeta, nombre), {
+                "nombre": stem.replace("_", " ").replace("-", " ").strip(),
+                "tipo": os.path.basename(carpeta) if carpeta != raiz else tipo,
+                "marca": marca,
+                "descripcion": "",
+            }))
+    return lista
+
+def preparar(path: str):
+    """En un proceso del pool: ((tmp, sha, ext, vector), None) o (None, error)."""
+    try:
+        with open(path, "rb") as f:
+            tmp, sha = almacen.recibir(f, UPLOAD_MAX_BYTES)
+        try:
+            return (tmp, sha, *analizar(tmp)), None
+        except BaseException:
+            os.remove(tmp)
+            raise
+    except HTTPException as e:
+        return None, e.detail
+    except OSError as e:
+        return None, str(e)
+
+async def importar(origen: str, marca: str, tipo: str, politica: str, workers: int, lote: int):
+    with tempfile.TemporaryDirectory() as extraido:
+        if os.path.isdir(origen):
+            raiz = origen
+        else:
+            await asyncio.to_thread(extraer, origen, extraido)
+            raiz = extraido
+        lista = entradas(raiz, marca, tipo)
+        print(f"🔎 {len(lista)} imágenes para cargar")
+
+        await mongo.conectar()
+        try:
+            await cargar(lista, politica, workers, lote)
+        finally:
+            mongo.cerrar()
+
+async def cargar(lista: list, politica: str, workers: int, lote: int):
+    loop = asyncio.get_running_loop()
+    nuevas = []
+    paths = {}              # prenda_id -> image_path de esta carga, para reutilizar entre ellas
+    duplicadas = errores = 0
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        preparadas = [loop.run_in_executor(pool, preparar, path) for path, _ in lista]
+        for (archivo, datos), futuro in zip(lista, preparadas):
+            resultado, error = await futuro
+            if error:
+                errores += 1
+                print(f"❌ {archivo}: {error}")
+                continue
+            tmp, sha, ext, vector = resultado
+            duplicados = buscar_duplicados(vector)
+            path = None
+            if duplicados:
+                duplicadas += 1
+                print(f"⚠️ {archivo}: casi igual a {', '.join(i for i, _ in duplicados)} ({politica})")
+                if politica == "rechazar":
+                    os.remove(tmp)
+                    continue
+                if politica == "reutilizar":
+                    path = paths.get(duplicados[0][0]) or await imagen_de(duplicados)
+            if path:
+                os.remove(tmp)
+            else:
+                path = almacen.publicar(tmp, sha, ext)
+            prenda = {"_id": ObjectId(), **datos, "image_path": path}
+            indice_similitud.agregar(str(prenda["_id"]), con_texto(vector, texto_prenda(prenda)), sincronizar=False)
+            paths[str(prenda["_id"])] = path
+            nuevas.append(prenda)
+
+        # Una imagen reutilizada tiene las mismas variantes: cada archivo se procesa una vez
+        unicos = list(dict.fromkeys(p["image_path"] for p in nuevas))
+        variantes = await asyncio.gather(*(loop.run_in_executor(pool, generar_variantes_seguro, p) for p in unicos))
+    por_path = dict(zip(unicos, variantes))
+    for p in nuevas:
+        p["variantes"] = por_path[p["image_path"]]
+
+    try:
+        for i in range(0, len(nuevas), lote):
+            await mongo.get_db()["prendas"].insert_many(nuevas[i:i + lote], ordered=False)
+    except Exception:
+        # Lo que no llegó a Mongo no puede quedar en el índice
+        ids = {p["_id"] async for p in mongo.get_db()["prendas"].find({"_id": {"$in": [p["_id"] for p in nuevas]}}, {"_id": 1})}
+        for p in nuevas:
+            if p["_id"] not in ids:
+                indice_similitud.quitar(str(p["_id"]))
+        raise
+    finally:
+        indice_similitud.sincronizar()
+    print(f"✅ {len(nuevas)} prendas cargadas, ⚠️ {duplicadas} casi duplicadas, ❌ {errores} con errores")
+    if nuevas:
+        print("   Para completar las descripciones: python -m scripts.backfill_descripciones")
+
+def main():
+    parser = argparse.ArgumentParser(description="Carga masiva de prendas al catálogo")
+    parser.add_argument("origen", help="directorio o archivo .zip / .tar(.gz) con las imágenes")
+    parser.add_argument("--marca", default="", help="marca de las prendas sin catalogo.csv")
+    parser.add_argument("--tipo", default="", help="tipo de las imágenes sueltas en la raíz sin catalogo.csv")
+    parser.add_argument("--duplicados", choices=POLITICAS, default="rechazar",
+                        help="qué hacer con las imágenes casi iguales a una del catálogo o de la misma carga")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 4)
+    parser.add_argument("--lote", type=int, default=500, help="prendas por insert en Mongo")
+    args = parser.parse_args()
+    asyncio.run(importar(args.origen, args.marca, args.tipo, args.duplicados, args.workers, args.lote))
+
+if __name__ == "__main__":
+    main()
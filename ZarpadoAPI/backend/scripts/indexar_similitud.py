@@ -0,0 +1,53 @@
+"""(Re)construye el índice de similitud con todas las prendas del catálogo.
+
+Uso (desde ZarpadoAPI/backend; puede correr con la API andando, las escrituras al índice se
+coordinan con un lock de archivo):
+
+    python -m scripts.indexar_similitud [--workers 4]
+"""
+import argparse
+import asyncio
+
+from db import mongo
+from utils.ejecutores import en_pool_imagenes
+from utils.similitud import indice_similitud, texto_prenda, vector_archivo
+
+async def indexar(workers: int):
+    await mongo.conectar()
+    try:
+        prendas = await mongo.get_db()["prendas"].find(
+            {"image_path": {"$ne": None}},
+            {"nombre": 1, "tipo": 1, "marca": 1, "descripcion": 1, "image_path": 1},
+        ).to_list(None)
+        print(f"🔎 {len(prendas)} prendas para indexar")
+
+        limite = asyncio.Semaphore(workers)
+
+        async def indexar_una(p):
+            async with limite:
+                try:
+                    vector = await en_pool_imagenes(vector_archivo, p["image_path"], texto_prenda(p))
+                except Exception as e:
+                    print(f"❌ {p['_id']}: {e}")
+                    return False
+                indice_similitud.agregar(str(p["_id"]), vector, sincronizar=False)
+                return True
+
+        resultados = await asyncio.gather(*(indexar_una(p) for p in prendas))
+        vigentes = {str(p["_id"]) for p in prendas}
+        for prenda_id in indice_similitud.ids():
+            if prenda_id not in vigentes:
+                indice_similitud.quitar(prenda_id)
+        indice_similitud.sincronizar()
+        print(f"✅ {sum(resultados)}/{len(prendas)} prendas indexadas")
+    finally:
+        mongo.cerrar()
+
+def main():
+    parser = argparse.ArgumentParser(description="Indexa las prendas para /prendas/{id}/similares")
+    parser.add_argument("--workers", type=int, default=4)
+    args = parser.parse_args()
+    asyncio.run(indexar(args.workers))
+
+if __name__ == "__main__":
+    main()
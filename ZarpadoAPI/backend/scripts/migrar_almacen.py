@@ -0,0 +1,142 @@
+"""Pasa los archivos de usuarios/, prendas/ e historial/ al almacén direccionado por contenido
+(objetos/ab/cd/<sha256>.<ext>) y actualiza las rutas en Mongo.
+
+Uso (desde ZarpadoAPI/backend; se puede correr con la API andando, cada update es condicional y
+si el documento cambió entre medio se deja como está):
+
+    python -m scripts.migrar_almacen [--workers 4] [--borrar-viejos] [--barrer]
+
+Los archivos se enlazan (hard link) en vez de copiarse. Con --borrar-viejos, al final se borran de
+los directorios viejos los archivos que ya no nombra ningún documento (incluidos los huérfanos que
+dejaban eliminar_usuario y editar_prenda). Con --barrer corre además una pasada del recolector.
+"""
+import argparse
+import asyncio
+import os
+
+from config import STORAGE_DIR, USER_IMG_DIR, PRENDA_IMG_DIR, HISTORIAL_DIR
+from db import mongo
+from utils.almacen import almacen, recolector
+from utils.ejecutores import en_pool_imagenes
+from utils.variantes import PATRON_VARIANTE, enlazar_variantes, generar_variantes_seguro, url_media
+
+def ruta_de(valor: str):
+    """historial guarda rutas absolutas y favoritos URLs /media/...: las dos se llevan a una ruta.
+    Los favoritos los manda el cliente, así que solo vale lo que cae dentro de STORAGE_DIR."""
+    if valor.startswith("/media/"):
+        valor = os.path.join(STORAGE_DIR, valor[len("/media/"):])
+    path = os.path.abspath(valor)
+    return path if os.path.commonpath([os.path.abspath(STORAGE_DIR), path]) == os.path.abspath(STORAGE_DIR) else None
+
+def es_viejo(valor) -> bool:
+    path = ruta_de(valor) if isinstance(valor, str) else None
+    return path is not None and not almacen.contiene(path)
+
+def _mover(path: str):
+    nuevo = almacen.importar_archivo(path)
+    # Las variantes ya generadas se enlazan; generar_variantes solo crea las que falten
+    enlazar_variantes(path, nuevo)
+    return nuevo, generar_variantes_seguro(nuevo)
+
+def _stem_original(nombre: str) -> str:
+    variante = PATRON_VARIANTE.search(nombre)
+    return nombre[:variante.start()] if variante else os.path.splitext(nombre)[0]
+
+async def referencias_viejas() -> set:
+    db = mongo.get_db()
+    vivos = set()
+    async for p in db["prendas"].find({}, {"image_path": 1}):
+        vivos.add(p.get("image_path"))
+    async for u in db["usuarios"].find({}, {"profile_image_path": 1, "historial": 1, "favoritos": 1}):
+        vivos.update([u.get("profile_image_path"), *u.get("historial", []), *u.get("favoritos", [])])
+    return {os.path.splitext(ruta_de(v))[0] for v in vivos if es_viejo(v)}
+
+def borrar_viejos(vivos: set) -> int:
+    borrados = 0
+    for directorio in (USER_IMG_DIR, PRENDA_IMG_DIR, HISTORIAL_DIR):
+        # Solo archivos sueltos: historial/cache es de la cache de resultados
+        for e in os.scandir(directorio):
+            if e.is_file() and os.path.join(directorio, _stem_original(e.name)) not in vivos:
+                os.remove(e.path)
+                borrados += 1
+    return borrados
+
+async def migrar(workers: int, borrar: bool, barrer: bool):
+    await mongo.conectar()
+    try:
+        db = mongo.get_db()
+        limite = asyncio.Semaphore(workers)
+        movidos = {}
+
+        async def mover(valor: str):
+            """(ruta nueva, variantes) o None si el archivo no está. Cada archivo se mueve una sola vez."""
+            path = ruta_de(valor)
+            if path not in movidos:
+                async def hacer():
+                    async with limite:
+                        try:
+                            return await en_pool_imagenes(_mover, path)
+                        except OSError as e:
+                            print(f"⚠️ {path}: {e}")
+                            return None
+                movidos[path] = asyncio.ensure_future(hacer())
+            return await movidos[path]
+
+        async def migrar_prenda(p):
+            movido = await mover(p["image_path"])
+            if not movido:
+                return False
+            res = await db["prendas"].update_one(
+                {"_id": p["_id"], "image_path": p["image_path"]},
+                {"$set": {"image_path": movido[0], "variantes": movido[1]}},
+            )
+            return res.modified_count == 1
+
+        async def migrar_usuario(u):
+            cambios = {}
+            perfil = u.get("profile_image_path")
+            if es_viejo(perfil) and (movido := await mover(perfil)):
+                cambios["profile_image_path"], cambios["profile_variantes"] = movido
+            for campo, como in (("historial", lambda m: m[0]), ("favoritos", lambda m: url_media(m[0]))):
+                lista = u.get(campo, [])
+                nueva = []
+                for valor in lista:
+                    movido = await mover(valor) if es_viejo(valor) else None
+                    nueva.append(como(movido) if movido else valor)
+                if nueva != lista:
+                    cambios[campo] = nueva
+            if not cambios:
+                return False
+            # Condicional a que lo migrado no haya cambiado mientras tanto
+            filtro = {"_id": u["_id"], **{c: u.get(c) for c in ("profile_image_path", "historial", "favoritos") if c in cambios}}
+            res = await db["usuarios"].update_one(filtro, {"$set": cambios})
+            return res.modified_count == 1
+
+        prendas = [
+            p async for p in db["prendas"].find({"image_path": {"$ne": None}}, {"image_path": 1})
+            if es_viejo(p["image_path"])
+        ]
+        usuarios = await db["usuarios"].find({}, {"profile_image_path": 1, "historial": 1, "favoritos": 1}).to_list(None)
+        print(f"🔎 {len(prendas)} prendas y {len(usuarios)} usuarios para revisar")
+        ok_prendas = await asyncio.gather(*(migrar_prenda(p) for p in prendas))
+        ok_usuarios = await asyncio.gather(*(migrar_usuario(u) for u in usuarios))
+        print(f"✅ {sum(ok_prendas)} prendas y {sum(ok_usuarios)} usuarios migrados, {len(movidos)} archivos en el almacén")
+
+        if borrar:
+            borrados = await asyncio.to_thread(borrar_viejos, await referencias_viejas())
+            print(f"✅ {borrados} archivos viejos borrados")
+        if barrer:
+            await recolector.barrer()
+    finally:
+        mongo.cerrar()
+
+def main():
+    parser = argparse.ArgumentParser(description="Migra los archivos al almacén direccionado por contenido")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--borrar-viejos", action="store_true", help="borrar los archivos viejos que nadie referencia")
+    parser.add_argument("--barrer", action="store_true", help="correr una pasada del recolector al final")
+    args = parser.parse_args()
+    asyncio.run(migrar(args.workers, args.borrar_viejos, args.barrer))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,34 @@
+"""Da (o quita) el rol admin a un usuario existente. El registro público solo crea usuarios finales.
+
+Uso (desde ZarpadoAPI/backend):
+
+    python -m scripts.promover_admin usuario@zarpado.com [--quitar]
+
+El cambio vale para los tokens que se emitan desde ahí: los que ya tiene el usuario llevan el rol anterior.
+"""
+import argparse
+import asyncio
+
+from db import mongo
+
+async def promover(email: str, quitar: bool):
+    await mongo.conectar()
+    try:
+        rol = "final" if quitar else "admin"
+        res = await mongo.get_db()["usuarios"].update_one({"email": email}, {"$set": {"rol": rol}})
+        if not res.matched_count:
+            print(f"❌ No hay un usuario con email {email}")
+            return
+        print(f"✅ {email} ahora es {rol}")
+    finally:
+        mongo.cerrar()
+
+def main():
+    parser = argparse.ArgumentParser(description="Asignar el rol admin a un usuario")
+    parser.add_argument("email")
+    parser.add_argument("--quitar", action="store_true", help="volver el usuario a rol final")
+    args = parser.parse_args()
+    asyncio.run(promover(args.email, args.quitar))
+
+if __name__ == "__main__":
+    main()
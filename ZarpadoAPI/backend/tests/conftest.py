@@ -0,0 +1,115 @@
+"""Fixtures de los tests. Se corren desde ZarpadoAPI/backend:
+
+    pip install -r tests/requirements.txt
+    python -m pytest
+
+La app corre entera en el proceso con los reemplazos de bench/falsos.py (Mongo en memoria con
+mongomock_motor, grafo en memoria) y el cliente local de Gemini (GENAI_STUB). Los tests de
+concurrencia necesitan un mongod de verdad, porque mongomock no intercala operaciones: usan
+MONGO_TEST_URL o levantan uno con pymongo_inmemory, y se saltean si no hay ninguno.
+"""
+import io
+import os
+import tempfile
+import uuid
+
+# config.py lee el entorno al importarse: esto va antes de importar la app
+_directorio = tempfile.mkdtemp(prefix="zarpado_tests_")
+os.environ["STORAGE_DIR"] = os.path.join(_directorio, "storage")
+os.environ["CACHE_DIR"] = os.path.join(_directorio, "cache_resultados")
+os.environ.update(
+    GENAI_STUB="1",
+    GENAI_STUB_LATENCIA_MS="0",
+    JWT_SECRET="secreto-de-los-tests-" + "x" * 32,
+    MONGO_ESPERA_ARRANQUE="0",
+    ALMACEN_GC_INTERVALO="0",
+    RECOMENDACIONES_INTERVALO="0",
+    BUSQUEDA_REFRESCO="0",
+)
+
+import pytest
+from PIL import Image, ImageDraw
+
+@pytest.fixture(scope="session")
+def grafo():
+    """El Neo4j en memoria de la app (relaciones[usuario][prenda][tipo])."""
+    from bench import falsos
+    return falsos.instalar()
+
+@pytest.fixture(scope="session")
+def cliente(grafo):
+    from fastapi.testclient import TestClient
+
+    import main
+    with TestClient(main.app) as c:
+        yield c
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+def foto(lado: int = 256, color=(200, 30, 30), formato: str = "PNG") -> bytes:
+    """Una prenda sintética: rectángulo de color con una mancha corrida del centro (una imagen
+    simétrica deja el pHash sin información y no sirve para probar duplicados)."""
+    img = Image.new("RGB", (lado, lado), (240, 240, 240))
+    d = ImageDraw.Draw(img)
+    d.rectangle((lado * .2, lado * .1, lado * .8, lado * .9), fill=color)
+    d.ellipse((lado * .3, lado * .3, lado * .6, lado * .5), fill=(20, 20, 20))
+    buf = io.BytesIO()
+    img.save(buf, formato)
+    return buf.getvalue()
+
+@pytest.fixture
+def crear_prenda(cliente):
+    def crear(nombre="remera", tipo="remera", marca="zarpado", descripcion="algodón", imagen=None, **form):
+        r = cliente.post(
+            "/api/prendas",
+            data={"nombre": nombre, "tipo": tipo, "marca": marca, "descripcion": descripcion, **form},
+            files={"file": ("p.png", imagen or foto(), "image/png")},
+        )
+        assert r.status_code == 200, r.text
+        return r.json()
+    return crear
+
+@pytest.fixture
+def crear_usuario(cliente):
+    def crear(password="secreta123"):
+        nombre = uuid.uuid4().hex[:12]
+        r = cliente.post("/api/usuarios", json={
+            "username": nombre, "email": f"{nombre}@zarpado.com", "password": password,
+        })
+        assert r.status_code == 200, r.text
+        return {**r.json(), "password": password}
+    return crear
+
+@pytest.fixture(scope="session")
+def mongo_url():
+    url = os.environ.get("MONGO_TEST_URL")
+    if url:
+        yield url
+        return
+    try:
+        from pymongo_inmemory import Mongod
+        mongod = Mongod(None)
+        mongod.start()
+    except Exception as e:
+        pytest.skip(f"no hay mongod para los tests de concurrencia (MONGO_TEST_URL o pymongo_inmemory): {e}")
+    try:
+        yield mongod.connection_string
+    finally:
+        mongod.stop()
+
+@pytest.fixture
+async def mongo_real(mongo_url, monkeypatch):
+    """Apunta get_db() a una base nueva de un mongod de verdad durante el test."""
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    from db import mongo
+    client = AsyncIOMotorClient(mongo_url, serverSelectionTimeoutMS=5000)
+    db = client[f"zarpado_test_{uuid.uuid4().hex[:12]}"]
+    monkeypatch.setattr(mongo, "db", db)
+    try:
+        yield db
+    finally:
+        await client.drop_database(db.name)
+        client.close()
@@ -0,0 +1,36 @@
+import os
+import time
+
+import pytest
+
+from utils import almacen as modulo
+from utils.almacen import Almacen, RecolectorAlmacen
+from utils.variantes import enlazar_variantes, rutas_variantes
+
+DOS_DIAS = 48 * 3600
+
+@pytest.mark.anyio
+async def test_acierto_de_cache_despues_del_snapshot_no_se_recolecta(tmp_path, monkeypatch):
+    # Un resultado de la cache (hard link, dos días sin tocarse) que el recolector ya había borrado del almacén
+    almacen = Almacen(str(tmp_path / "objetos"))
+    en_cache = tmp_path / "cache" / "clave.jpg"
+    en_cache.parent.mkdir()
+    en_cache.write_bytes(b"resultado generado")
+    (tmp_path / "cache" / "clave.thumb.0123456789abcdef.webp").write_bytes(b"variante")
+    viejo = time.time() - DOS_DIAS
+    for p in [str(en_cache)] + rutas_variantes(str(en_cache)):
+        os.utime(p, (viejo, viejo))
+
+    importados = []
+    async def referenciados():
+        # El recolector ya tomó su foto de Mongo; recién ahí un try-on acierta la cache y reimporta
+        path = almacen.importar_archivo(str(en_cache), "jpg")
+        enlazar_variantes(str(en_cache), path)
+        importados.append(path)
+        return set()
+    monkeypatch.setattr(modulo, "referenciados", referenciados)
+
+    await RecolectorAlmacen(almacen, 0, 3600, 500, 0).barrer()
+    path = importados[0]
+    assert os.path.exists(path)
+    assert rutas_variantes(path)
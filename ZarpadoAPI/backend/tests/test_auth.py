@@ -0,0 +1,43 @@
+def login(cliente, usuario) -> dict:
+    r = cliente.post("/api/auth/login", json={"email": usuario["email"], "password": usuario["password"]})
+    assert r.status_code == 200, r.text
+    return r.json()
+
+def bearer(tokens: dict) -> dict:
+    return {"Authorization": f"Bearer {tokens['access_token']}"}
+
+def test_login_incorrecto(cliente, crear_usuario):
+    usuario = crear_usuario()
+    r = cliente.post("/api/auth/login", json={"email": usuario["email"], "password": "otra-cosa"})
+    assert r.status_code == 401
+
+def test_refresh_se_usa_una_sola_vez(cliente, crear_usuario):
+    tokens = login(cliente, crear_usuario())
+    r = cliente.post("/api/auth/refresh", json={"refresh_token": tokens["refresh_token"]})
+    assert r.status_code == 200
+    nuevos = r.json()
+    assert nuevos["refresh_token"] != tokens["refresh_token"]
+    assert cliente.post("/api/auth/refresh", json={"refresh_token": tokens["refresh_token"]}).status_code == 401
+    assert cliente.get("/api/auth/yo", headers=bearer(nuevos)).status_code == 200
+
+def test_logout_revoca_access_y_refresh(cliente, crear_usuario):
+    usuario = crear_usuario()
+    tokens = login(cliente, usuario)
+    assert cliente.get("/api/auth/yo", headers=bearer(tokens)).json()["id"] == usuario["id"]
+    r = cliente.post("/api/auth/logout", json={"refresh_token": tokens["refresh_token"]}, headers=bearer(tokens))
+    assert r.status_code == 200
+    assert cliente.get("/api/auth/yo", headers=bearer(tokens)).status_code == 401
+    assert cliente.post("/api/auth/refresh", json={"refresh_token": tokens["refresh_token"]}).status_code == 401
+
+def test_refresh_no_sirve_como_access(cliente, crear_usuario):
+    tokens = login(cliente, crear_usuario())
+    assert cliente.get("/api/auth/yo", headers={"Authorization": f"Bearer {tokens['refresh_token']}"}).status_code == 401
+    assert cliente.post("/api/auth/refresh", json={"refresh_token": tokens["access_token"]}).status_code == 401
+
+def test_registro_no_crea_admin(cliente, crear_usuario):
+    r = cliente.post("/api/usuarios", json={
+        "username": "colado", "email": "colado@zarpado.com", "password": "secreta123", "rol": "admin",
+    })
+    assert r.status_code == 422
+    tokens = login(cliente, crear_usuario())
+    assert cliente.get("/api/auth/yo", headers=bearer(tokens)).json()["rol"] == "final"
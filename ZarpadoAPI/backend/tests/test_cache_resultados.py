@@ -0,0 +1,56 @@
+import json
+import os
+
+from utils.cache_resultados import CacheResultados
+
+def resultado(tmp_path, nombre: str, tam: int = 1000) -> str:
+    path = tmp_path / f"{nombre}.jpg"
+    path.write_bytes(os.urandom(tam))
+    return str(path)
+
+def test_fuera_de_media():
+    from config import CACHE_DIR, STORAGE_DIR
+    assert os.path.commonpath([CACHE_DIR, STORAGE_DIR]) != STORAGE_DIR
+
+def test_tope_compartido_entre_workers(tmp_path):
+    # Dos workers con el mismo directorio: el tope es para los dos juntos
+    directorio = tmp_path / "cache"
+    workers = [CacheResultados(str(directorio), 5000, 3600, 16) for _ in range(2)]
+    for i in range(20):
+        workers[i % 2].guardar(f"clave{i}", resultado(tmp_path, f"r{i}"))
+
+    en_disco = [n for n in os.listdir(directorio) if n.endswith(".jpg")]
+    assert len(en_disco) == 5
+    indice = json.loads((directorio / "index.json").read_text())
+    assert sorted(f"{c}.jpg" for c in indice) == sorted(en_disco)
+    # Se quedan las más nuevas, las haya guardado quien sea
+    assert set(indice) == {f"clave{i}" for i in range(15, 20)}
+
+def test_uso_en_otro_worker_cuenta_para_el_lru(tmp_path):
+    directorio = str(tmp_path / "cache")
+    a, b = CacheResultados(directorio, 3000, 3600, 16), CacheResultados(directorio, 3000, 3600, 16)
+    for i in range(3):
+        a.guardar(f"clave{i}", resultado(tmp_path, f"r{i}"))
+    assert b.obtener("clave0")
+    b.guardar("clave3", resultado(tmp_path, "r3"))
+    # clave0 la usó b después que clave1: se evicta clave1
+    indice = json.loads((tmp_path / "cache" / "index.json").read_text())
+    assert set(indice) == {"clave0", "clave2", "clave3"}
+    assert not os.path.exists(tmp_path / "cache" / "clave1.jpg")
+    # a se entera en su próximo guardado
+    a.guardar("clave4", resultado(tmp_path, "r4"))
+    assert a.obtener("clave1") is None
+    assert set(json.loads((tmp_path / "cache" / "index.json").read_text())) == {"clave0", "clave3", "clave4"}
+
+def test_la_edad_no_sale_del_mtime(tmp_path):
+    # El archivo comparte inodo con el objeto del almacén, que se toca en cada uso
+    directorio = tmp_path / "cache"
+    a, b = CacheResultados(str(directorio), 10**6, 100, 16), CacheResultados(str(directorio), 10**6, 100, 16)
+    a.guardar("clave", resultado(tmp_path, "r"))
+    indice = json.loads((directorio / "index.json").read_text())
+    indice["clave"]["creado"] -= 200
+    (directorio / "index.json").write_text(json.dumps(indice))
+    os.utime(directorio / "clave.jpg")
+
+    # b lo adopta al no tenerlo en su índice: la edad es la del index.json
+    assert b.obtener("clave") is None
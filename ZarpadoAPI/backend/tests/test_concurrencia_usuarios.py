@@ -0,0 +1,82 @@
+"""Altas y bajas concurrentes de historial y favoritos sobre un mismo usuario, contra un mongod de
+verdad: ninguna actualización se pierde ni se pisa."""
+import asyncio
+import os
+import random
+from collections import Counter
+
+import pytest
+from fastapi import HTTPException
+
+from routers.imagen import HISTORIAL_MAX, registrar_historial
+from routers.users import agregar_favorito, quitar_por_indice
+from utils.variantes import _borrados_pendientes
+
+pytestmark = pytest.mark.anyio
+
+OPERACIONES = 200
+
+async def nuevo_usuario(db, **listas) -> str:
+    res = await db["usuarios"].insert_one({"username": "concurrencia", "historial": [], "favoritos": [], **listas})
+    return str(res.inserted_id)
+
+async def lista(db, user_id: str, campo: str) -> list:
+    from bson.objectid import ObjectId
+    return (await db["usuarios"].find_one({"_id": ObjectId(user_id)}, {campo: 1}))[campo]
+
+async def quitar(user_id: str, campo: str, idx: int):
+    """El valor quitado, o None si la baja no se pudo hacer (409 tras los reintentos o índice
+    que ya no existe): en ningún caso se tiene que haber tocado la lista."""
+    try:
+        valor, _ = await quitar_por_indice(user_id, campo, idx)
+        return valor
+    except HTTPException as e:
+        assert e.status_code in (400, 409)
+        return None
+
+async def test_historial_push_slice_concurrente(mongo_real, tmp_path):
+    # N resultados en paralelo: quedan exactamente los últimos HISTORIAL_MAX y en disco solo esos
+    user_id = await nuevo_usuario(mongo_real)
+    paths = []
+    for i in range(OPERACIONES):
+        path = tmp_path / f"r{i}.jpg"
+        path.touch()
+        paths.append(str(path))
+    await asyncio.gather(*(registrar_historial(user_id, p) for p in paths))
+    await asyncio.gather(*list(_borrados_pendientes))
+
+    final = await lista(mongo_real, user_id, "historial")
+    assert len(final) == HISTORIAL_MAX
+    assert sorted(final) == sorted(os.path.join(tmp_path, f) for f in os.listdir(tmp_path))
+
+async def test_favoritos_altas_y_bajas_concurrentes(mongo_real):
+    user_id = await nuevo_usuario(mongo_real)
+    favs = [f"/media/f{i % (OPERACIONES // 2)}.jpg" for i in range(OPERACIONES)]
+    await asyncio.gather(*(agregar_favorito(user_id, f, prenda_id=None) for f in favs))
+    antes = await lista(mongo_real, user_id, "favoritos")
+    assert sorted(antes) == sorted(set(favs))
+
+    # Bajas por posición mezcladas con altas nuevas
+    nuevos = [f"/media/n{i}.jpg" for i in range(OPERACIONES // 4)]
+    rng = random.Random(9)
+    resultados = await asyncio.gather(
+        *(quitar(user_id, "favoritos", rng.randrange(len(antes) // 2)) for _ in range(OPERACIONES // 4)),
+        *(agregar_favorito(user_id, f, prenda_id=None) for f in nuevos),
+    )
+    quitados = [v for v in resultados[:OPERACIONES // 4] if v is not None]
+    assert quitados
+    despues = await lista(mongo_real, user_id, "favoritos")
+    assert Counter(despues) == Counter(antes) + Counter(nuevos) - Counter(quitados)
+
+async def test_bajas_por_indice_concurrentes_con_repetidos(mongo_real):
+    # Con rutas repetidas cada baja tiene que llevarse una sola copia
+    inicial = [f"/almacen/{i % 7}.jpg" for i in range(60)]
+    user_id = await nuevo_usuario(mongo_real, historial=inicial)
+    rng = random.Random(3)
+    resultados = await asyncio.gather(*(quitar(user_id, "historial", rng.randrange(30)) for _ in range(40)))
+    quitados = [v for v in resultados if v is not None]
+    assert quitados
+
+    final = await lista(mongo_real, user_id, "historial")
+    assert len(final) == len(inicial) - len(quitados)
+    assert Counter(final) == Counter(inicial) - Counter(quitados)
@@ -0,0 +1,33 @@
+from io import BytesIO
+
+from PIL import Image
+
+from utils.imagenes import ORIENTACION_EXIF, codificar_resultado
+
+def jpeg(modo: str = "RGB", tam=(300, 200), orientacion: int = None) -> bytes:
+    img = Image.new(modo, tam, 128)
+    exif = Image.Exif()
+    if orientacion:
+        exif[ORIENTACION_EXIF] = orientacion
+    buf = BytesIO()
+    img.save(buf, "JPEG", exif=exif)
+    return buf.getvalue()
+
+def abrir(data: bytes) -> Image.Image:
+    img = Image.open(BytesIO(data))
+    img.load()
+    return img
+
+def test_jpeg_rgb_derecho_pasa_tal_cual():
+    for data in (jpeg(), jpeg(orientacion=1)):
+        assert codificar_resultado(data) is data
+
+def test_escala_de_grises_se_pasa_a_rgb():
+    img = abrir(codificar_resultado(jpeg("L")))
+    assert img.format == "JPEG" and img.mode == "RGB"
+
+def test_orientacion_exif_se_aplica():
+    # 6 = rotar 90°: el resultado queda derecho y sin la etiqueta
+    img = abrir(codificar_resultado(jpeg(orientacion=6)))
+    assert img.size == (200, 300)
+    assert img.getexif().get(ORIENTACION_EXIF, 1) == 1
@@ -0,0 +1,45 @@
+import time
+
+import httpx
+import pytest
+from fastapi import HTTPException
+
+from utils.planificador import PlanificadorModelos, INTERACTIVA
+
+pytestmark = pytest.mark.anyio
+
+def planificador(deadline: float, reintentos: int = 0) -> PlanificadorModelos:
+    return PlanificadorModelos(
+        limites={}, reintentos=reintentos, backoff_base=0.01, backoff_max=0.01,
+        deadlines={INTERACTIVA: deadline}, fallos_circuito=100, espera_circuito=1,
+    )
+
+async def test_el_deadline_va_en_la_llamada_y_no_deja_hilos_colgados():
+    llamadas = []
+    def lenta(timeout: float):
+        # Un cliente HTTP que respeta su timeout: corta sola en vez de seguir ocupando el hilo
+        llamadas.append(timeout)
+        time.sleep(timeout)
+        llamadas.append("terminó")
+        raise httpx.ReadTimeout("timeout")
+
+    p = planificador(0.2, reintentos=3)
+    inicio = time.monotonic()
+    with pytest.raises(HTTPException) as e:
+        await p.llamar("m", lenta)
+    assert e.value.status_code == 504
+    assert time.monotonic() - inicio < 1
+    assert 0 < llamadas[0] <= 0.2 and llamadas[-1] == "terminó"
+    estado = p.estadisticas()["m"]
+    assert estado["en_curso"] == 0 and estado["deadlines"] == 1
+
+async def test_reintenta_un_timeout_con_lo_que_queda():
+    timeouts = []
+    def fn(timeout: float):
+        timeouts.append(timeout)
+        if len(timeouts) == 1:
+            raise httpx.ReadTimeout("timeout")
+        return "ok"
+
+    assert await planificador(5, reintentos=2).llamar("m", fn) == "ok"
+    assert timeouts[1] < timeouts[0] <= 5
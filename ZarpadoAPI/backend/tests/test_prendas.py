@@ -0,0 +1,56 @@
+import random
+import string
+
+from conftest import foto
+
+def palabra() -> str:
+    return "".join(random.choices(string.ascii_lowercase.replace("s", ""), k=12))
+
+def subir(cliente, imagen: bytes, mime: str = "image/png", **form):
+    datos = {"nombre": "remera", "tipo": "remera", "marca": "zarpado", "descripcion": "algodón", **form}
+    return cliente.post("/api/prendas", data=datos, files={"file": ("p", imagen, mime)})
+
+def test_ingesta_duplicada_rechazada(cliente, crear_prenda):
+    imagen = foto(color=(120, 40, 200))
+    original = crear_prenda(imagen=imagen)
+    r = subir(cliente, imagen, si_duplicada="rechazar")
+    assert r.status_code == 409
+    assert original["id"] in [d["id"] for d in r.json()["detail"]["duplicados"]]
+    # Con "avisar" se carga igual e informa de cuál es casi copia
+    r = subir(cliente, imagen)
+    assert r.status_code == 200
+    assert original["id"] in [d["id"] for d in r.json()["duplicados"]]
+
+def test_ingesta_formato_no_soportado(cliente):
+    assert subir(cliente, foto(formato="GIF"), "image/gif").status_code == 415
+    assert subir(cliente, b"esto no es una imagen", "image/png").status_code == 415
+
+def test_ingesta_imagen_invalida(cliente):
+    assert subir(cliente, foto(lado=64)).status_code == 400
+    # Encabezado PNG válido y el resto basura
+    assert subir(cliente, foto()[:40]).status_code == 400
+
+def test_busqueda_cursor_y_facetas(cliente, crear_prenda):
+    clave = palabra()
+    for i, (tipo, marca) in enumerate([("remera", "norte"), ("remera", "pampa"), ("buzo", "norte"),
+                                       ("buzo", "norte"), ("campera", "delta")]):
+        crear_prenda(nombre=f"{clave} {i}", tipo=tipo, marca=marca, imagen=foto(color=(40 * i, 90, 30)))
+
+    vistos, cursor = [], None
+    while True:
+        r = cliente.get("/api/prendas/search", params={"q": clave, "limit": 2, **({"cursor": cursor} if cursor else {})})
+        assert r.status_code == 200
+        cuerpo = r.json()
+        assert cuerpo["total"] == 5 and len(cuerpo["resultados"]) <= 2
+        vistos += [p["id"] for p in cuerpo["resultados"]]
+        cursor = r.headers.get("X-Next-Cursor")
+        if not cursor:
+            break
+    assert len(vistos) == len(set(vistos)) == 5
+    assert cuerpo["facetas"] == {"tipo": {"remera": 2, "buzo": 2, "campera": 1}, "marca": {"norte": 3, "pampa": 1, "delta": 1}}
+
+    # Los filtros achican el resultado pero no las facetas
+    r = cliente.get("/api/prendas/search", params={"q": clave, "marca": "norte"}).json()
+    assert r["total"] == 3 and {p["marca"] for p in r["resultados"]} == {"norte"}
+    assert r["facetas"] == cuerpo["facetas"]
+    assert cliente.get("/api/prendas/search", params={"q": clave, "cursor": "basura"}).status_code == 400
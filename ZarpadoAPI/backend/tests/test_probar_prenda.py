@@ -0,0 +1,74 @@
+import json
+
+from bson.objectid import ObjectId
+
+from conftest import foto
+import routers.imagen
+
+def lote(cliente, user_id, prenda_ids):
+    r = cliente.post(
+        "/api/probar_prenda/lote",
+        data={"user_id": user_id, "prenda_ids": prenda_ids},
+        files={"file_usuario": ("u.png", foto(color=(90, 90, 30)), "image/png")},
+    )
+    assert r.status_code == 200, r.text
+    lineas = [json.loads(l) for l in r.text.splitlines()]
+    return sorted(lineas[:-1], key=lambda l: l["indice"]), lineas[-1]
+
+def test_lote_errores_por_elemento(cliente, crear_prenda, crear_usuario, monkeypatch):
+    generadas = []
+    original = routers.imagen.generar_para_prenda
+
+    async def contar(usuario_norm, contenido, prenda_id=None, avisar=None):
+        generadas.append(prenda_id)
+        return await original(usuario_norm, contenido, prenda_id, avisar)
+    monkeypatch.setattr(routers.imagen, "generar_para_prenda", contar)
+
+    prenda = crear_prenda()
+    usuario = crear_usuario()
+    inexistente = str(ObjectId())
+    resultados, fin = lote(cliente, usuario["id"], [prenda["id"], "bad", inexistente, prenda["id"].upper()])
+
+    assert [(r["ok"], r.get("codigo")) for r in resultados] == [(True, None), (False, 400), (False, 404), (True, None)]
+    assert resultados[1]["prenda_id"] == "bad"
+    assert fin["ok"] == 2 and fin["errores"] == 2 and len(fin["historial"]) == 2
+    # Los ids inválidos o fuera del catálogo no llegan a generar
+    assert generadas == [prenda["id"], prenda["id"]]
+
+def test_probar_prenda_id_mal_formado(cliente, crear_usuario):
+    usuario = crear_usuario()
+    r = cliente.post(
+        "/api/probar_prenda",
+        data={"user_id": usuario["id"], "prenda_id": "bad"},
+        files={"file_usuario": ("u.png", foto(), "image/png")},
+    )
+    assert r.status_code == 400
+
+def test_lote_demasiado_grande_no_lee_uploads(cliente, crear_usuario, monkeypatch):
+    leidos = []
+    original = routers.imagen.leer_upload
+
+    async def contar(archivo):
+        leidos.append(archivo.filename)
+        return await original(archivo)
+    monkeypatch.setattr(routers.imagen, "leer_upload", contar)
+
+    usuario = crear_usuario()
+    archivos = [("files_prenda", (f"p{i}.png", foto(), "image/png")) for i in range(routers.imagen.TRY_ON_LOTE_MAX)]
+    r = cliente.post(
+        "/api/probar_prenda/lote",
+        data={"user_id": usuario["id"], "prenda_ids": [str(ObjectId())]},
+        files=[("file_usuario", ("u.png", foto(), "image/png"))] + archivos,
+    )
+    assert r.status_code == 400
+    assert leidos == []
+
+def test_user_id_mal_formado(cliente, crear_prenda):
+    prenda = crear_prenda()
+    for ruta in ("/api/probar_prenda", "/api/probar_prenda/lote", "/api/probar_prenda/trabajos"):
+        r = cliente.post(
+            ruta,
+            data={"user_id": "no-es-un-id", "prenda_id": prenda["id"], "prenda_ids": [prenda["id"]]},
+            files={"file_usuario": ("u.png", foto(), "image/png")},
+        )
+        assert r.status_code == 400, (ruta, r.text)
@@ -0,0 +1,55 @@
+import uuid
+
+from bson.objectid import ObjectId
+
+from conftest import foto
+from test_usuarios import probar
+
+def volcar(cliente):
+    from utils.recomendaciones import recomendaciones
+    cliente.portal.call(recomendaciones.volcar)
+
+def recomendadas(cliente, user_id, tipo):
+    r = cliente.get(f"/api/recomendaciones/{user_id}", params={"tipo": tipo, "limit": 10})
+    assert r.status_code == 200, r.text
+    return [p["id"] for p in r.json()["prendas"]]
+
+def popularidad(cliente, prenda_id):
+    from db.mongo import get_db
+    prenda = cliente.portal.call(get_db()["prendas"].find_one, {"_id": ObjectId(prenda_id)})
+    return prenda.get("popularidad", 0)
+
+def test_populares_sin_lo_que_ya_probo(cliente, crear_prenda, crear_usuario):
+    tipo = uuid.uuid4().hex
+    popular, otra = crear_prenda(tipo=tipo), crear_prenda(tipo=tipo, imagen=foto(color=(20, 20, 220)))
+    probar(cliente, crear_usuario()["id"], popular["id"], foto(color=(5, 5, 5)))
+    volcar(cliente)
+
+    usuario = crear_usuario()
+    assert recomendadas(cliente, usuario["id"], tipo) == [popular["id"], otra["id"]]
+    # Se excluye en el momento (la cache del usuario se invalida) y también después del volcado
+    probar(cliente, usuario["id"], popular["id"], foto(color=(6, 6, 6)))
+    assert recomendadas(cliente, usuario["id"], tipo) == [otra["id"]]
+    volcar(cliente)
+    assert recomendadas(cliente, usuario["id"], tipo) == [otra["id"]]
+
+def test_quitar_favorito_borra_la_relacion(cliente, grafo, crear_prenda, crear_usuario):
+    tipo = uuid.uuid4().hex
+    prenda, otra = crear_prenda(tipo=tipo), crear_prenda(tipo=tipo, imagen=foto(color=(20, 220, 20)))
+    usuario = crear_usuario()
+    favoritos = f"/api/usuarios/{usuario['id']}/favoritos"
+    for path in ("/media/a.jpg", "/media/b.jpg"):
+        cliente.post(favoritos, data={"image_path": path, "prenda_id": prenda["id"]})
+    volcar(cliente)
+    assert grafo.relaciones[usuario["id"]][prenda["id"]] == {"FAVORITO": 2}
+    assert recomendadas(cliente, usuario["id"], tipo) == [otra["id"]]
+
+    # Con una imagen guardada todavía es favorita; con ninguna, no
+    cliente.delete(f"{favoritos}/0")
+    volcar(cliente)
+    assert "FAVORITO" in grafo.relaciones[usuario["id"]].get(prenda["id"], {})
+    cliente.delete(f"{favoritos}/0")
+    volcar(cliente)
+    assert prenda["id"] not in grafo.relaciones[usuario["id"]]
+    assert popularidad(cliente, prenda["id"]) == 2
+    assert prenda["id"] in recomendadas(cliente, usuario["id"], tipo)
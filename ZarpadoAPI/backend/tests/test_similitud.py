@@ -0,0 +1,10 @@
+import os
+
+def test_indice_no_se_sirve_en_media(cliente, crear_prenda):
+    from config import INDICE_SIMILITUD_DIR, STORAGE_DIR
+    crear_prenda()
+    assert os.path.commonpath([INDICE_SIMILITUD_DIR, STORAGE_DIR]) != STORAGE_DIR
+    archivos = os.listdir(INDICE_SIMILITUD_DIR)
+    assert "vectores.f32" in archivos
+    for nombre in archivos + ["vectores.f32", "ids.s24", "version"]:
+        assert cliente.get(f"/media/indice_similitud/{nombre}").status_code == 404
@@ -0,0 +1,39 @@
+import time
+
+from conftest import foto
+
+def encolar(cliente, user_id, prenda_id=None, imagen_usuario=None, imagen_prenda=None):
+    files = {"file_usuario": ("u.png", imagen_usuario or foto(color=(30, 60, 90)), "image/png")}
+    if imagen_prenda:
+        files["file_prenda"] = ("p.png", imagen_prenda, "image/png")
+    data = {"user_id": user_id, **({"prenda_id": prenda_id} if prenda_id else {})}
+    return cliente.post("/api/probar_prenda/trabajos", data=data, files=files)
+
+def test_en_cola_quedan_las_imagenes_normalizadas(cliente, crear_usuario, monkeypatch):
+    from routers.imagen import cola_trabajos
+    from utils.imagenes import ImagenNormalizada
+    encolados = []
+    original = cola_trabajos.encolar
+    def espiar(tarea, *args):
+        encolados.append(args)
+        return original(tarea, *args)
+    monkeypatch.setattr(cola_trabajos, "encolar", espiar)
+
+    usuario = crear_usuario()
+    r = encolar(cliente, usuario["id"], imagen_prenda=foto(lado=2400), imagen_usuario=foto(lado=2400, color=(1, 2, 3)))
+    assert r.status_code == 202, r.text
+    _, prenda, usuario_norm, _ = encolados[0]
+    assert isinstance(prenda, ImagenNormalizada) and isinstance(usuario_norm, ImagenNormalizada)
+    assert not any(isinstance(a, bytes) for a in encolados[0])
+
+    trabajo_id = r.json()["trabajo_id"]
+    for _ in range(100):
+        estado = cliente.get(f"/api/probar_prenda/trabajos/{trabajo_id}").json()
+        if estado["estado"] in ("completado", "error"):
+            break
+        time.sleep(0.02)
+    assert estado["estado"] == "completado", estado
+
+def test_imagen_invalida_se_rechaza_al_encolar(cliente, crear_usuario):
+    r = encolar(cliente, crear_usuario()["id"], imagen_prenda=foto(), imagen_usuario=b"\x89PNG basura")
+    assert r.status_code == 400
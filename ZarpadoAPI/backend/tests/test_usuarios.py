@@ -0,0 +1,56 @@
+from conftest import foto
+
+def probar(cliente, user_id, prenda_id, imagen):
+    r = cliente.post(
+        "/api/probar_prenda",
+        data={"user_id": user_id, "prenda_id": prenda_id},
+        files={"file_usuario": ("u.png", imagen, "image/png")},
+    )
+    assert r.status_code == 200, r.text
+    return r.json()
+
+def test_quitar_del_historial_deja_los_repetidos(cliente, crear_prenda, crear_usuario):
+    # La segunda prueba igual sale de la cache y apunta al mismo objeto del almacén
+    prenda = crear_prenda()
+    usuario = crear_usuario()
+    imagen = foto(color=(10, 120, 60))
+    primera = probar(cliente, usuario["id"], prenda["id"], imagen)
+    segunda = probar(cliente, usuario["id"], prenda["id"], imagen)
+    assert primera["img_generada"] == segunda["img_generada"]
+    historial = cliente.get(f"/api/usuarios/{usuario['id']}/historial").json()["historial"]
+    assert len(historial) == 2 and historial[0] == historial[1]
+
+    r = cliente.delete(f"/api/usuarios/{usuario['id']}/historial/0")
+    assert r.status_code == 200
+    assert r.json()["historial"] == historial[1:]
+
+def test_quitar_por_indice_quita_solo_esa_posicion(cliente, crear_prenda, crear_usuario):
+    prenda = crear_prenda()
+    usuario = crear_usuario()
+    probar(cliente, usuario["id"], prenda["id"], foto(color=(1, 2, 200)))
+    probar(cliente, usuario["id"], prenda["id"], foto(color=(200, 2, 1)))
+    probar(cliente, usuario["id"], prenda["id"], foto(color=(1, 2, 200)))
+    historial = cliente.get(f"/api/usuarios/{usuario['id']}/historial").json()["historial"]
+    assert len(historial) == 3
+
+    r = cliente.delete(f"/api/usuarios/{usuario['id']}/historial/2")
+    assert r.json()["historial"] == historial[:2]
+    r = cliente.delete(f"/api/usuarios/{usuario['id']}/historial/1")
+    assert r.json()["historial"] == historial[:1]
+    assert cliente.delete(f"/api/usuarios/{usuario['id']}/historial/1").status_code == 400
+
+def test_favoritos_quitar_por_indice(cliente, crear_usuario):
+    usuario = crear_usuario()
+    for f in ("/media/a.jpg", "/media/b.jpg", "/media/c.jpg"):
+        cliente.post(f"/api/usuarios/{usuario['id']}/favoritos", data={"image_path": f})
+    r = cliente.delete(f"/api/usuarios/{usuario['id']}/favoritos/1")
+    assert r.json()["favoritos"] == ["/media/a.jpg", "/media/c.jpg"]
+
+def test_email_repetido(cliente, crear_usuario):
+    usuario, otro = crear_usuario(), crear_usuario()
+    r = cliente.post("/api/usuarios", json={
+        "username": "otro", "email": usuario["email"], "password": "secreta123", "rol": "final",
+    })
+    assert r.status_code == 409
+    r = cliente.patch(f"/api/usuarios/{otro['id']}", data={"email": usuario["email"]})
+    assert r.status_code == 409
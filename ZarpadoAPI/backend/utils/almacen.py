@@ -0,0 +1,250 @@
+import asyncio
+import hashlib
+import os
+import re
+import time
+import uuid
+
+from fastapi import HTTPException, UploadFile
+from fastapi.concurrency import run_in_threadpool
+
+from config import ALMACEN_DIR, ALMACEN_GC_INTERVALO, ALMACEN_GC_GRACIA, ALMACEN_GC_LOTE, ALMACEN_GC_PAUSA
+from db.mongo import get_db
+from utils.archivos import enlazar_o_copiar
+from utils.lider import lider
+from utils.variantes import borrar_en_segundo_plano
+
+PATRON_SHA = re.compile(r"[0-9a-f]{64}")
+BLOQUE = 1024 * 1024
+
+def extension(nombre: str) -> str:
+    """Extensión del nombre que mandó el cliente, solo si es algo razonable."""
+    ext = os.path.splitext(nombre or "")[1].lstrip(".").lower()
+    return ext if re.fullmatch(r"[a-z0-9]{1,5}", ext) else "bin"
+
+def sha_de(path: str):
+    """El sha256 de un objeto del almacén (o de una de sus variantes) sale del nombre del archivo."""
+    sha = os.path.basename(path).split(".")[0]
+    return sha if PATRON_SHA.fullmatch(sha) else None
+
+class Almacen:
+    """Archivos direccionados por contenido: `<raiz>/ab/cd/<sha256>.<ext>`.
+
+    Se escribe en `<raiz>/tmp` y se publica con un rename, así nunca se sirve un archivo a medio
+    escribir. Dos subidas iguales terminan en el mismo archivo (y con las mismas variantes). Como un
+    objeto puede estar referenciado desde varios documentos, nada se borra en el momento: lo hace
+    el recolector cuando ningún documento de Mongo lo nombra.
+    """
+
+    def __init__(self, raiz: str):
+        self.raiz = os.path.abspath(raiz)
+        self.dir_tmp = os.path.join(self.raiz, "tmp")
+        os.makedirs(self.dir_tmp, exist_ok=True)
+
+    def ruta(self, sha: str, ext: str) -> str:
+        return os.path.join(self.raiz, sha[:2], sha[2:4], f"{sha}.{ext}")
+
+    def contiene(self, path: str) -> bool:
+        return os.path.commonpath([self.raiz, os.path.abspath(path)]) == self.raiz
+
+    def _tmp(self) -> str:
+        return os.path.join(self.dir_tmp, f"{uuid.uuid4().hex}.tmp")
+
+    def _existente(self, destino: str) -> bool:
+        try:
+            # Renueva la fecha: el recolector no toca lo que se acaba de volver a usar
+            os.utime(destino)
+            return True
+        except FileNotFoundError:
+            return False
+
+    def publicar(self, tmp: str, sha: str, ext: str) -> str:
+        """Mueve un temporal de `recibir` a su lugar definitivo (o lo borra si el objeto ya estaba)."""
+        destino = self.ruta(sha, ext)
+        if self._existente(destino):
+            os.remove(tmp)
+        else:
+            os.makedirs(os.path.dirname(destino), exist_ok=True)
+            os.replace(tmp, destino)
+            # Un hard link (importar_archivo) trae la fecha del original, que puede ser vieja: sin
+            # esto el recolector lo vería fuera del período de gracia apenas publicado
+            os.utime(destino)
+        return destino
+
+    def guardar_bytes(self, data: bytes, ext: str) -> str:
+        sha = hashlib.sha256(data).hexdigest()
+        destino = self.ruta(sha, ext)
+        if self._existente(destino):
+            return destino
+        tmp = self._tmp()
+        with open(tmp, "wb") as f:
+            f.write(data)
+        return self.publicar(tmp, sha, ext)
+
+    def recibir(self, origen, max_bytes: int = None) -> tuple:
+        """Copia `origen` a un temporal por bloques calculando el hash en la misma pasada y corta
+        apenas pasa `max_bytes`. Devuelve (tmp, sha256): el temporal se publica o se borra."""
+        h = hashlib.sha256()
+        tmp = self._tmp()
+        total = 0
+        try:
+            with open(tmp, "wb") as f:
+                while bloque := origen.read(BLOQUE):
+                    total += len(bloque)
+                    if max_bytes is not None and total > max_bytes:
+                        raise HTTPException(status_code=413, detail=f"La imagen supera el máximo de {max_bytes} bytes")
+                    h.update(bloque)
+                    f.write(bloque)
+        except BaseException:
+            os.remove(tmp)
+            raise
+        return tmp, h.hexdigest()
+
+    def guardar_stream(self, origen, ext: str) -> str:
+        return self.publicar(*self.recibir(origen), ext)
+
+    def importar_archivo(self, path: str, ext: str = None) -> str:
+        """Trae al almacén un archivo que ya está en disco (hard link si se puede)."""
+        h = hashlib.sha256()
+        with open(path, "rb") as f:
+            while bloque := f.read(BLOQUE):
+                h.update(bloque)
+        sha = h.hexdigest()
+        ext = ext or extension(path)
+        if self._existente(self.ruta(sha, ext)):
+            return self.ruta(sha, ext)
+        tmp = self._tmp()
+        enlazar_o_copiar(path, tmp)
+        return self.publicar(tmp, sha, ext)
+
+    def prefijos(self) -> list:
+        return sorted(e.name for e in os.scandir(self.raiz) if e.is_dir() and len(e.name) == 2)
+
+    def huerfanos(self, prefijo: str, vivos: set, limite: float) -> list:
+        """Grupos (un objeto con sus variantes) de `<raiz>/<prefijo>` que ningún documento referencia
+        y que no se tocaron desde `limite`."""
+        grupos = {}
+        for sub in os.scandir(os.path.join(self.raiz, prefijo)):
+            if not sub.is_dir():
+                continue
+            for e in os.scandir(sub.path):
+                sha = sha_de(e.name)
+                # Temporales de variantes que quedaron de un proceso que murió
+                if e.name.endswith(".tmp") and e.stat().st_mtime < limite:
+                    grupos.setdefault(e.path, []).append(e.path)
+                elif sha and sha not in vivos:
+                    grupos.setdefault(sha, []).append(e.path)
+        return [
+            paths for paths in grupos.values()
+            if max(os.stat(p).st_mtime for p in paths) < limite
+        ]
+
+    def temporales_viejos(self, limite: float) -> list:
+        return [[e.path] for e in os.scandir(self.dir_tmp) if e.stat().st_mtime < limite]
+
+    def borrar_grupos(self, grupos: list, limite: float):
+        """Borra cada grupo si sigue sin tocarse (se vuelve a mirar la fecha justo antes). Devuelve
+        (archivos, bytes) liberados."""
+        archivos = liberados = 0
+        for paths in grupos:
+            try:
+                stats = [os.stat(p) for p in paths]
+            except FileNotFoundError:
+                continue
+            if max(s.st_mtime for s in stats) >= limite:
+                continue
+            for p, s in zip(paths, stats):
+                try:
+                    os.remove(p)
+                    archivos += 1
+                    liberados += s.st_size
+                except OSError:
+                    pass
+        return archivos, liberados
+
+almacen = Almacen(ALMACEN_DIR)
+
+async def guardar_upload(file: UploadFile) -> str:
+    return await run_in_threadpool(almacen.guardar_stream, file.file, extension(file.filename))
+
+def liberar(*paths: str):
+    """Suelta archivos que un documento dejó de usar. Los del almacén quedan para el recolector
+    (pueden estar compartidos); los anteriores a la migración se borran en segundo plano como antes."""
+    borrar_en_segundo_plano(*(p for p in paths if p and not almacen.contiene(p)))
+
+async def referenciados() -> set:
+    """Los sha de todo lo que nombran los documentos de Mongo (la fase de marcado del recolector)."""
+    vivos = set()
+    db = get_db()
+    async for prenda in db["prendas"].find({"image_path": {"$ne": None}}, {"image_path": 1}):
+        vivos.add(sha_de(prenda["image_path"]))
+    async for usuario in db["usuarios"].find({}, {"profile_image_path": 1, "historial": 1, "favoritos": 1}):
+        for path in [usuario.get("profile_image_path"), *usuario.get("historial", []), *usuario.get("favoritos", [])]:
+            if isinstance(path, str):
+                vivos.add(sha_de(path))
+    vivos.discard(None)
+    return vivos
+
+class RecolectorAlmacen:
+    """Mark and sweep del almacén: junta los sha referenciados desde Mongo y borra por lotes los
+    objetos que nadie nombra y que tienen más de `gracia` segundos sin tocarse (lo recién
+    escrito puede no estar guardado todavía en su documento)."""
+
+    def __init__(self, almacen: Almacen, intervalo: int, gracia: int, lote: int, pausa: float):
+        self.almacen = almacen
+        self.intervalo = intervalo
+        self.gracia = gracia
+        self.lote = lote
+        self.pausa = pausa
+        self.ultimo_barrido = None
+        self._task = None
+
+    async def iniciar(self):
+        if self.intervalo > 0:
+            self._task = asyncio.create_task(self._barrer_periodicamente())
+
+    async def detener(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _barrer_periodicamente(self):
+        while True:
+            await asyncio.sleep(self.intervalo)
+            # Con varios workers barre uno solo
+            if lider.soy_lider():
+                await self.barrer()
+
+    async def barrer(self) -> dict:
+        inicio = time.perf_counter()
+        limite = time.time() - self.gracia
+        try:
+            vivos = await referenciados()
+        except Exception as e:
+            # Sin la lista completa de referencias no se puede borrar nada con seguridad
+            print(f"❌ Recolector: no se pudieron leer las referencias de Mongo: {e}")
+            return None
+        total = {"archivos": 0, "bytes": 0}
+
+        async def borrar(grupos):
+            archivos, liberados = await run_in_threadpool(self.almacen.borrar_grupos, grupos, limite)
+            total["archivos"] += archivos
+            total["bytes"] += liberados
+            await asyncio.sleep(self.pausa)
+
+        pendientes = await run_in_threadpool(self.almacen.temporales_viejos, limite)
+        for prefijo in await run_in_threadpool(self.almacen.prefijos):
+            pendientes += await run_in_threadpool(self.almacen.huerfanos, prefijo, vivos, limite)
+            while len(pendientes) >= self.lote:
+                await borrar(pendientes[:self.lote])
+                pendientes = pendientes[self.lote:]
+        if pendientes:
+            await borrar(pendientes)
+
+        self.ultimo_barrido = time.time()
+        print(f"✅ Recolector: {total['archivos']} archivos huérfanos borrados ({total['bytes'] / 1e6:.1f} MB) "
+              f"en {time.perf_counter() - inicio:.1f}s, {len(vivos)} objetos referenciados")
+        return total
+
+recolector = RecolectorAlmacen(almacen, ALMACEN_GC_INTERVALO, ALMACEN_GC_GRACIA, ALMACEN_GC_LOTE, ALMACEN_GC_PAUSA)
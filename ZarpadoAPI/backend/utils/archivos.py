@@ -0,0 +1,9 @@
+import os
+import shutil
+
+def enlazar_o_copiar(origen: str, destino: str):
+    # Un hard link cuesta lo mismo que un rename y cada copia se puede borrar sin afectar a la otra
+    try:
+        os.link(origen, destino)
+    except OSError:
+        shutil.copyfile(origen, destino)
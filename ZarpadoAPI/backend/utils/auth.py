@@ -1,16 +1,147 @@
-from fastapi import Depends, HTTPException, Request
-from db.mongo import db
-from bson.objectid import ObjectId
-
-def get_current_user(request: Request):
-    user_id = request.headers.get("user_id")
-    if not user_id:
-        raise HTTPException(status_code=401, detail="No autenticado")
-    user = db["usuarios"].find_one({"_id": ObjectId(user_id)})
-    if not user:
-        raise HTTPException(status_code=401, detail="Usuario inválido")
-    user["id"] = str(user["_id"])
-    return user
+import asyncio
+import hashlib
+import hmac
+import secrets
+import time
+import uuid
+from datetime import datetime, timezone
+
+import jwt
+from fastapi import Depends, HTTPException
+from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
+from pymongo.errors import DuplicateKeyError
+
+from config import JWT_SECRET, JWT_ALGORITMO, ACCESS_TOKEN_TTL, REFRESH_TOKEN_TTL, REVOCADOS_REFRESCO
+from db.mongo import get_db
+
+if JWT_SECRET is None:
+    print("⚠️ JWT_SECRET no definido, se usa uno aleatorio (los tokens se invalidan al reiniciar)")
+    JWT_SECRET = secrets.token_urlsafe(48)
+
+# scrypt de la stdlib: N=2^14, r=8, p=1 (~16 MB y unos 50 ms por hash)
+SCRYPT_N, SCRYPT_R, SCRYPT_P = 2 ** 14, 8, 1
+
+bearer = HTTPBearer(auto_error=False)
+
+def hashear_password(password: str) -> str:
+    salt = secrets.token_bytes(16)
+    h = hashlib.scrypt(password.encode(), salt=salt, n=SCRYPT_N, r=SCRYPT_R, p=SCRYPT_P)
+    return f"scrypt${SCRYPT_N}${SCRYPT_R}${SCRYPT_P}${salt.hex()}${h.hex()}"
+
+def es_hash(valor: str) -> bool:
+    return isinstance(valor, str) and valor.startswith("scrypt$")
+
+def verificar_password(password: str, guardado: str) -> bool:
+    if not guardado:
+        return False
+    if not es_hash(guardado):
+        # Usuarios creados antes de hashear: se compara en texto plano y el login lo migra
+        return hmac.compare_digest(password.encode(), guardado.encode())
+    _, n, r, p, salt, h = guardado.split("$")
+    calculado = hashlib.scrypt(password.encode(), salt=bytes.fromhex(salt), n=int(n), r=int(r), p=int(p))
+    return hmac.compare_digest(calculado.hex(), h)
+
+class ListaRevocacion:
+    """Tokens revocados (logout, refresh ya usado) con copia en memoria.
+
+    Verificar un token no toca Mongo: se consulta el dict local, que se recarga cada
+    `refresco` segundos para ver lo revocado por otras réplicas. Los documentos tienen
+    índice TTL sobre `expira`, así la colección solo guarda tokens que todavía no vencieron.
+    """
+
+    def __init__(self, refresco: int):
+        self.refresco = refresco
+        self._revocados = {}
+        self._task = None
+
+    async def iniciar(self):
+        await self.cargar()
+        self._task = asyncio.create_task(self._refrescar())
+
+    async def detener(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def cargar(self):
+        try:
+            ahora = datetime.now(timezone.utc)
+            docs = await get_db()["tokens_revocados"].find({"expira": {"$gt": ahora}}, {"expira": 1}).to_list(None)
+        except Exception as e:
+            print(f"❌ No se pudo cargar la lista de tokens revocados: {e}")
+            return
+        revocados = {d["_id"]: d["expira"].replace(tzinfo=timezone.utc).timestamp() for d in docs}
+        # Lo revocado localmente mientras se consultaba Mongo no se pierde
+        for jti, exp in self._revocados.items():
+            revocados.setdefault(jti, exp)
+        self._revocados = {jti: exp for jti, exp in revocados.items() if exp > time.time()}
+
+    async def _refrescar(self):
+        while True:
+            await asyncio.sleep(self.refresco)
+            await self.cargar()
+
+    async def revocar(self, jti: str, exp: float):
+        self._revocados[jti] = exp
+        await get_db()["tokens_revocados"].update_one(
+            {"_id": jti},
+            {"$set": {"expira": datetime.fromtimestamp(exp, timezone.utc)}},
+            upsert=True,
+        )
+
+    async def consumir(self, jti: str, exp: float) -> bool:
+        """Revoca `jti` solo si nadie lo hizo antes (rotación de refresh tokens). False si ya estaba."""
+        if self.revocado(jti):
+            return False
+        try:
+            await get_db()["tokens_revocados"].insert_one({"_id": jti, "expira": datetime.fromtimestamp(exp, timezone.utc)})
+        except DuplicateKeyError:
+            self._revocados[jti] = exp
+            return False
+        self._revocados[jti] = exp
+        return True
+
+    def revocado(self, jti: str) -> bool:
+        return jti in self._revocados
+
+lista_revocacion = ListaRevocacion(REVOCADOS_REFRESCO)
+
+def crear_token(user_id: str, rol: str, tipo: str, ttl: int) -> str:
+    ahora = int(time.time())
+    payload = {"sub": user_id, "rol": rol, "typ": tipo, "jti": uuid.uuid4().hex, "iat": ahora, "exp": ahora + ttl}
+    return jwt.encode(payload, JWT_SECRET, algorithm=JWT_ALGORITMO)
+
+def emitir_tokens(user_id: str, rol: str) -> dict:
+    return {
+        "access_token": crear_token(user_id, rol, "access", ACCESS_TOKEN_TTL),
+        "refresh_token": crear_token(user_id, rol, "refresh", REFRESH_TOKEN_TTL),
+        "token_type": "bearer",
+        "expires_in": ACCESS_TOKEN_TTL,
+    }
+
+def decodificar_token(token: str, tipo: str) -> dict:
+    try:
+        payload = jwt.decode(
+            token, JWT_SECRET, algorithms=[JWT_ALGORITMO],
+            options={"require": ["sub", "typ", "jti", "exp"]},
+        )
+    except jwt.ExpiredSignatureError:
+        raise HTTPException(status_code=401, detail="Token vencido")
+    except jwt.InvalidTokenError:
+        raise HTTPException(status_code=401, detail="Token inválido")
+    if payload["typ"] != tipo:
+        raise HTTPException(status_code=401, detail="Token inválido")
+    if lista_revocacion.revocado(payload["jti"]):
+        raise HTTPException(status_code=401, detail="Token revocado")
+    return payload
+
+async def get_current_user(credenciales: HTTPAuthorizationCredentials = Depends(bearer)):
+    """Usuario del access token. No consulta la base: id y rol viajan firmados en el token."""
+    if credenciales is None:
+        raise HTTPException(status_code=401, detail="No autenticado", headers={"WWW-Authenticate": "Bearer"})
+    payload = decodificar_token(credenciales.credentials, "access")
+    return {"id": payload["sub"], "rol": payload["rol"], "jti": payload["jti"], "exp": payload["exp"]}
 
 def require_admin(user=Depends(get_current_user)):
     if user["rol"] != "admin":
@@ -21,6 +152,3 @@ def require_admin_or_owner(user_id: str, user=Depends(get_current_user)):
     if user["rol"] == "admin" or user["id"] == user_id:
         return user
     raise HTTPException(status_code=403, detail="No autorizado")
-
-
-# Por si implementamos autenticación JWT en el futuro , pero medio paja
\ No newline at end of file
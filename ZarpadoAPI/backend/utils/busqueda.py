@@ -0,0 +1,202 @@
+import asyncio
+import bisect
+import heapq
+import math
+import threading
+from collections import Counter
+
+from fastapi import HTTPException
+from fastapi.concurrency import run_in_threadpool
+
+from config import BUSQUEDA_REFRESCO
+from db.mongo import get_db
+from utils.similitud import tokens
+
+# Peso de cada campo en el puntaje: una palabra del nombre vale más que una de la descripción
+CAMPOS = {"nombre": 3.0, "marca": 2.0, "descripcion": 1.0}
+# Un término de la consulta también encuentra los que empiezan con él ("rem" -> "remera"), valiendo menos
+PESO_PREFIJO = 0.5
+PREFIJO_MIN = 3
+PROYECCION = {"nombre": 1, "tipo": 1, "marca": 1, "descripcion": 1}
+
+def terminos(texto: str) -> list:
+    # Singular ingenuo: "remeras" y "remera" caen en el mismo término
+    return [t[:-1] if len(t) > 3 and t.endswith("s") else t for t in tokens(texto or "")]
+
+def _leer_cursor(cursor: str) -> tuple:
+    try:
+        puntaje, prenda_id = cursor.rsplit(":", 1)
+        return -float(puntaje), prenda_id
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Cursor inválido")
+
+class IndiceCatalogo:
+    """Índice invertido del catálogo en memoria para /prendas/search, más los conteos por tipo y
+    marca de todo el catálogo.
+
+    Las rutas de prendas lo actualizan al crear, editar y borrar, así que los conteos nunca
+    necesitan una agregación en Mongo. Cada `refresco` segundos se reconstruye desde Mongo para
+    ver lo que cambiaron otros workers o los scripts.
+    """
+
+    def __init__(self, refresco: int):
+        self.refresco = refresco
+        self._lock = threading.Lock()
+        self._postings = {}       # término -> {prenda_id: peso}
+        self._vocabulario = []    # términos ordenados, para buscar por prefijo
+        self._prendas = {}        # prenda_id -> (tipo, marca, términos)
+        self.facetas = {"tipo": Counter(), "marca": Counter()}
+        self._recientes = None
+        self._task = None
+
+    async def iniciar(self):
+        await self.cargar()
+        if self.refresco > 0:
+            self._task = asyncio.create_task(self._refrescar())
+
+    async def detener(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def cargar(self):
+        self._recientes = {}
+        try:
+            docs = await get_db()["prendas"].find({}, PROYECCION).to_list(None)
+        except Exception as e:
+            self._recientes = None
+            print(f"❌ No se pudo cargar el índice de búsqueda: {e}")
+            return
+        nuevo = await run_in_threadpool(self._construir, docs)
+        with self._lock:
+            # Lo que este worker cambió mientras se leía Mongo no se pierde
+            for prenda_id, prenda in self._recientes.items():
+                nuevo._quitar(prenda_id)
+                if prenda is not None:
+                    nuevo._agregar(prenda_id, prenda)
+            self._postings, self._vocabulario = nuevo._postings, nuevo._vocabulario
+            self._prendas, self.facetas = nuevo._prendas, nuevo.facetas
+            self._recientes = None
+        print(f"🔎 Índice de búsqueda: {len(docs)} prendas, {len(self._vocabulario)} términos")
+
+    def _construir(self, docs: list) -> "IndiceCatalogo":
+        nuevo = IndiceCatalogo(0)
+        for d in docs:
+            nuevo._agregar(str(d["_id"]), d, ordenar=False)
+        # Al construir de cero el vocabulario se ordena una sola vez al final
+        nuevo._vocabulario = sorted(nuevo._postings)
+        return nuevo
+
+    async def _refrescar(self):
+        while True:
+            await asyncio.sleep(self.refresco)
+            await self.cargar()
+
+    def agregar(self, prenda: dict):
+        """Agrega o reemplaza una prenda (el documento de Mongo, con `_id`)."""
+        prenda_id = str(prenda["_id"])
+        with self._lock:
+            self._quitar(prenda_id)
+            self._agregar(prenda_id, prenda)
+            if self._recientes is not None:
+                self._recientes[prenda_id] = prenda
+
+    def quitar(self, prenda_id: str):
+        with self._lock:
+            self._quitar(prenda_id)
+            if self._recientes is not None:
+                self._recientes[prenda_id] = None
+
+    def _agregar(self, prenda_id: str, prenda: dict, ordenar: bool = True):
+        pesos = Counter()
+        for campo, peso in CAMPOS.items():
+            for t, veces in Counter(terminos(prenda.get(campo))).items():
+                pesos[t] += peso * (1 + math.log(veces))
+        for t, peso in pesos.items():
+            docs = self._postings.get(t)
+            if docs is None:
+                docs = self._postings[t] = {}
+                if ordenar:
+                    bisect.insort(self._vocabulario, t)
+            docs[prenda_id] = peso
+        tipo, marca = prenda.get("tipo"), prenda.get("marca")
+        self._prendas[prenda_id] = (tipo, marca, tuple(pesos))
+        self.facetas["tipo"][tipo] += 1
+        self.facetas["marca"][marca] += 1
+
+    def _quitar(self, prenda_id: str):
+        entrada = self._prendas.pop(prenda_id, None)
+        if entrada is None:
+            return
+        tipo, marca, terms = entrada
+        for t in terms:
+            docs = self._postings[t]
+            del docs[prenda_id]
+            if not docs:
+                del self._postings[t]
+                del self._vocabulario[bisect.bisect_left(self._vocabulario, t)]
+        for faceta, valor in (("tipo", tipo), ("marca", marca)):
+            self.facetas[faceta][valor] -= 1
+            if self.facetas[faceta][valor] <= 0:
+                del self.facetas[faceta][valor]
+
+    def _expandir(self, t: str):
+        if t in self._postings:
+            yield t, 1.0
+        if len(t) >= PREFIJO_MIN:
+            j = bisect.bisect_right(self._vocabulario, t)
+            while j < len(self._vocabulario) and self._vocabulario[j].startswith(t):
+                yield self._vocabulario[j], PESO_PREFIJO
+                j += 1
+
+    def _puntuar(self, consulta: list) -> dict:
+        n = len(self._prendas)
+        puntajes = {}
+        for t in set(consulta):
+            for termino, factor in self._expandir(t):
+                docs = self._postings[termino]
+                idf = math.log(1 + n / len(docs))
+                for prenda_id, peso in docs.items():
+                    puntajes[prenda_id] = puntajes.get(prenda_id, 0.0) + factor * peso * idf
+        return puntajes
+
+    def buscar(self, q: str, tipo: str, marca: str, limit: int, cursor: str = None):
+        """Prendas que coinciden con `q` (cualquiera de sus términos) y los filtros, de mayor a menor
+        puntaje y después por id. Sin `q` todas puntúan 0 y salen en el orden del listado.
+
+        Devuelve (página de (prenda_id, puntaje), total, facetas, cursor siguiente o None). Las
+        facetas cuentan por tipo y marca lo que coincide con `q` sin los filtros, para que el
+        cliente muestre cuántas hay de cada opción antes de elegirla.
+        """
+        desde = _leer_cursor(cursor) if cursor else None
+        consulta = terminos(q)
+        with self._lock:
+            if consulta:
+                puntajes = self._puntuar(consulta)
+                facetas = {
+                    "tipo": Counter(self._prendas[i][0] for i in puntajes),
+                    "marca": Counter(self._prendas[i][1] for i in puntajes),
+                }
+            else:
+                puntajes = dict.fromkeys(self._prendas, 0.0)
+                facetas = {f: dict(c) for f, c in self.facetas.items()}
+            candidatos = [
+                (-p, i) for i, p in puntajes.items()
+                if (tipo is None or self._prendas[i][0] == tipo) and (marca is None or self._prendas[i][1] == marca)
+            ]
+        total = len(candidatos)
+        if desde:
+            candidatos = [c for c in candidatos if c > desde]
+        pagina = heapq.nsmallest(limit + 1, candidatos)
+        siguiente = None
+        if len(pagina) > limit:
+            pagina = pagina[:limit]
+            siguiente = f"{-pagina[-1][0]!r}:{pagina[-1][1]}"
+        facetas = {f: {str(k): v for k, v in c.items() if k is not None} for f, c in facetas.items()}
+        return [(i, -p) for p, i in pagina], total, facetas, siguiente
+
+    def __len__(self):
+        return len(self._prendas)
+
+indice_catalogo = IndiceCatalogo(BUSQUEDA_REFRESCO)
@@ -0,0 +1,203 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows: un solo proceso
+    fcntl = None
+
+from config import CACHE_DIR, CACHE_MAX_BYTES, CACHE_MAX_EDAD, CACHE_LRU_ITEMS
+from utils.archivos import enlazar_o_copiar
+from utils.variantes import borrar_variantes, enlazar_variantes, rutas_variantes
+
+
+def hash_bytes(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def clave_resultado(hash_prenda: str, hash_usuario: str, modelo: str, version_prompt: str) -> str:
+    return hash_bytes("|".join([hash_prenda, hash_usuario, modelo, version_prompt]).encode())
+
+
+class CacheResultados:
+    """Cache de imágenes generadas por probar_prenda, indexada por hash de contenido.
+
+    El índice en disco (index.json) sobrevive reinicios; el LRU en memoria guarda las
+    claves calientes para no tener que verificar el archivo en cada acierto. Con varios
+    workers el índice en disco es uno solo: cada guardado lo relee bajo un flock, le suma lo
+    que cambió este proceso (altas, usos, bajas) y recién ahí evicta, así el tope de bytes es
+    para todos juntos. Un resultado que guardó otro worker se adopta al encontrar el archivo.
+    """
+
+    def __init__(self, directorio: str, max_bytes: int, max_edad: int, max_lru: int):
+        self.directorio = directorio
+        self.max_bytes = max_bytes
+        self.max_edad = max_edad
+        self.max_lru = max_lru
+        self.index_path = os.path.join(directorio, "index.json")
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._lru = OrderedDict()
+        # Lo que cambió en este proceso desde la última vez que se escribió el índice
+        self._cambios = {}
+        self._borradas = set()
+        os.makedirs(directorio, exist_ok=True)
+        self._indice = self._cargar_indice()
+
+    def _cargar_indice(self) -> dict:
+        try:
+            with open(self.index_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _guardar_indice(self):
+        tmp = f"{self.index_path}.{os.getpid()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self._indice, f)
+        os.replace(tmp, self.index_path)
+
+    @contextmanager
+    def _candado(self):
+        if fcntl is None:
+            yield
+            return
+        with open(f"{self.index_path}.lock", "a") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            yield
+
+    def _sincronizar(self, ahora: float):
+        """Con self._lock tomado: une el índice en disco con los cambios propios, evicta y lo escribe."""
+        with self._candado():
+            indice = self._cargar_indice()
+            for clave in self._borradas:
+                indice.pop(clave, None)
+            for clave, entrada in self._cambios.items():
+                previa = indice.get(clave)
+                if previa is None or entrada["creado"] > previa["creado"]:
+                    indice[clave] = entrada
+                else:
+                    previa["usado"] = max(previa["usado"], entrada["usado"])
+            self._indice = indice
+            self._cambios.clear()
+            # Lo que otro worker evictó tampoco queda en el LRU
+            for clave in [c for c in self._lru if c not in indice]:
+                del self._lru[clave]
+            self._evictar(ahora)
+            self._borradas.clear()
+            self._guardar_indice()
+
+    def _ruta(self, clave: str) -> str:
+        return os.path.join(self.directorio, f"{clave}.jpg")
+
+    def _descartar(self, clave: str):
+        self._indice.pop(clave, None)
+        self._lru.pop(clave, None)
+        self._cambios.pop(clave, None)
+        self._borradas.add(clave)
+        try:
+            os.remove(self._ruta(clave))
+        except OSError:
+            pass
+        borrar_variantes(self._ruta(clave))
+
+    def obtener(self, clave: str):
+        """Devuelve la ruta del resultado cacheado o None si no hay acierto."""
+        ahora = time.time()
+        with self._lock:
+            entrada = self._indice.get(clave) or self._adoptar(clave)
+            if entrada is None or ahora - entrada["creado"] > self.max_edad:
+                if entrada is not None:
+                    self._descartar(clave)
+                self.misses += 1
+                return None
+
+            if clave in self._lru:
+                self._lru.move_to_end(clave)
+            elif os.path.exists(self._ruta(clave)):
+                self._lru[clave] = True
+                if len(self._lru) > self.max_lru:
+                    self._lru.popitem(last=False)
+            else:
+                self._indice.pop(clave, None)
+                self._cambios.pop(clave, None)
+                self._borradas.add(clave)
+                self.misses += 1
+                return None
+
+            entrada["usado"] = ahora
+            self._cambios[clave] = entrada
+            self.hits += 1
+            return self._ruta(clave)
+
+    def _adoptar(self, clave: str):
+        # Lo generó otro worker y ya lo anotó en el índice en disco. La edad sale de ahí y no del
+        # mtime: el archivo está enlazado con el objeto del almacén, que se toca cada vez que se usa
+        destino = self._ruta(clave)
+        if not os.path.exists(destino):
+            return None
+        entrada = self._cargar_indice().get(clave)
+        if entrada is None:
+            try:
+                tam = sum(os.path.getsize(p) for p in [destino] + rutas_variantes(destino))
+            except OSError:
+                return None
+            ahora = time.time()
+            entrada = {"bytes": tam, "creado": ahora, "usado": ahora}
+        self._indice[clave] = self._cambios[clave] = entrada
+        return entrada
+
+    def guardar(self, clave: str, origen: str):
+        """Guarda el resultado `origen` y sus variantes (ver utils/variantes.py) bajo `clave`."""
+        destino = self._ruta(clave)
+        try:
+            if not os.path.exists(destino):
+                enlazar_o_copiar(origen, destino)
+            enlazar_variantes(origen, destino)
+            tam = sum(os.path.getsize(p) for p in [destino] + rutas_variantes(destino))
+        except OSError:
+            return
+        ahora = time.time()
+        with self._lock:
+            self._indice[clave] = self._cambios[clave] = {"bytes": tam, "creado": ahora, "usado": ahora}
+            self._lru[clave] = True
+            if len(self._lru) > self.max_lru:
+                self._lru.popitem(last=False)
+            self._sincronizar(ahora)
+
+    def _evictar(self, ahora: float):
+        for clave, entrada in list(self._indice.items()):
+            if ahora - entrada["creado"] > self.max_edad:
+                self._descartar(clave)
+                self.evictions += 1
+
+        total = sum(e["bytes"] for e in self._indice.values())
+        if total <= self.max_bytes:
+            return
+        for clave, entrada in sorted(self._indice.items(), key=lambda kv: kv[1]["usado"]):
+            if total <= self.max_bytes:
+                break
+            total -= entrada["bytes"]
+            self._descartar(clave)
+            self.evictions += 1
+
+    def estadisticas(self) -> dict:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "entradas": len(self._indice),
+                "bytes": sum(e["bytes"] for e in self._indice.values()),
+                "lru": len(self._lru),
+            }
+
+
+cache_resultados = CacheResultados(CACHE_DIR, CACHE_MAX_BYTES, CACHE_MAX_EDAD, CACHE_LRU_ITEMS)
@@ -0,0 +1,25 @@
+from bson.objectid import ObjectId
+
+from db.mongo import get_db
+from utils.ejecutores import en_pool_imagenes
+from utils.gemini import descripcion_prenda, parte_imagen
+from utils.imagenes import normalizar_archivo
+from utils.planificador import BACKFILL
+
+async def describir_prenda_guardada(prenda_id: str, image_path: str, prioridad: int = BACKFILL):
+    """Calcula la descripción en inglés de la imagen de una prenda y la guarda en `descripcion_ia`.
+
+    Solo se escribe si la prenda sigue apuntando a la misma imagen, por si la editaron mientras
+    se generaba la descripción. Por defecto va por el carril de backfill: nadie espera la respuesta.
+    """
+    try:
+        prenda_norm = await en_pool_imagenes(normalizar_archivo, image_path)
+        texto = await descripcion_prenda(parte_imagen(prenda_norm), prioridad=prioridad, clave=prenda_norm.sha256)
+    except Exception as e:
+        print(f"❌ No se pudo describir la prenda {prenda_id}: {e}")
+        return None
+    await get_db()["prendas"].update_one(
+        {"_id": ObjectId(prenda_id), "image_path": image_path},
+        {"$set": {"descripcion_ia": texto}}
+    )
+    return texto
@@ -0,0 +1,23 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+from config import IMAGEN_WORKERS
+
+# Pool exclusivo para decodificar/codificar imágenes con PIL. Así el trabajo de CPU no compite
+# por los hilos del threadpool de Starlette, que quedan para E/S (Gemini, disco).
+pool_imagenes = None
+
+def iniciar_pool_imagenes():
+    global pool_imagenes
+    pool_imagenes = ThreadPoolExecutor(max_workers=IMAGEN_WORKERS, thread_name_prefix="imagenes")
+
+def cerrar_pool_imagenes():
+    global pool_imagenes
+    if pool_imagenes is not None:
+        pool_imagenes.shutdown(wait=False, cancel_futures=True)
+    pool_imagenes = None
+
+async def en_pool_imagenes(fn, *args):
+    if pool_imagenes is None:
+        iniciar_pool_imagenes()
+    return await asyncio.get_running_loop().run_in_executor(pool_imagenes, fn, *args)
@@ -0,0 +1,179 @@
+import os
+import random
+import threading
+import time
+from io import BytesIO
+from types import SimpleNamespace
+
+import httpx
+from PIL import Image
+
+from config import (
+    GENAI_TIMEOUT_MS, GENAI_RPM_IMAGEN, GENAI_RAFAGA_IMAGEN, GENAI_RPM_DESCRIPCION, GENAI_RAFAGA_DESCRIPCION,
+    GENAI_REINTENTOS, GENAI_BACKOFF_BASE, GENAI_BACKOFF_MAX, GENAI_DEADLINE_INTERACTIVO, GENAI_DEADLINE_BACKFILL,
+    CIRCUITO_FALLOS, CIRCUITO_ESPERA, WORKERS,
+)
+from utils.imagenes import get_mime_type_bytes
+from utils.planificador import PlanificadorModelos, INTERACTIVA, BACKFILL
+
+from dotenv import load_dotenv
+load_dotenv()
+
+GENAI_API_KEY = os.environ.get("GOOGLE_API_KEY")
+# GENAI_STUB=1 reemplaza a Gemini por un cliente local (pruebas de carga sin red ni cuota)
+GENAI_STUB = os.environ.get("GENAI_STUB", "0") == "1"
+GENAI_STUB_LATENCIA_MS = int(os.environ.get("GENAI_STUB_LATENCIA_MS", 500))
+# Fracción de llamadas del stub que fallan con 503 / 429 (para probar reintentos y circuit breaker)
+GENAI_STUB_FALLAS = float(os.environ.get("GENAI_STUB_FALLAS", 0))
+GENAI_STUB_429 = float(os.environ.get("GENAI_STUB_429", 0))
+# Lado en px de la imagen que "genera" el stub; 0 = devuelve la foto del usuario tal cual
+GENAI_STUB_LADO = int(os.environ.get("GENAI_STUB_LADO", 0))
+# Formato de esa imagen: JPEG o PNG (el modelo real suele devolver PNG)
+GENAI_STUB_FORMATO = os.environ.get("GENAI_STUB_FORMATO", "JPEG").upper()
+
+def _sdk():
+    """google.genai tarda un par de décimas en importarse: se carga con el cliente, no con la app."""
+    from google.genai import errors, types
+    return errors, types
+
+def _error_stub(codigo: int, estado: str) -> Exception:
+    errors, _ = _sdk()
+    clase = errors.ServerError if codigo >= 500 else errors.ClientError
+    return clase(codigo, {"error": {"code": codigo, "message": "stub", "status": estado}})
+
+class _ModelosStub:
+    def __init__(self, latencia_ms: int, fallas: float = 0, fallas_429: float = 0, lado: int = 0):
+        self.latencia_ms = latencia_ms
+        self.fallas = fallas
+        self.fallas_429 = fallas_429
+        # Ruido para que el JPEG pese como una foto real y no como un color liso
+        self._base = Image.effect_noise((lado, lado), 64).convert("RGB") if lado else None
+
+    def _imagen_generada(self) -> bytes:
+        # Cada resultado distinto, como los del modelo: si no, el almacén los deduplicaría
+        img = self._base.copy()
+        img.paste(tuple(random.randrange(256) for _ in range(3)), (0, 0, 16, 16))
+        buf = BytesIO()
+        if GENAI_STUB_FORMATO == "PNG":
+            img.save(buf, format="PNG")
+        else:
+            img.save(buf, format="JPEG", quality=90)
+        return buf.getvalue()
+
+    def generate_content(self, model, contents, config=None):
+        # Como el cliente real: el timeout del request HTTP corta la espera
+        timeout = getattr(getattr(config, "http_options", None), "timeout", None)
+        if timeout is not None and timeout < self.latencia_ms:
+            time.sleep(timeout / 1000)
+            raise httpx.ReadTimeout("stub: timeout")
+        time.sleep(self.latencia_ms / 1000)
+        azar = random.random()
+        if azar < self.fallas:
+            raise _error_stub(503, "UNAVAILABLE")
+        if azar < self.fallas + self.fallas_429:
+            raise _error_stub(429, "RESOURCE_EXHAUSTED")
+        imagenes = [c.inline_data.data for c in contents if getattr(c, "inline_data", None)]
+        if "image-generation" in model:
+            # Devuelve la última imagen recibida (la del usuario) como si fuera el resultado
+            if self._base is not None:
+                data = self._imagen_generada()
+            elif imagenes:
+                data = imagenes[-1]
+            else:
+                buf = BytesIO()
+                Image.new("RGB", (512, 512), "gray").save(buf, format="JPEG")
+                data = buf.getvalue()
+            part = SimpleNamespace(text=None, inline_data=SimpleNamespace(data=data, mime_type=get_mime_type_bytes(data)))
+        else:
+            part = SimpleNamespace(text="Stub garment: plain cotton t-shirt", inline_data=None)
+        return SimpleNamespace(candidates=[SimpleNamespace(content=SimpleNamespace(parts=[part]))])
+
+class ClienteStub:
+    def __init__(self, latencia_ms: int = GENAI_STUB_LATENCIA_MS, fallas: float = GENAI_STUB_FALLAS,
+                 fallas_429: float = GENAI_STUB_429, lado: int = GENAI_STUB_LADO):
+        self.models = _ModelosStub(latencia_ms, fallas, fallas_429, lado)
+
+client = None
+_lock_cliente = threading.Lock()
+
+def cliente():
+    """El cliente del modelo, creado con la primera llamada (o al arrancar, ver `iniciar`)."""
+    global client
+    with _lock_cliente:
+        if client is None:
+            if GENAI_STUB:
+                client = ClienteStub()
+            else:
+                from google import genai
+                _, types = _sdk()
+                # Sin reintentos del SDK: los hace el planificador, que conoce la cuota y el deadline de cada llamada
+                client = genai.Client(
+                    api_key=GENAI_API_KEY,
+                    http_options=types.HttpOptions(timeout=GENAI_TIMEOUT_MS, retry_options=types.HttpRetryOptions(attempts=1)),
+                )
+        return client
+
+def verificar_configuracion():
+    if not GENAI_STUB and not GENAI_API_KEY:
+        raise RuntimeError("No se encontró GOOGLE_API_KEY en el entorno.")
+
+def cerrar():
+    global client
+    with _lock_cliente:
+        if client is not None and hasattr(client, "close"):
+            client.close()
+        client = None
+
+MODELO_DESCRIPCION = "gemini-2.0-flash"
+MODELO_IMAGEN = "gemini-2.0-flash-exp-image-generation"
+
+planificador = PlanificadorModelos(
+    limites={
+        # La cuota es de la API key: con varios workers cada uno usa su parte
+        MODELO_IMAGEN: (GENAI_RPM_IMAGEN / WORKERS, max(1, GENAI_RAFAGA_IMAGEN // WORKERS)),
+        MODELO_DESCRIPCION: (GENAI_RPM_DESCRIPCION / WORKERS, max(1, GENAI_RAFAGA_DESCRIPCION // WORKERS)),
+    },
+    reintentos=GENAI_REINTENTOS,
+    backoff_base=GENAI_BACKOFF_BASE,
+    backoff_max=GENAI_BACKOFF_MAX,
+    deadlines={INTERACTIVA: GENAI_DEADLINE_INTERACTIVO, BACKFILL: GENAI_DEADLINE_BACKFILL},
+    fallos_circuito=CIRCUITO_FALLOS,
+    espera_circuito=CIRCUITO_ESPERA,
+)
+
+def _generate_content(modelo: str, contents: list, modalidades: list, timeout: float):
+    # El timeout va en el request HTTP: el planificador le pasa lo que queda del deadline
+    _, types = _sdk()
+    config = types.GenerateContentConfig(
+        response_modalities=modalidades,
+        http_options=types.HttpOptions(timeout=max(1, int(min(timeout * 1000, GENAI_TIMEOUT_MS)))),
+    )
+    return cliente().models.generate_content(model=modelo, contents=contents, config=config)
+
+async def generar_contenido(modelo: str, contents: list, modalidades: list,
+                            prioridad: int = INTERACTIVA, clave: str = None):
+    """generate_content a través del planificador (cuota, reintentos, circuit breaker, single-flight)."""
+    return await planificador.llamar(
+        modelo, _generate_content, modelo, contents, modalidades, prioridad=prioridad, clave=clave,
+    )
+
+def parte_imagen(imagen):
+    """Arma el Part a partir de una ImagenNormalizada (JPEG ya codificado). Si se le pasa una
+    PIL.Image al SDK, la recodifica a PNG en cada llamada."""
+    _, types = _sdk()
+    return types.Part.from_bytes(data=imagen.jpeg, mime_type="image/jpeg")
+
+async def descripcion_prenda(imagen_prenda, prioridad: int = INTERACTIVA, clave: str = None) -> str:
+    response = await generar_contenido(
+        MODELO_DESCRIPCION,
+        [
+            "SOLO DAME LA DESCRIPCION EL TIPO DE PRENDA Y CARACTERISTICAS SOBRE SALIENTES, "
+            "Ejemplo de salida (Anorak: Ligero, de nailon, con cremallera corta, capucha con cordón y detalles en bloques de color (azul y negro) en los hombros y las mangas. Logotipo KINGOFTHEKONGO, ADIDAS, etc.). "
+            "LA SALIDA ESPERADA TIENE QUE SER EN INGLÉS",
+            imagen_prenda
+        ],
+        ['Text'],
+        prioridad=prioridad,
+        clave=clave,
+    )
+    return response.candidates[0].content.parts[0].text
@@ -0,0 +1,91 @@
+import hashlib
+from functools import lru_cache
+from io import BytesIO
+from typing import NamedTuple
+
+from fastapi import HTTPException, UploadFile
+from PIL import Image, ImageOps
+
+from config import UPLOAD_MAX_BYTES, IMAGEN_MAX_LADO, IMAGEN_CALIDAD_JPEG, RESULTADO_MAX_LADO, RESULTADO_CALIDAD_JPEG
+
+CHUNK_LECTURA = 256 * 1024
+ORIENTACION_EXIF = 0x0112
+
+class ImagenNormalizada(NamedTuple):
+    """Imagen lista para mandar al modelo: JPEG RGB, orientada y con el lado mayor acotado."""
+    jpeg: bytes
+    sha256: str
+    ancho: int
+    alto: int
+
+def get_mime_type_bytes(data: bytes) -> str:
+    header = data[:12]
+    if header.startswith(b"\xff\xd8"):
+        return "image/jpeg"
+    if header.startswith(b"\x89PNG"):
+        return "image/png"
+    if header[:4] == b"RIFF" and header[8:12] == b"WEBP":
+        return "image/webp"
+    return "application/octet-stream"
+
+async def leer_upload(file: UploadFile, max_bytes: int = UPLOAD_MAX_BYTES) -> bytes:
+    """Lee el upload por partes y corta apenas supera `max_bytes`, sin cargarlo entero antes."""
+    if file.size is not None and file.size > max_bytes:
+        raise HTTPException(status_code=413, detail=f"La imagen supera el máximo de {max_bytes} bytes")
+    buf = bytearray()
+    while True:
+        chunk = await file.read(CHUNK_LECTURA)
+        if not chunk:
+            break
+        buf += chunk
+        if len(buf) > max_bytes:
+            raise HTTPException(status_code=413, detail=f"La imagen supera el máximo de {max_bytes} bytes")
+    return bytes(buf)
+
+def normalizar_imagen(contenido: bytes, max_lado: int = IMAGEN_MAX_LADO) -> ImagenNormalizada:
+    """Decodifica una sola vez, corrige la orientación EXIF, achica al lado máximo y codifica a JPEG.
+
+    Para JPEG se usa el modo draft, que decodifica directamente a 1/2, 1/4 u 1/8 de la resolución
+    cuando la foto es mucho más grande que `max_lado`.
+    """
+    with Image.open(BytesIO(contenido)) as img:
+        if img.format == "JPEG":
+            img.draft("RGB", (max_lado, max_lado))
+        ImageOps.exif_transpose(img, in_place=True)
+        if img.mode != "RGB":
+            img = img.convert("RGB")
+        img.thumbnail((max_lado, max_lado), Image.LANCZOS)
+        buf = BytesIO()
+        img.save(buf, format="JPEG", quality=IMAGEN_CALIDAD_JPEG)
+        ancho, alto = img.size
+    jpeg = buf.getvalue()
+    return ImagenNormalizada(jpeg, hashlib.sha256(jpeg).hexdigest(), ancho, alto)
+
+def codificar_resultado(data: bytes, max_lado: int = RESULTADO_MAX_LADO) -> bytes:
+    """JPEG para guardar y servir a partir de lo que devolvió el modelo.
+
+    Si ya es un JPEG RGB derecho (sin rotación EXIF) de tamaño razonable se devuelven los mismos
+    bytes: abrirlo solo lee el encabezado, no decodifica. Si no (el modelo suele devolver PNG; un
+    JPEG en escala de grises o rotado tampoco sirve tal cual) se codifica una sola vez, derecho,
+    en RGB, progresivo y con tablas Huffman optimizadas.
+    """
+    with Image.open(BytesIO(data)) as img:
+        derecho = img.getexif().get(ORIENTACION_EXIF, 1) == 1
+        if img.format == "JPEG" and img.mode == "RGB" and derecho and max(img.size) <= max_lado:
+            return data
+        if img.format == "JPEG":
+            img.draft("RGB", (max_lado, max_lado))
+        ImageOps.exif_transpose(img, in_place=True)
+        if img.mode != "RGB":
+            img = img.convert("RGB")
+        img.thumbnail((max_lado, max_lado), Image.LANCZOS)
+        buf = BytesIO()
+        img.save(buf, format="JPEG", quality=RESULTADO_CALIDAD_JPEG, optimize=True, progressive=True)
+    return buf.getvalue()
+
+@lru_cache(maxsize=64)
+def normalizar_archivo(path: str, max_lado: int = IMAGEN_MAX_LADO) -> ImagenNormalizada:
+    """Como normalizar_imagen pero para imágenes guardadas en disco (catálogo). Se cachea por ruta:
+    las rutas de prendas no se reutilizan, al editar la imagen cambia el nombre del archivo."""
+    with open(path, "rb") as f:
+        return normalizar_imagen(f.read(), max_lado)
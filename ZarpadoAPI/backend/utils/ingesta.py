@@ -0,0 +1,88 @@
+import os
+from typing import NamedTuple
+
+import numpy as np
+from bson.objectid import ObjectId
+from fastapi import HTTPException, UploadFile
+from fastapi.concurrency import run_in_threadpool
+from PIL import Image
+
+from config import UPLOAD_MAX_BYTES, PRENDA_MIN_LADO, PRENDA_MAX_PIXELES, DUPLICADO_MAX_HAMMING, DUPLICADO_MIN_COLOR
+from db.mongo import get_db
+from utils.almacen import almacen
+from utils.ejecutores import en_pool_imagenes
+from utils.imagenes import get_mime_type_bytes
+from utils.similitud import indice_similitud, vector_archivo
+
+# La extensión sale del contenido, no del nombre que mandó el cliente
+EXTENSIONES = {"image/jpeg": "jpg", "image/png": "png", "image/webp": "webp"}
+# Qué hacer si la imagen es casi igual a la de otra prenda: cargarla igual e informarlo, rechazarla,
+# o cargar la prenda apuntando a la imagen que ya estaba
+POLITICAS = ("avisar", "rechazar", "reutilizar")
+
+class Ingesta(NamedTuple):
+    path: str
+    vector: np.ndarray      # color y pHash (texto en cero), para indexar sin volver a decodificar
+    duplicados: list        # [(prenda_id, distancia)]
+
+def analizar(path: str) -> tuple:
+    """Valida un archivo recibido y calcula su vector de similitud. Devuelve (extensión, vector).
+
+    Formato y dimensiones salen del encabezado: una imagen enorme se rechaza antes de decodificarla."""
+    with open(path, "rb") as f:
+        ext = EXTENSIONES.get(get_mime_type_bytes(f.read(12)))
+    if not ext:
+        raise HTTPException(status_code=415, detail="La imagen tiene que ser JPEG, PNG o WebP")
+    try:
+        with Image.open(path) as img:
+            ancho, alto = img.size
+    except Exception:
+        raise HTTPException(status_code=400, detail="La imagen de la prenda no es válida")
+    if min(ancho, alto) < PRENDA_MIN_LADO or ancho * alto > PRENDA_MAX_PIXELES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"La imagen mide {ancho}x{alto}: el lado menor tiene que ser de al menos {PRENDA_MIN_LADO} px "
+                   f"y el total no pasar de {PRENDA_MAX_PIXELES} píxeles",
+        )
+    try:
+        return ext, vector_archivo(path, "")
+    except Exception:
+        raise HTTPException(status_code=400, detail="La imagen de la prenda no es válida")
+
+def buscar_duplicados(vector: np.ndarray, excluir: str = None) -> list:
+    return [d for d in indice_similitud.duplicados(vector, DUPLICADO_MAX_HAMMING, DUPLICADO_MIN_COLOR) if d[0] != excluir]
+
+def detalle_duplicados(duplicados: list) -> list:
+    return [{"id": prenda_id, "distancia": distancia} for prenda_id, distancia in duplicados]
+
+async def imagen_de(duplicados: list):
+    """La imagen de la prenda más parecida que siga en el catálogo (el índice puede estar atrasado)."""
+    ids = [ObjectId(prenda_id) for prenda_id, _ in duplicados]
+    docs = await get_db()["prendas"].find({"_id": {"$in": ids}, "image_path": {"$ne": None}}, {"image_path": 1}).to_list(None)
+    por_id = {str(d["_id"]): d["image_path"] for d in docs}
+    return next((por_id[i] for i, _ in duplicados if i in por_id), None)
+
+async def ingerir_upload(file: UploadFile, politica: str = "avisar", excluir: str = None) -> Ingesta:
+    """Carga la imagen de una prenda al almacén: la copia por bloques con el hash en la misma pasada
+    y un tope de bytes, la valida y busca casi duplicados en el índice de similitud antes de
+    publicarla. `excluir` es la prenda que se está editando (su imagen anterior no cuenta)."""
+    tmp, sha = await run_in_threadpool(almacen.recibir, file.file, UPLOAD_MAX_BYTES)
+    try:
+        ext, vector = await en_pool_imagenes(analizar, tmp)
+        duplicados = await run_in_threadpool(buscar_duplicados, vector, excluir)
+        path = None
+        if duplicados and politica == "rechazar":
+            raise HTTPException(status_code=409, detail={
+                "msg": "Ya hay una prenda con una imagen casi igual", "duplicados": detalle_duplicados(duplicados),
+            })
+        if duplicados and politica == "reutilizar":
+            path = await imagen_de(duplicados)
+        if path is None:
+            path = await run_in_threadpool(almacen.publicar, tmp, sha, ext)
+        return Ingesta(path, vector, duplicados)
+    finally:
+        # publicar ya lo movió o lo borró; si no llegó a correr (error, duplicado reutilizado) queda acá
+        try:
+            os.remove(tmp)
+        except FileNotFoundError:
+            pass
@@ -0,0 +1,36 @@
+import os
+
+try:
+    import fcntl
+except ImportError:  # Windows: un solo proceso, siempre es líder
+    fcntl = None
+
+from config import LIDER_LOCK
+
+class Lider:
+    """Elige un solo proceso entre los workers para las tareas periódicas, con un flock sobre un
+    archivo. El que lo toma lo conserva mientras viva; si muere, el kernel suelta el lock y lo toma
+    el primero que vuelva a preguntar."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._fd = None
+
+    def soy_lider(self) -> bool:
+        if self._fd is not None or fcntl is None:
+            return True
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            os.close(fd)
+            return False
+        self._fd = fd
+        return True
+
+    def soltar(self):
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+lider = Lider(LIDER_LOCK)
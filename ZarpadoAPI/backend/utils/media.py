@@ -0,0 +1,34 @@
+import os
+
+from fastapi.staticfiles import StaticFiles
+from starlette.datastructures import Headers
+from starlette.responses import FileResponse
+from starlette.staticfiles import NotModifiedResponse
+
+from utils.almacen import sha_de
+from utils.variantes import PATRON_VARIANTE
+
+CACHE_INMUTABLE = "public, max-age=31536000, immutable"
+
+class MediaStaticFiles(StaticFiles):
+    """StaticFiles para /media con headers de cache según el tipo de archivo.
+
+    Las variantes y los objetos del almacén llevan el hash del contenido en el nombre: se cachean
+    un año y su ETag es ese hash. El resto (archivos anteriores al almacén) se revalida siempre
+    con If-None-Match / If-Modified-Since y se responde 304 si no cambió.
+    """
+
+    def file_response(self, full_path, stat_result: os.stat_result, scope, status_code: int = 200):
+        headers = {"cache-control": "no-cache"}
+        variante = PATRON_VARIANTE.search(os.fspath(full_path))
+        sha = sha_de(os.fspath(full_path))
+        if variante:
+            tamanio, hash_original, ext = variante.groups()
+            headers = {"cache-control": CACHE_INMUTABLE, "etag": f'"{hash_original}-{tamanio}-{ext}"'}
+        elif sha:
+            headers = {"cache-control": CACHE_INMUTABLE, "etag": f'"{sha}"'}
+
+        response = FileResponse(full_path, status_code=status_code, stat_result=stat_result, headers=headers)
+        if self.is_not_modified(response.headers, Headers(scope=scope)):
+            return NotModifiedResponse(response.headers)
+        return response
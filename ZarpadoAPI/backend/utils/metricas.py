@@ -0,0 +1,290 @@
+import bisect
+import os
+import sys
+import threading
+import time
+from collections import Counter, deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from pymongo import monitoring
+
+from config import SERVER_TIMING, PERFILADOR_UMBRAL_MS, PERFILADOR_INTERVALO_MS, PERFILADOR_DIR
+
+# Buckets (segundos) pensados para el rango de esta API: desde lecturas de Mongo de milisegundos
+# hasta generaciones de imagen de decenas de segundos
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 40, 80)
+
+class Histograma:
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.cuentas = [0] * (len(buckets) + 1)
+        self.suma = 0.0
+        self.total = 0
+
+    def observar(self, valor: float):
+        self.cuentas[bisect.bisect_left(self.buckets, valor)] += 1
+        self.suma += valor
+        self.total += 1
+
+def _escapar(valor) -> str:
+    return str(valor).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _etiquetas(etiquetas: dict) -> str:
+    if not etiquetas:
+        return ""
+    return "{" + ",".join(f'{k}="{_escapar(v)}"' for k, v in etiquetas.items()) + "}"
+
+class RegistroMetricas:
+    """Histogramas y contadores en memoria, exportados en el formato de texto de Prometheus.
+
+    Las métricas que ya llevan otros módulos (cola de trabajos, planificador, pools) no se copian
+    acá: se leen al exportar con las funciones registradas en `medidores`.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._histogramas = {}
+        self._ayuda = {}
+        self.medidores = []
+
+    def observar(self, nombre: str, valor: float, ayuda: str = "", **etiquetas):
+        clave = (nombre, tuple(sorted(etiquetas.items())))
+        with self._lock:
+            h = self._histogramas.get(clave)
+            if h is None:
+                h = self._histogramas[clave] = Histograma()
+                self._ayuda.setdefault(nombre, ayuda)
+            h.observar(valor)
+
+    def medidor(self, fn):
+        """Registra `fn() -> [(nombre, tipo, ayuda, {etiquetas}, valor), ...]`, que se llama en cada export."""
+        self.medidores.append(fn)
+        return fn
+
+    def exportar(self) -> str:
+        lineas = []
+        with self._lock:
+            histogramas = sorted(self._histogramas.items())
+            vistos = set()
+            for (nombre, etiquetas), h in histogramas:
+                if nombre not in vistos:
+                    vistos.add(nombre)
+                    lineas += [f"# HELP {nombre} {self._ayuda[nombre]}", f"# TYPE {nombre} histogram"]
+                base = dict(etiquetas)
+                acumulado = 0
+                for limite, cuenta in zip([*h.buckets, "+Inf"], h.cuentas):
+                    acumulado += cuenta
+                    lineas.append(f"{nombre}_bucket{_etiquetas({**base, 'le': limite})} {acumulado}")
+                lineas.append(f"{nombre}_sum{_etiquetas(base)} {h.suma:.6f}")
+                lineas.append(f"{nombre}_count{_etiquetas(base)} {h.total}")
+
+        tipos = {}
+        for fn in self.medidores:
+            try:
+                valores = fn()
+            except Exception as e:
+                print(f"⚠️ No se pudieron leer métricas de {fn.__name__}: {e}")
+                continue
+            for nombre, tipo, ayuda, etiquetas, valor in valores:
+                if nombre not in tipos:
+                    tipos[nombre] = tipo
+                    lineas += [f"# HELP {nombre} {ayuda}", f"# TYPE {nombre} {tipo}"]
+                lineas.append(f"{nombre}{_etiquetas(etiquetas)} {valor}")
+        return "\n".join(lineas) + "\n"
+
+metricas = RegistroMetricas()
+
+# Spans del request en curso: lista de (etapa, segundos). Las tareas hijas (probar_prenda/lote)
+# heredan la misma lista, así que sus etapas también suman.
+_spans = ContextVar("spans", default=None)
+
+@contextmanager
+def span(etapa: str):
+    """Mide una etapa: va al histograma `zarpado_etapa_segundos` y al Server-Timing del request."""
+    inicio = time.perf_counter()
+    try:
+        yield
+    finally:
+        duracion = time.perf_counter() - inicio
+        metricas.observar("zarpado_etapa_segundos", duracion, "Duración de cada etapa instrumentada", etapa=etapa)
+        spans = _spans.get()
+        if spans is not None:
+            spans.append((etapa, duracion))
+
+def server_timing(spans: list, total: float) -> str:
+    """Una entrada por etapa (las repetidas se suman) más el total, en milisegundos."""
+    suma = {}
+    for etapa, duracion in spans:
+        suma[etapa] = suma.get(etapa, 0) + duracion
+    partes = [f"{etapa};dur={d * 1000:.1f}" for etapa, d in suma.items()]
+    partes.append(f"total;dur={total * 1000:.1f}")
+    return ", ".join(partes)
+
+class Perfilador:
+    """Profiler por muestreo para requests lentos (opt-in con PERFILADOR_UMBRAL_MS).
+
+    Un hilo toma cada `intervalo` ms el stack de todos los hilos y lo guarda en un buffer circular.
+    Cuando un request termina por encima del umbral, se juntan las muestras de su ventana de tiempo
+    en formato "folded" (una línea por stack con su cantidad, lo que leen flamegraph.pl y speedscope)
+    y se escriben en PERFILADOR_DIR. Con requests concurrentes las muestras se mezclan: sirve para
+    ver dónde se va el tiempo del proceso mientras ese request estaba lento.
+    """
+
+    def __init__(self, umbral_ms: int, intervalo_ms: int, directorio: str):
+        self.umbral = umbral_ms / 1000
+        self.intervalo = intervalo_ms / 1000
+        self.directorio = directorio
+        self._muestras = deque(maxlen=int(120 / max(self.intervalo, 0.001)))
+        self._hilo = None
+        self._parar = threading.Event()
+
+    @property
+    def activo(self) -> bool:
+        return self.umbral > 0
+
+    def iniciar(self):
+        if not self.activo or self._hilo:
+            return
+        os.makedirs(self.directorio, exist_ok=True)
+        self._parar.clear()
+        self._hilo = threading.Thread(target=self._muestrear, name="perfilador", daemon=True)
+        self._hilo.start()
+
+    def detener(self):
+        if self._hilo:
+            self._parar.set()
+            self._hilo.join()
+            self._hilo = None
+
+    def _muestrear(self):
+        propio = threading.get_ident()
+        while not self._parar.wait(self.intervalo):
+            nombres = {t.ident: t.name for t in threading.enumerate()}
+            ahora = time.perf_counter()
+            for ident, frame in sys._current_frames().items():
+                # Hilos del pool esperando trabajo: no aportan nada al perfil
+                if ident == propio or os.path.basename(frame.f_code.co_filename) in ("threading.py", "queue.py", "thread.py"):
+                    continue
+                pila = []
+                while frame is not None:
+                    pila.append(f"{frame.f_code.co_name} ({os.path.basename(frame.f_code.co_filename)}:{frame.f_lineno})")
+                    frame = frame.f_back
+                pila.append(nombres.get(ident, str(ident)))
+                self._muestras.append((ahora, ";".join(reversed(pila))))
+
+    def revisar(self, ruta: str, inicio: float, duracion: float):
+        """Llamado al terminar cada request (con tiempos de perf_counter)."""
+        if not self.activo or duracion < self.umbral:
+            return
+        fin = inicio + duracion
+        pilas = Counter(p for t, p in list(self._muestras) if inicio <= t <= fin)
+        if not pilas:
+            return
+        nombre = f"{time.strftime('%Y%m%d-%H%M%S')}_{ruta.strip('/').replace('/', '_') or 'raiz'}_{duracion * 1000:.0f}ms.folded"
+        try:
+            with open(os.path.join(self.directorio, nombre), "w", encoding="utf-8") as f:
+                f.writelines(f"{pila} {n}\n" for pila, n in pilas.most_common())
+            print(f"⚠️ Request lento ({duracion * 1000:.0f} ms) en {ruta}: perfil en {nombre}")
+        except OSError as e:
+            print(f"❌ No se pudo guardar el perfil de {ruta}: {e}")
+
+perfilador = Perfilador(PERFILADOR_UMBRAL_MS, PERFILADOR_INTERVALO_MS, PERFILADOR_DIR)
+
+class MiddlewareMetricas:
+    """Middleware ASGI: latencia por ruta (plantilla, no la URL concreta), requests en curso,
+    Server-Timing con los spans del request y aviso al perfilador. Es ASGI puro para no romper las
+    respuestas en streaming (NDJSON, SSE); en esas el Server-Timing trae lo medido hasta el primer byte.
+    """
+
+    en_curso = 0
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        spans = []
+        token = _spans.set(spans)
+        inicio = time.perf_counter()
+        estado = {"codigo": 500}
+
+        async def enviar(mensaje):
+            if mensaje["type"] == "http.response.start":
+                estado["codigo"] = mensaje["status"]
+                if SERVER_TIMING:
+                    encabezado = server_timing(spans, time.perf_counter() - inicio).encode("latin-1")
+                    mensaje = {**mensaje, "headers": [*mensaje.get("headers", []), (b"server-timing", encabezado)]}
+            await send(mensaje)
+
+        MiddlewareMetricas.en_curso += 1
+        try:
+            await self.app(scope, receive, enviar)
+        finally:
+            MiddlewareMetricas.en_curso -= 1
+            _spans.reset(token)
+            duracion = time.perf_counter() - inicio
+            route = scope.get("route")
+            ruta = getattr(route, "path", None) or "sin_ruta"
+            metricas.observar(
+                "zarpado_http_duracion_segundos", duracion, "Latencia de los requests HTTP por ruta",
+                metodo=scope["method"], ruta=ruta, estado=estado["codigo"],
+            )
+            perfilador.revisar(ruta, inicio, duracion)
+
+class PoolMongo(monitoring.ConnectionPoolListener):
+    """Cuenta conexiones del pool de pymongo/motor (no hay API pública para leerlo)."""
+
+    def __init__(self):
+        self.abiertas = 0
+        self.en_uso = 0
+        self.esperas_fallidas = 0
+
+    def connection_created(self, event):
+        self.abiertas += 1
+
+    def connection_closed(self, event):
+        self.abiertas -= 1
+
+    def connection_checked_out(self, event):
+        self.en_uso += 1
+
+    def connection_checked_in(self, event):
+        self.en_uso -= 1
+
+    def connection_check_out_failed(self, event):
+        self.esperas_fallidas += 1
+
+    # El resto de los eventos no hace falta contarlos
+    def connection_check_out_started(self, event):
+        pass
+
+    def connection_ready(self, event):
+        pass
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
+pool_mongo = PoolMongo()
+
+@metricas.medidor
+def _medidores_http():
+    return [("zarpado_http_en_curso", "gauge", "Requests HTTP en curso", {}, MiddlewareMetricas.en_curso)]
+
+@metricas.medidor
+def _medidores_mongo():
+    return [
+        ("zarpado_mongo_conexiones", "gauge", "Conexiones abiertas en el pool de Mongo", {}, pool_mongo.abiertas),
+        ("zarpado_mongo_conexiones_en_uso", "gauge", "Conexiones de Mongo prestadas a una operación", {}, pool_mongo.en_uso),
+        ("zarpado_mongo_esperas_fallidas_total", "counter", "Pedidos de conexión a Mongo que fallaron o vencieron", {}, pool_mongo.esperas_fallidas),
+    ]
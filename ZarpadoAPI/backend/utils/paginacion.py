@@ -0,0 +1,28 @@
+from bson.objectid import ObjectId
+from bson.errors import InvalidId
+from fastapi import HTTPException, Query, Response
+
+from config import LISTADO_LIMITE_DEFAULT, LISTADO_LIMITE_MAX
+
+def parametros_pagina(
+    limit: int = Query(LISTADO_LIMITE_DEFAULT, ge=1, le=LISTADO_LIMITE_MAX),
+    cursor: str = Query(None, description="Valor de X-Next-Cursor de la página anterior"),
+):
+    return {"limit": limit, "cursor": cursor}
+
+async def paginar(coleccion, filtro: dict, proyeccion: dict, pagina: dict, response: Response) -> list:
+    """Paginación por cursor (keyset) sobre `_id`: no usa skip, así que cada página cuesta lo mismo
+    sin importar qué tan adelante esté. Si hay más resultados deja el cursor en `X-Next-Cursor`."""
+    limit = pagina["limit"]
+    if pagina["cursor"]:
+        try:
+            filtro = {**filtro, "_id": {"$gt": ObjectId(pagina["cursor"])}}
+        except InvalidId:
+            raise HTTPException(status_code=400, detail="Cursor inválido")
+    docs = await coleccion.find(filtro, proyeccion).sort("_id", 1).limit(limit + 1).to_list(limit + 1)
+    if len(docs) > limit:
+        docs = docs[:limit]
+        response.headers["X-Next-Cursor"] = str(docs[-1]["_id"])
+    for d in docs:
+        d["id"] = str(d.pop("_id"))
+    return docs
@@ -0,0 +1,289 @@
+import asyncio
+import heapq
+import itertools
+import random
+import time
+from collections import deque
+
+import httpx
+from fastapi import HTTPException
+from fastapi.concurrency import run_in_threadpool
+
+# Carriles: menor número pasa primero cuando hay que esperar cuota
+INTERACTIVA = 0
+BACKFILL = 1
+
+class CubetaTokens:
+    """Token bucket con cola por prioridad. `por_minuto` <= 0 desactiva el límite."""
+
+    def __init__(self, por_minuto: float, rafaga: int):
+        self.tasa = por_minuto / 60
+        self.capacidad = max(1, rafaga)
+        self.tokens = float(self.capacidad)
+        self._ultimo = time.monotonic()
+        self._espera = []
+        self._orden = itertools.count()
+        self._timer = None
+
+    def _recargar(self):
+        ahora = time.monotonic()
+        self.tokens = min(self.capacidad, self.tokens + (ahora - self._ultimo) * self.tasa)
+        self._ultimo = ahora
+
+    async def adquirir(self, prioridad: int, timeout: float):
+        if self.tasa <= 0:
+            return
+        self._recargar()
+        if not self._espera and self.tokens >= 1:
+            self.tokens -= 1
+            return
+        turno = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._espera, (prioridad, next(self._orden), turno))
+        self._programar()
+        await asyncio.wait_for(turno, max(0, timeout))
+
+    def _programar(self):
+        if self._timer is None:
+            falta = max(0.0, (1 - self.tokens) / self.tasa)
+            self._timer = asyncio.get_running_loop().call_later(falta, self._despertar)
+
+    def _despertar(self):
+        self._timer = None
+        self._recargar()
+        while self._espera and self.tokens >= 1:
+            _, _, turno = heapq.heappop(self._espera)
+            # Los que vencieron o se cancelaron mientras esperaban no consumen token
+            if not turno.done():
+                turno.set_result(None)
+                self.tokens -= 1
+        while self._espera and self._espera[0][2].done():
+            heapq.heappop(self._espera)
+        if self._espera:
+            self._programar()
+
+    def en_espera(self) -> int:
+        return sum(1 for _, _, t in self._espera if not t.done())
+
+class Circuito:
+    """Circuit breaker: tras `fallos_max` fallas seguidas del proveedor rechaza llamadas durante
+    `espera` segundos; después deja pasar una de prueba y según cómo le vaya cierra o reabre."""
+
+    def __init__(self, fallos_max: int, espera: float):
+        self.fallos_max = fallos_max
+        self.espera = espera
+        self.estado = "cerrado"
+        self.fallos = 0
+        self._abierto_hasta = 0.0
+        self._probando = False
+
+    def permitir(self) -> bool:
+        if self.estado == "cerrado":
+            return True
+        if self.estado == "abierto" and time.monotonic() >= self._abierto_hasta:
+            self.estado = "semiabierto"
+        if self.estado == "semiabierto" and not self._probando:
+            self._probando = True
+            return True
+        return False
+
+    def exito(self):
+        self.estado = "cerrado"
+        self.fallos = 0
+        self._probando = False
+
+    def fallo(self):
+        self.fallos += 1
+        self._probando = False
+        if self.estado == "semiabierto" or self.fallos >= self.fallos_max:
+            self.estado = "abierto"
+            self._abierto_hasta = time.monotonic() + self.espera
+
+    def soltar(self):
+        """La llamada de prueba no llegó al proveedor (venció esperando cuota)."""
+        self._probando = False
+
+    def reintentar_en(self) -> int:
+        return max(1, int(self._abierto_hasta - time.monotonic()) + 1)
+
+class Metricas:
+    def __init__(self, muestras: int = 1000):
+        self.llamadas = 0
+        self.exitos = 0
+        self.fallos = 0
+        self.reintentos = 0
+        self.coalescidas = 0
+        self.rechazadas_circuito = 0
+        self.deadlines = 0
+        self.en_curso = 0
+        self._esperas = deque(maxlen=muestras)
+
+    def registrar_espera(self, segundos: float):
+        self._esperas.append(segundos * 1000)
+
+    def percentil(self, p: float):
+        esperas = sorted(self._esperas)
+        return round(esperas[min(len(esperas) - 1, int(len(esperas) * p))], 1) if esperas else None
+
+    def to_dict(self) -> dict:
+        return {
+            "llamadas": self.llamadas,
+            "exitos": self.exitos,
+            "fallos": self.fallos,
+            "reintentos": self.reintentos,
+            "coalescidas": self.coalescidas,
+            "rechazadas_circuito": self.rechazadas_circuito,
+            "deadlines": self.deadlines,
+            "en_curso": self.en_curso,
+            "espera_cola_ms": {"p50": self.percentil(0.5), "p95": self.percentil(0.95), "max": self.percentil(1)},
+        }
+
+def _codigo_error(e: Exception):
+    return getattr(e, "code", None) if isinstance(getattr(e, "code", None), int) else getattr(e, "status_code", None)
+
+def es_reintentable(e: Exception) -> bool:
+    codigo = _codigo_error(e)
+    if isinstance(codigo, int):
+        return codigo in (408, 429) or codigo >= 500
+    return isinstance(e, (TimeoutError, ConnectionError, httpx.TimeoutException, httpx.TransportError))
+
+def es_timeout(e: Exception) -> bool:
+    return isinstance(e, (TimeoutError, httpx.TimeoutException))
+
+def _retry_after(e: Exception):
+    headers = getattr(getattr(e, "response", None), "headers", None) or {}
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+class _Modelo:
+    def __init__(self, por_minuto: float, rafaga: int, fallos_max: int, espera_circuito: float):
+        self.cubeta = CubetaTokens(por_minuto, rafaga)
+        self.circuito = Circuito(fallos_max, espera_circuito)
+        self.metricas = Metricas()
+
+class PlanificadorModelos:
+    """Capa entre la app y el cliente del modelo: cuota por modelo (token bucket con carriles de
+    prioridad), deadline por llamada, reintentos con backoff y jitter, circuit breaker y
+    single-flight para pedidos idénticos en curso. `fn` es la llamada bloqueante del SDK y corre
+    en el threadpool. Un hilo no se puede cortar desde afuera, así que el deadline no se aplica
+    con wait_for (dejaría el hilo ocupado y la llamada corriendo): `fn` recibe `timeout`, los
+    segundos que le quedan, y tiene que pasarlo a su request HTTP.
+    """
+
+    def __init__(self, limites: dict, reintentos: int, backoff_base: float, backoff_max: float,
+                 deadlines: dict, fallos_circuito: int, espera_circuito: float):
+        self.reintentos = reintentos
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.deadlines = deadlines
+        self._limites = limites
+        self._fallos_circuito = fallos_circuito
+        self._espera_circuito = espera_circuito
+        self._modelos = {}
+        self._en_vuelo = {}
+
+    def _modelo(self, nombre: str) -> _Modelo:
+        if nombre not in self._modelos:
+            por_minuto, rafaga = self._limites.get(nombre, (0, 1))
+            self._modelos[nombre] = _Modelo(por_minuto, rafaga, self._fallos_circuito, self._espera_circuito)
+        return self._modelos[nombre]
+
+    async def llamar(self, modelo: str, fn, *args, prioridad: int = INTERACTIVA, deadline: float = None,
+                     clave: str = None, **kwargs):
+        """Ejecuta `fn(*args, **kwargs)` respetando los límites de `modelo`. Con `clave`, los pedidos
+        iguales que lleguen mientras hay uno en curso esperan ese mismo resultado."""
+        if clave is None:
+            return await self._ejecutar(modelo, fn, args, kwargs, prioridad, deadline)
+        clave = f"{modelo}:{clave}"
+        tarea = self._en_vuelo.get(clave)
+        if tarea is not None:
+            self._modelo(modelo).metricas.coalescidas += 1
+        else:
+            tarea = asyncio.create_task(self._ejecutar(modelo, fn, args, kwargs, prioridad, deadline))
+            self._en_vuelo[clave] = tarea
+            tarea.add_done_callback(lambda t: self._terminar(clave, t))
+        # shield: si un cliente se va, la llamada sigue para los demás que esperan lo mismo
+        return await asyncio.shield(tarea)
+
+    def _terminar(self, clave: str, tarea: asyncio.Task):
+        self._en_vuelo.pop(clave, None)
+        if not tarea.cancelled():
+            tarea.exception()
+
+    async def _invocar(self, m: _Modelo, fn, args, kwargs, limite: float):
+        m.metricas.en_curso += 1
+        try:
+            return await run_in_threadpool(fn, *args, timeout=limite - time.monotonic(), **kwargs)
+        finally:
+            m.metricas.en_curso -= 1
+
+    async def _ejecutar(self, modelo: str, fn, args, kwargs, prioridad: int, deadline: float):
+        m = self._modelo(modelo)
+        m.metricas.llamadas += 1
+        limite = time.monotonic() + (deadline or self.deadlines.get(prioridad, 60))
+        for intento in range(self.reintentos + 1):
+            if not m.circuito.permitir():
+                m.metricas.rechazadas_circuito += 1
+                raise HTTPException(
+                    status_code=503,
+                    detail="El servicio de IA no está disponible, probá de nuevo en unos minutos",
+                    headers={"Retry-After": str(m.circuito.reintentar_en())},
+                )
+            inicio = time.monotonic()
+            try:
+                await m.cubeta.adquirir(prioridad, limite - inicio)
+            except asyncio.TimeoutError:
+                m.circuito.soltar()
+                m.metricas.deadlines += 1
+                raise HTTPException(status_code=504, detail="Se agotó el tiempo esperando cuota del servicio de IA")
+            m.metricas.registrar_espera(time.monotonic() - inicio)
+            if time.monotonic() >= limite:
+                m.circuito.soltar()
+                m.metricas.deadlines += 1
+                raise HTTPException(status_code=504, detail="Se agotó el tiempo esperando cuota del servicio de IA")
+
+            try:
+                resultado = await self._invocar(m, fn, args, kwargs, limite)
+            except Exception as e:
+                if not es_reintentable(e):
+                    # Error del pedido (4xx), no del proveedor: no cuenta para el circuito
+                    m.circuito.soltar()
+                    m.metricas.fallos += 1
+                    raise
+                codigo = _codigo_error(e)
+                if codigo != 429:
+                    m.circuito.fallo()
+                else:
+                    m.circuito.soltar()
+                espera = random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** intento))
+                espera = max(espera, _retry_after(e) or 0)
+                if intento == self.reintentos or time.monotonic() + espera >= limite:
+                    m.metricas.fallos += 1
+                    print(f"❌ {modelo}: falló tras {intento + 1} intentos: {e}")
+                    if es_timeout(e):
+                        m.metricas.deadlines += 1
+                        raise HTTPException(status_code=504, detail="El servicio de IA tardó demasiado en responder")
+                    if codigo == 429:
+                        raise HTTPException(status_code=503, detail="Se superó la cuota del servicio de IA, probá de nuevo en unos segundos",
+                                            headers={"Retry-After": str(int(espera) + 1)})
+                    raise HTTPException(status_code=502, detail="El servicio de IA respondió con error")
+                m.metricas.reintentos += 1
+                await asyncio.sleep(espera)
+                continue
+
+            m.circuito.exito()
+            m.metricas.exitos += 1
+            return resultado
+
+    def estadisticas(self) -> dict:
+        return {
+            nombre: {
+                **m.metricas.to_dict(),
+                "circuito": m.circuito.estado,
+                "tokens": round(m.cubeta.tokens, 2),
+                "en_espera": m.cubeta.en_espera(),
+                "en_vuelo": sum(1 for c in self._en_vuelo if c.startswith(f"{nombre}:")),
+            }
+            for nombre, m in self._modelos.items()
+        }
@@ -0,0 +1,327 @@
+import asyncio
+import time
+from collections import Counter, OrderedDict, deque
+from datetime import datetime, timezone
+
+from bson.objectid import ObjectId
+from pymongo import ReplaceOne, UpdateOne
+
+from config import (
+    RECOMENDACIONES_K, RECOMENDACIONES_INTERVALO, RECOMENDACIONES_CACHE_TTL, RECOMENDACIONES_CACHE_ITEMS,
+    INTERACCIONES_LOTE, INTERACCIONES_FLUSH, INTERACCIONES_MAX_PENDIENTES,
+)
+from db import neo4j
+from db.mongo import get_db
+from utils.lider import lider
+
+# Tipo de relación en el grafo -> peso para la popularidad y el puntaje de co-ocurrencia
+PESOS = {"PROBO": 1, "FAVORITO": 2}
+
+# El tipo de relación no se puede parametrizar en Cypher: una consulta por tipo
+CONSULTAS_INTERACCION = {
+    tipo: f"""
+    UNWIND $filas AS f
+    MERGE (u:Usuario {{id: f.user_id}})
+    MERGE (p:Prenda {{id: f.prenda_id}})
+    MERGE (u)-[r:{tipo}]->(p)
+    SET r.veces = coalesce(r.veces, 0) + f.veces, r.ultima = timestamp()
+    """
+    for tipo in PESOS
+}
+
+# Un favorito quitado deja de contar: se borra la relación (una prueba de la misma prenda queda)
+CONSULTA_QUITAR_FAVORITO = """
+UNWIND $filas AS f
+MATCH (:Usuario {id: f.user_id})-[r:FAVORITO]->(:Prenda {id: f.prenda_id})
+DELETE r
+"""
+
+PUNTAJE = "CASE type({r}) WHEN 'FAVORITO' THEN 2 ELSE 1 END"
+
+# "Quienes probaron/guardaron esta prenda también probaron/guardaron..." por lotes de prendas
+CONSULTA_TOP_PRENDA = f"""
+MATCH (p:Prenda) WHERE p.id > $desde
+WITH p ORDER BY p.id LIMIT $lote
+OPTIONAL MATCH (p)<-[r1:PROBO|FAVORITO]-(:Usuario)-[r2:PROBO|FAVORITO]->(q:Prenda)
+WHERE q <> p
+WITH p, q, sum({PUNTAJE.format(r="r1")} * {PUNTAJE.format(r="r2")}) AS puntaje
+ORDER BY p.id, puntaje DESC
+WITH p, collect(CASE WHEN q IS NULL THEN NULL ELSE q.id END)[..$k] AS top
+RETURN p.id AS id, top
+"""
+
+# Prendas de usuarios con gustos parecidos que el usuario todavía no probó ni guardó
+CONSULTA_TOP_USUARIO = f"""
+MATCH (u:Usuario) WHERE u.id > $desde
+WITH u ORDER BY u.id LIMIT $lote
+OPTIONAL MATCH (u)-[:PROBO|FAVORITO]->(:Prenda)<-[:PROBO|FAVORITO]-(o:Usuario)-[r:PROBO|FAVORITO]->(q:Prenda)
+WHERE o <> u AND NOT (u)-[:PROBO|FAVORITO]->(q)
+WITH u, q, sum({PUNTAJE.format(r="r")}) AS puntaje
+ORDER BY u.id, puntaje DESC
+WITH u, collect(CASE WHEN q IS NULL THEN NULL ELSE q.id END)[..$k] AS top
+RETURN u.id AS id, top
+"""
+
+class CacheTTL:
+    """Dict con vencimiento y tope de elementos (LRU). Solo se usa desde el event loop."""
+
+    def __init__(self, ttl: int, max_items: int):
+        self.ttl = ttl
+        self.max_items = max_items
+        self._datos = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def obtener(self, clave):
+        entrada = self._datos.get(clave)
+        if entrada is None or entrada[0] < time.monotonic():
+            self._datos.pop(clave, None)
+            self.misses += 1
+            return None
+        self._datos.move_to_end(clave)
+        self.hits += 1
+        return entrada[1]
+
+    def guardar(self, clave, valor):
+        self._datos[clave] = (time.monotonic() + self.ttl, valor)
+        self._datos.move_to_end(clave)
+        if len(self._datos) > self.max_items:
+            self._datos.popitem(last=False)
+
+    def invalidar(self, clave):
+        self._datos.pop(clave, None)
+
+    def limpiar(self):
+        self._datos.clear()
+
+    def __len__(self):
+        return len(self._datos)
+
+async def _leer(tx, consulta: str, **params) -> list:
+    resultado = await tx.run(consulta, **params)
+    return await resultado.data()
+
+async def _escribir(tx, consulta: str, **params):
+    resultado = await tx.run(consulta, **params)
+    await resultado.consume()
+
+class MotorRecomendaciones:
+    """Sincroniza interacciones con Neo4j y precalcula los top-K en la colección `recomendaciones`.
+
+    Servir una recomendación nunca consulta el grafo: se lee la lista precalculada (cacheada
+    en memoria) y, si no hay, se cae a las prendas más populares de Mongo. Así la latencia no
+    depende del tamaño del grafo y todo sigue andando si Neo4j está caído.
+
+    Lo que el usuario ya probó o guardó se copia en su documento (`interacciones`) en el mismo
+    volcado que la popularidad, para sacarlo también de las populares. Hasta que se vuelca, las
+    interacciones nuevas se excluyen desde memoria (`vistas_pendientes`).
+    """
+
+    def __init__(self, k: int, intervalo: int, lote: int, flush: float, max_pendientes: int):
+        self.k = k
+        self.intervalo = intervalo
+        self.lote = lote
+        self.flush = flush
+        self.max_pendientes = max_pendientes
+        self.cache = CacheTTL(RECOMENDACIONES_CACHE_TTL, RECOMENDACIONES_CACHE_ITEMS)
+        self.ultimo_calculo = None
+        self._nuevas = deque(maxlen=max_pendientes)
+        # Interacciones ya contadas en Mongo que todavía no llegaron al grafo (se acumulan si Neo4j está caído)
+        self._grafo = Counter()
+        # Favoritos quitados: por volcar y por borrar del grafo
+        self._bajas = set()
+        self._bajas_grafo = set()
+        self._vistas = {}         # user_id -> prendas con interacciones todavía no volcadas
+        self._hay_lote = asyncio.Event()
+        self._tasks = []
+
+    async def iniciar(self):
+        self._tasks = [asyncio.create_task(self._volcar_periodicamente())]
+        if self.intervalo > 0:
+            self._tasks.append(asyncio.create_task(self._recalcular_periodicamente()))
+
+    async def detener(self):
+        for t in self._tasks:
+            t.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        await self.volcar()
+
+    def registrar(self, user_id: str, prenda_id: str, tipo: str):
+        """Anota una interacción sin esperar a ninguna base; se escribe en el próximo lote."""
+        self._nuevas.append((user_id, prenda_id, tipo))
+        if tipo == "FAVORITO":
+            self._bajas.discard((user_id, prenda_id))
+        self._vistas.setdefault(user_id, set()).add(prenda_id)
+        self.invalidar(user_id)
+        if len(self._nuevas) >= self.lote:
+            self._hay_lote.set()
+
+    def quitar_favorito(self, user_id: str, prenda_id: str):
+        """El usuario sacó de favoritos la única imagen que tenía de la prenda."""
+        self._bajas.add((user_id, prenda_id))
+        self.invalidar(user_id)
+
+    def invalidar(self, user_id: str):
+        self.cache.invalidar(f"usuario:{user_id}")
+        self.cache.invalidar(f"vistas:{user_id}")
+
+    def vistas_pendientes(self, user_id: str) -> set:
+        return self._vistas.get(user_id, set())
+
+    async def _volcar_periodicamente(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._hay_lote.wait(), self.flush)
+            except asyncio.TimeoutError:
+                pass
+            self._hay_lote.clear()
+            await self.volcar()
+
+    async def volcar(self):
+        nuevas = Counter()
+        while self._nuevas:
+            nuevas[self._nuevas.popleft()] += 1
+        bajas, self._bajas = self._bajas, set()
+        if nuevas or bajas:
+            await self._sumar_popularidad(nuevas, bajas)
+            await self._guardar_interacciones(nuevas, bajas)
+            self._grafo.update(nuevas)
+            for user_id, prenda_id in bajas:
+                # Si el alta todavía no llegó al grafo, no hace falta escribirla
+                self._grafo.pop((user_id, prenda_id, "FAVORITO"), None)
+            self._bajas_grafo |= bajas
+            if len(self._grafo) > self.max_pendientes:
+                # Neo4j lleva rato caído: se conservan las más repetidas
+                self._grafo = Counter(dict(self._grafo.most_common(self.max_pendientes)))
+        if (self._grafo or self._bajas_grafo) and neo4j.disponible():
+            await self._escribir_grafo()
+
+    async def _guardar_interacciones(self, nuevas: Counter, bajas: set):
+        """Copia en cada usuario qué prendas probó y cuáles tiene en favoritos."""
+        altas = {}
+        for user_id, prenda_id, tipo in nuevas:
+            altas.setdefault(user_id, {}).setdefault(f"interacciones.{tipo}", set()).add(prenda_id)
+        quitadas = {}
+        for user_id, prenda_id in bajas:
+            quitadas.setdefault(user_id, set()).add(prenda_id)
+        operaciones = [
+            UpdateOne({"_id": ObjectId(u)}, {"$addToSet": {c: {"$each": sorted(ids)} for c, ids in campos.items()}})
+            for u, campos in altas.items() if ObjectId.is_valid(u)
+        ] + [
+            UpdateOne({"_id": ObjectId(u)}, {"$pull": {"interacciones.FAVORITO": {"$in": sorted(ids)}}})
+            for u, ids in quitadas.items() if ObjectId.is_valid(u)
+        ]
+        if not operaciones:
+            return
+        try:
+            # En orden: un alta y una baja del mismo favorito en el mismo lote terminan en baja
+            await get_db()["usuarios"].bulk_write(operaciones)
+        except Exception as e:
+            print(f"❌ No se pudieron guardar las interacciones de {len(altas) + len(quitadas)} usuarios: {e}")
+            return
+        for user_id, prenda_id, _ in nuevas:
+            pendientes = self._vistas.get(user_id)
+            if pendientes is not None:
+                pendientes.discard(prenda_id)
+                if not pendientes:
+                    del self._vistas[user_id]
+        for user_id in altas.keys() | quitadas.keys():
+            self.invalidar(user_id)
+
+    async def _sumar_popularidad(self, interacciones: Counter, bajas: set = frozenset()):
+        popularidad = Counter()
+        for (_, prenda_id, tipo), veces in interacciones.items():
+            popularidad[prenda_id] += PESOS[tipo] * veces
+        for _, prenda_id in bajas:
+            popularidad[prenda_id] -= PESOS["FAVORITO"]
+        popularidad = {pid: n for pid, n in popularidad.items() if n and ObjectId.is_valid(pid)}
+        if not popularidad:
+            return
+        try:
+            await get_db()["prendas"].bulk_write(
+                [UpdateOne({"_id": ObjectId(pid)}, {"$inc": {"popularidad": n}}) for pid, n in popularidad.items()],
+                ordered=False,
+            )
+        except Exception as e:
+            print(f"❌ No se pudo actualizar la popularidad de {len(popularidad)} prendas: {e}")
+
+    async def _escribir_grafo(self):
+        pendientes = list(self._grafo.items())
+        try:
+            async with neo4j.get_neo4j_session() as session:
+                # Las bajas primero: un favorito quitado y vuelto a agregar después queda
+                if self._bajas_grafo:
+                    bajas = list(self._bajas_grafo)
+                    filas = [{"user_id": u, "prenda_id": p} for u, p in bajas]
+                    await session.execute_write(_escribir, CONSULTA_QUITAR_FAVORITO, filas=filas)
+                    self._bajas_grafo.difference_update(bajas)
+                for i in range(0, len(pendientes), self.lote):
+                    lote = pendientes[i:i + self.lote]
+                    for tipo, consulta in CONSULTAS_INTERACCION.items():
+                        filas = [
+                            {"user_id": u, "prenda_id": p, "veces": n}
+                            for (u, p, t), n in lote if t == tipo
+                        ]
+                        if filas:
+                            await session.execute_write(_escribir, consulta, filas=filas)
+                    for clave, n in lote:
+                        self._grafo[clave] -= n
+                        if self._grafo[clave] <= 0:
+                            del self._grafo[clave]
+        except Exception as e:
+            print(f"❌ No se pudieron escribir {len(self._grafo) + len(self._bajas_grafo)} interacciones en Neo4j: {e}")
+
+    async def _recalcular_periodicamente(self):
+        while True:
+            await asyncio.sleep(self.intervalo)
+            # Con varios workers recalcula uno solo; el volcado de interacciones lo hace cada uno
+            if lider.soy_lider():
+                await self.recalcular()
+
+    async def recalcular(self) -> bool:
+        """Recorre el grafo por lotes y guarda los top-K de cada prenda y cada usuario."""
+        if not neo4j.disponible():
+            return False
+        inicio = time.perf_counter()
+        total = 0
+        try:
+            async with neo4j.get_neo4j_session() as session:
+                for prefijo, consulta in (("prenda", CONSULTA_TOP_PRENDA), ("usuario", CONSULTA_TOP_USUARIO)):
+                    desde = ""
+                    while True:
+                        filas = await session.execute_read(_leer, consulta, desde=desde, lote=self.lote, k=self.k)
+                        if not filas:
+                            break
+                        ahora = datetime.now(timezone.utc)
+                        await get_db()["recomendaciones"].bulk_write(
+                            [ReplaceOne({"_id": f"{prefijo}:{f['id']}"}, {"items": f["top"], "calculado": ahora}, upsert=True)
+                             for f in filas],
+                            ordered=False,
+                        )
+                        total += len(filas)
+                        desde = filas[-1]["id"]
+        except Exception as e:
+            print(f"❌ Error recalculando recomendaciones: {e}")
+            return False
+        self.cache.limpiar()
+        self.ultimo_calculo = time.time()
+        print(f"✅ Recomendaciones recalculadas: {total} listas en {time.perf_counter() - inicio:.1f}s")
+        return True
+
+    async def precalculadas(self, clave: str) -> list:
+        doc = await get_db()["recomendaciones"].find_one({"_id": clave}, {"items": 1})
+        return doc["items"] if doc else []
+
+    def estadisticas(self) -> dict:
+        return {
+            "neo4j": neo4j.disponible(),
+            "pendientes": len(self._nuevas),
+            "pendientes_grafo": len(self._grafo) + len(self._bajas_grafo),
+            "ultimo_calculo": self.ultimo_calculo,
+            "cache": {"entradas": len(self.cache), "hits": self.cache.hits, "misses": self.cache.misses},
+        }
+
+recomendaciones = MotorRecomendaciones(
+    RECOMENDACIONES_K, RECOMENDACIONES_INTERVALO, INTERACCIONES_LOTE, INTERACCIONES_FLUSH, INTERACCIONES_MAX_PENDIENTES
+)
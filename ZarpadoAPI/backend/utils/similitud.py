@@ -0,0 +1,297 @@
+import os
+import re
+import threading
+import unicodedata
+import zlib
+from contextlib import contextmanager
+from io import BytesIO
+
+try:
+    import fcntl
+except ImportError:  # Windows: un solo proceso
+    fcntl = None
+
+import numpy as np
+from fastapi.concurrency import run_in_threadpool
+from PIL import Image, ImageOps
+
+from config import INDICE_SIMILITUD_DIR
+from utils.ejecutores import en_pool_imagenes
+
+# Bloques del vector (cada uno normalizado y escalado por la raíz de su peso, así el coseno
+# total es la suma ponderada de los cosenos de cada bloque)
+BINS_HSV = (12, 4, 2)
+DIM_COLOR = int(np.prod(BINS_HSV))
+DIM_PHASH = 64
+DIM_TEXTO = 96
+DIM = DIM_COLOR + DIM_PHASH + DIM_TEXTO
+PESOS = {"color": 0.5, "phash": 0.2, "texto": 0.3}
+
+LADO_COLOR = 64
+LADO_PHASH = 32
+
+def _matriz_dct(n: int) -> np.ndarray:
+    k = np.arange(n)[:, None]
+    i = np.arange(n)[None, :]
+    c = np.cos(np.pi * (2 * i + 1) * k / (2 * n)) * np.sqrt(2 / n)
+    c[0] /= np.sqrt(2)
+    return c.astype(np.float32)
+
+DCT = _matriz_dct(LADO_PHASH)
+
+def _unitario(v: np.ndarray, peso: float) -> np.ndarray:
+    norma = np.linalg.norm(v)
+    return v * (np.sqrt(peso) / norma) if norma > 0 else v
+
+def _histograma_color(img: Image.Image) -> np.ndarray:
+    # Solo el 60% central: en las fotos de catálogo el borde suele ser fondo
+    ancho, alto = img.size
+    recorte = img.crop((int(ancho * 0.2), int(alto * 0.2), int(ancho * 0.8), int(alto * 0.8)))
+    hsv = np.asarray(recorte.resize((LADO_COLOR, LADO_COLOR)).convert("HSV"), dtype=np.uint16)
+    # Corrido medio bin para que el rojo (tono ~0 y ~255) caiga en un solo bin
+    h = (hsv[..., 0] + 128 // BINS_HSV[0]) % 256 * BINS_HSV[0] // 256
+    s = hsv[..., 1] * BINS_HSV[1] // 256
+    v = hsv[..., 2] * BINS_HSV[2] // 256
+    indices = (h * BINS_HSV[1] + s) * BINS_HSV[2] + v
+    return np.bincount(indices.ravel(), minlength=DIM_COLOR).astype(np.float32)
+
+def _phash(img: Image.Image) -> np.ndarray:
+    gris = np.asarray(img.convert("L").resize((LADO_PHASH, LADO_PHASH), Image.LANCZOS), dtype=np.float32)
+    frecuencias = (DCT @ gris @ DCT.T)[:8, :8].ravel()
+    # ±1 por bit: el coseno entre dos hashes es 1 - 2 * hamming / 64
+    return np.where(frecuencias > np.median(frecuencias[1:]), 1.0, -1.0).astype(np.float32)
+
+def tokens(texto: str) -> list:
+    texto = unicodedata.normalize("NFKD", texto.lower()).encode("ascii", "ignore").decode()
+    return re.findall(r"[a-z0-9]{2,}", texto)
+
+def _texto(texto: str) -> np.ndarray:
+    v = np.zeros(DIM_TEXTO, dtype=np.float32)
+    palabras = tokens(texto)
+    # Unigramas y bigramas con hashing (signo para que las colisiones se compensen)
+    for t in palabras + [f"{a} {b}" for a, b in zip(palabras, palabras[1:])]:
+        h = zlib.crc32(t.encode())
+        v[h % DIM_TEXTO] += 1.0 if h & 0x80000000 else -1.0
+    return np.sign(v) * np.log1p(np.abs(v))
+
+def vector_prenda(contenido: bytes, texto: str) -> np.ndarray:
+    with Image.open(BytesIO(contenido)) as img:
+        if img.format == "JPEG":
+            img.draft("RGB", (LADO_COLOR * 2, LADO_COLOR * 2))
+        ImageOps.exif_transpose(img, in_place=True)
+        rgb = img.convert("RGB")
+    return np.concatenate([
+        _unitario(_histograma_color(rgb), PESOS["color"]),
+        _unitario(_phash(rgb), PESOS["phash"]),
+        _unitario(_texto(texto), PESOS["texto"]),
+    ]).astype(np.float32)
+
+def vector_archivo(path: str, texto: str) -> np.ndarray:
+    with open(path, "rb") as f:
+        return vector_prenda(f.read(), texto)
+
+def con_texto(vector: np.ndarray, texto: str) -> np.ndarray:
+    """Cambia el bloque de texto de un vector ya calculado, sin volver a decodificar la imagen."""
+    v = vector.copy()
+    v[DIM_COLOR + DIM_PHASH:] = _unitario(_texto(texto), PESOS["texto"])
+    return v
+
+def texto_prenda(prenda: dict) -> str:
+    return " ".join(prenda.get(c) or "" for c in ("nombre", "tipo", "marca", "descripcion"))
+
+class IndiceSimilitud:
+    """Matriz N x DIM en un archivo mapeado en memoria, más los ids de prenda de cada fila.
+
+    Agregar o reemplazar escribe una fila; quitar la marca libre para reutilizarla. Las
+    consultas son un producto matriz-vector (o matriz-matriz para varias prendas a la vez)
+    sobre las filas activas, sin tocar la base.
+
+    Varios procesos (los workers de gunicorn) pueden escribir: cada escritura toma un flock sobre
+    el directorio y sube el contador de 8 bytes del archivo `version`; el que ve un número
+    distinto al suyo vuelve a abrir la matriz antes de leer o escribir.
+    """
+
+    CAPACIDAD_INICIAL = 1024
+
+    def __init__(self, directorio: str):
+        self.directorio = directorio
+        self.path_vectores = os.path.join(directorio, "vectores.f32")
+        self.path_ids = os.path.join(directorio, "ids.s24")
+        self.path_version = os.path.join(directorio, "version")
+        self._lock = threading.Lock()
+        os.makedirs(directorio, exist_ok=True)
+        self._fd_version = os.open(self.path_version, os.O_RDWR | os.O_CREAT, 0o644)
+        with self._candado():
+            self._abrir()
+            self._version = self._leer_version()
+
+    @contextmanager
+    def _candado(self):
+        if fcntl is None:
+            yield
+            return
+        with open(os.path.join(self.directorio, ".lock"), "a") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            yield
+
+    def _leer_version(self) -> int:
+        # 8 bytes alineados al inicio del archivo: pread/pwrite no los ven a medias
+        return int.from_bytes(os.pread(self._fd_version, 8, 0).ljust(8, b"\0"), "little")
+
+    def _recargar(self):
+        """Con self._lock y el flock tomados: si otro proceso escribió, se vuelve a abrir la matriz."""
+        version = self._leer_version()
+        if version != self._version:
+            self._abrir()
+            self._version = version
+
+    def _al_dia(self):
+        # Leer la versión sin el flock alcanza para saber si hay que recargar (caso raro)
+        if self._leer_version() != self._version:
+            with self._candado():
+                self._recargar()
+
+    @contextmanager
+    def _escritura(self):
+        with self._lock, self._candado():
+            self._recargar()
+            yield
+            self._version += 1
+            os.pwrite(self._fd_version, self._version.to_bytes(8, "little"), 0)
+
+    def _abrir(self):
+        if os.path.exists(self.path_ids):
+            capacidad = os.path.getsize(self.path_ids) // 24
+            self._ids = np.memmap(self.path_ids, dtype="S24", mode="r+", shape=(capacidad,))
+            self._vectores = np.memmap(self.path_vectores, dtype=np.float32, mode="r+", shape=(capacidad, DIM))
+        else:
+            self._crear(self.CAPACIDAD_INICIAL)
+        ocupadas = np.flatnonzero(self._ids != b"")
+        self._filas = {self._ids[i].decode(): int(i) for i in ocupadas}
+        self._usadas = int(ocupadas[-1]) + 1 if len(ocupadas) else 0
+        self._activas = np.zeros(len(self._ids), dtype=bool)
+        self._activas[ocupadas] = True
+        self._libres = [int(i) for i in np.flatnonzero(~self._activas[:self._usadas])]
+
+    def _crear(self, capacidad: int):
+        self._ids = np.memmap(self.path_ids, dtype="S24", mode="w+", shape=(capacidad,))
+        self._vectores = np.memmap(self.path_vectores, dtype=np.float32, mode="w+", shape=(capacidad, DIM))
+
+    def _crecer(self):
+        capacidad = len(self._ids) * 2
+        self._ids.flush()
+        self._vectores.flush()
+        del self._ids, self._vectores
+        # Agrandar el archivo deja ceros al final: filas vacías
+        for path, tam in ((self.path_ids, capacidad * 24), (self.path_vectores, capacidad * DIM * 4)):
+            with open(path, "r+b") as f:
+                f.truncate(tam)
+        self._ids = np.memmap(self.path_ids, dtype="S24", mode="r+", shape=(capacidad,))
+        self._vectores = np.memmap(self.path_vectores, dtype=np.float32, mode="r+", shape=(capacidad, DIM))
+        self._activas = np.concatenate([self._activas, np.zeros(capacidad - len(self._activas), dtype=bool)])
+
+    def agregar(self, prenda_id: str, vector: np.ndarray, sincronizar: bool = True):
+        with self._escritura():
+            fila = self._filas.get(prenda_id)
+            if fila is None:
+                if self._libres:
+                    fila = self._libres.pop()
+                else:
+                    if self._usadas == len(self._ids):
+                        self._crecer()
+                    fila = self._usadas
+                    self._usadas += 1
+            self._vectores[fila] = vector
+            self._ids[fila] = prenda_id.encode()
+            self._filas[prenda_id] = fila
+            self._activas[fila] = True
+            if sincronizar:
+                self.sincronizar()
+
+    def sincronizar(self):
+        self._vectores.flush()
+        self._ids.flush()
+
+    def quitar(self, prenda_id: str):
+        with self._escritura():
+            fila = self._filas.pop(prenda_id, None)
+            if fila is None:
+                return
+            self._ids[fila] = b""
+            self._vectores[fila] = 0
+            self._activas[fila] = False
+            self._libres.append(fila)
+            self._ids.flush()
+
+    def similares_lote(self, prenda_ids: list, k: int) -> list:
+        """Top-K por similitud coseno para varias prendas con un solo producto de matrices.
+        Devuelve, por cada id, una lista de (prenda_id, similitud); None si no está indexada."""
+        with self._lock:
+            self._al_dia()
+            filas = [self._filas.get(p) for p in prenda_ids]
+            validas = [f for f in filas if f is not None]
+            usadas = self._usadas
+            if not validas or not usadas:
+                return [None] * len(prenda_ids)
+            # Vista sobre el memmap actual y copia de la máscara: el producto corre fuera del lock
+            matriz = self._vectores[:usadas]
+            ids = self._ids
+            inactivas = ~self._activas[:usadas]
+        consultas = np.asarray(matriz[validas])
+        puntajes = consultas @ matriz.T
+        puntajes[:, inactivas] = -np.inf
+        puntajes[np.arange(len(validas)), validas] = -np.inf
+        k = min(k, usadas)
+        top = np.argpartition(-puntajes, k - 1, axis=1)[:, :k]
+        resultados = []
+        for fila_consulta, candidatos in zip(puntajes, top):
+            orden = candidatos[np.argsort(-fila_consulta[candidatos])]
+            resultados.append([
+                (ids[i].decode(), float(fila_consulta[i])) for i in orden if np.isfinite(fila_consulta[i])
+            ])
+        salida = iter(resultados)
+        return [next(salida) if f is not None else None for f in filas]
+
+    def duplicados(self, vector: np.ndarray, max_hamming: int, min_color: float) -> list:
+        """Prendas casi idénticas a `vector`, como [(prenda_id, distancia)] de la más cercana a la
+        más lejana. La distancia son los bits distintos del pHash; además se pide que los colores
+        se parezcan, porque el pHash es en grises y la misma prenda en otro color daría igual."""
+        with self._lock:
+            self._al_dia()
+            usadas = self._usadas
+            if not usadas:
+                return []
+            matriz = self._vectores[:usadas]
+            ids = self._ids
+            activas = self._activas[:usadas].copy()
+        # Cada bloque está normalizado a la raíz de su peso: dividiendo por el peso queda el coseno
+        color = matriz[:, :DIM_COLOR] @ vector[:DIM_COLOR] / PESOS["color"]
+        phash = matriz[:, DIM_COLOR:DIM_COLOR + DIM_PHASH] @ vector[DIM_COLOR:DIM_COLOR + DIM_PHASH] / PESOS["phash"]
+        # Entre hashes de ±1 el coseno es 1 - 2 * hamming / 64
+        hamming = np.rint((1 - phash) * DIM_PHASH / 2).astype(int)
+        filas = np.flatnonzero(activas & (hamming <= max_hamming) & (color >= min_color))
+        return sorted(((ids[i].decode(), int(hamming[i])) for i in filas), key=lambda d: d[1])
+
+    def similares(self, prenda_id: str, k: int):
+        return self.similares_lote([prenda_id], k)[0]
+
+    def ids(self) -> list:
+        with self._lock:
+            self._al_dia()
+            return list(self._filas)
+
+    def __len__(self):
+        return len(self._filas)
+
+indice_similitud = IndiceSimilitud(INDICE_SIMILITUD_DIR)
+
+async def indexar_prenda(prenda_id: str, image_path: str, texto: str, vector: np.ndarray = None):
+    """`vector` es el que ya se calculó al cargar la imagen (utils/ingesta.py), si lo hay."""
+    try:
+        if vector is None:
+            vector = await en_pool_imagenes(vector_archivo, image_path, texto)
+        else:
+            vector = con_texto(vector, texto)
+        await run_in_threadpool(indice_similitud.agregar, prenda_id, vector)
+    except Exception as e:
+        print(f"❌ No se pudo indexar la prenda {prenda_id}: {e}")
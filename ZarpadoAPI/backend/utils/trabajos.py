@@ -0,0 +1,193 @@
+import asyncio
+import time
+import uuid
+from datetime import datetime, timezone
+
+from fastapi import HTTPException
+from pymongo.errors import DuplicateKeyError
+
+from config import TRY_ON_WORKERS, TRY_ON_COLA_MAX, TRY_ON_TRABAJOS_TTL, WORKERS
+from db.mongo import get_db
+
+ESTADOS_FINALES = ("completado", "error")
+
+class ColaLlena(Exception):
+    pass
+
+class Trabajo:
+    def __init__(self, tarea, args):
+        self.id = uuid.uuid4().hex
+        self.estado = "en_cola"
+        self.etapa = None
+        self.progreso = 0
+        self.resultado = None
+        self.error = None
+        self.codigo_error = None
+        self.creado = time.time()
+        self.actualizado = self.creado
+        self._tarea = tarea
+        self._args = args
+        self.version = 0
+        self._cambio = asyncio.Event()
+        self._espejo = None
+
+    def actualizar(self, **campos):
+        for k, v in campos.items():
+            setattr(self, k, v)
+        self.actualizado = time.time()
+        self.version += 1
+        # Despierta a los que esperan (SSE) y arma un evento nuevo para el próximo cambio
+        self._cambio.set()
+        self._cambio = asyncio.Event()
+        if self._espejo:
+            self._espejo(self)
+
+    def progreso_cb(self, etapa: str, progreso: int):
+        self.actualizar(estado="procesando", etapa=etapa, progreso=progreso)
+
+    async def esperar_cambio(self, version: int, timeout: float):
+        if self.version != version:
+            return
+        try:
+            await asyncio.wait_for(self._cambio.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+
+    def to_dict(self) -> dict:
+        return {
+            "trabajo_id": self.id,
+            "estado": self.estado,
+            "etapa": self.etapa,
+            "progreso": self.progreso,
+            "resultado": self.resultado,
+            "error": self.error,
+            "creado": self.creado,
+            "actualizado": self.actualizado,
+        }
+
+class TrabajoRemoto:
+    """Foto de un trabajo de otro worker leída de Mongo, con la misma interfaz que usan las rutas."""
+
+    INTERVALO = 1
+
+    def __init__(self, doc: dict):
+        self._doc = doc
+        self.version = doc["version"]
+        self.estado = doc["estado"]
+
+    def to_dict(self) -> dict:
+        return {k: v for k, v in self._doc.items() if k not in ("_id", "version", "expira")}
+
+    async def esperar_cambio(self, version: int, timeout: float):
+        limite = time.monotonic() + timeout
+        while self.version == version and time.monotonic() < limite:
+            await asyncio.sleep(self.INTERVALO)
+            doc = await get_db()["trabajos"].find_one({"_id": self._doc["_id"]})
+            if doc:
+                self.__init__(doc)
+
+class ColaTrabajos:
+    """Cola acotada de trabajos async con un pool fijo de workers.
+
+    Con varios workers de gunicorn el pedido de estado puede caer en otro proceso: si `espejo`
+    está activo cada cambio se copia a la colección `trabajos` y `buscar` la consulta cuando el
+    trabajo no es propio.
+    """
+
+    def __init__(self, workers: int, max_cola: int, ttl: int, espejo: bool = False):
+        self.workers = workers
+        self.max_cola = max_cola
+        self.ttl = ttl
+        self.espejo = espejo
+        self.trabajos = {}
+        self.en_proceso = 0
+        self._cola = None
+        self._tasks = []
+        self._escrituras = set()
+
+    async def iniciar(self):
+        self._cola = asyncio.Queue(maxsize=self.max_cola)
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def detener(self):
+        for t in self._tasks:
+            t.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        await asyncio.gather(*self._escrituras, return_exceptions=True)
+
+    def encolar(self, tarea, *args) -> Trabajo:
+        """`tarea` es una corrutina `tarea(*args, progreso=cb)` que devuelve el resultado del trabajo."""
+        self._purgar()
+        trabajo = Trabajo(tarea, args)
+        try:
+            self._cola.put_nowait(trabajo)
+        except asyncio.QueueFull:
+            raise ColaLlena()
+        self.trabajos[trabajo.id] = trabajo
+        if self.espejo:
+            trabajo._espejo = self._reflejar
+            self._reflejar(trabajo)
+        return trabajo
+
+    def obtener(self, trabajo_id: str):
+        return self.trabajos.get(trabajo_id)
+
+    async def buscar(self, trabajo_id: str):
+        """Como `obtener`, pero si el trabajo es de otro worker lo lee del espejo en Mongo."""
+        trabajo = self.trabajos.get(trabajo_id)
+        if trabajo or not self.espejo:
+            return trabajo
+        doc = await get_db()["trabajos"].find_one({"_id": trabajo_id})
+        return TrabajoRemoto(doc) if doc else None
+
+    def _reflejar(self, trabajo: Trabajo):
+        doc = dict(trabajo.to_dict(), version=trabajo.version,
+                   expira=datetime.fromtimestamp(trabajo.actualizado + self.ttl, timezone.utc))
+        tarea = asyncio.create_task(self._escribir(trabajo.id, doc))
+        self._escrituras.add(tarea)
+        tarea.add_done_callback(self._escrituras.discard)
+
+    async def _escribir(self, trabajo_id: str, doc: dict):
+        # Las escrituras pueden llegar desordenadas: solo pisa una versión más vieja. Si ya hay una
+        # más nueva el filtro no matchea, el upsert choca con el _id y se descarta.
+        try:
+            await get_db()["trabajos"].update_one(
+                {"_id": trabajo_id, "version": {"$lt": doc["version"]}}, {"$set": doc}, upsert=True
+            )
+        except DuplicateKeyError:
+            pass
+        except Exception as e:
+            print(f"⚠️ No se pudo reflejar el trabajo {trabajo_id} en MongoDB: {e}")
+
+    def profundidad(self) -> int:
+        return self._cola.qsize() if self._cola else 0
+
+    def llena(self) -> bool:
+        return self._cola is not None and self._cola.full()
+
+    def _purgar(self):
+        limite = time.time() - self.ttl
+        viejos = [t.id for t in self.trabajos.values() if t.estado in ESTADOS_FINALES and t.actualizado < limite]
+        for trabajo_id in viejos:
+            del self.trabajos[trabajo_id]
+
+    async def _worker(self):
+        while True:
+            trabajo = await self._cola.get()
+            self.en_proceso += 1
+            try:
+                trabajo.actualizar(estado="procesando")
+                resultado = await trabajo._tarea(*trabajo._args, progreso=trabajo.progreso_cb)
+                trabajo.actualizar(estado="completado", progreso=100, resultado=resultado)
+            except HTTPException as e:
+                trabajo.actualizar(estado="error", error=e.detail, codigo_error=e.status_code)
+            except Exception as e:
+                print(f"❌ Error en trabajo {trabajo.id}: {e}")
+                trabajo.actualizar(estado="error", error=str(e), codigo_error=500)
+            finally:
+                trabajo._args = None
+                self.en_proceso -= 1
+                self._cola.task_done()
+
+cola_trabajos = ColaTrabajos(TRY_ON_WORKERS, TRY_ON_COLA_MAX, TRY_ON_TRABAJOS_TTL, espejo=WORKERS > 1)
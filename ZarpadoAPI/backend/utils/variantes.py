@@ -0,0 +1,120 @@
+import asyncio
+import glob
+import hashlib
+import os
+import re
+import uuid
+from io import BytesIO
+
+from fastapi.concurrency import run_in_threadpool
+from PIL import Image, ImageOps
+
+from config import STORAGE_DIR
+from utils.archivos import enlazar_o_copiar
+
+# Lado mayor de cada variante. "full" también se recodifica para no servir fotos de 12 MP al celular.
+TAMANIOS = {"full": 2048, "medium": 768, "thumb": 256}
+FORMATOS = {
+    "webp": ("WEBP", {"quality": 80, "method": 4}),
+    "jpg": ("JPEG", {"quality": 85, "optimize": True, "progressive": True}),
+}
+# <stem>.<tamaño>.<hash del original>.<ext>: el nombre cambia si cambia el contenido, así que se
+# puede cachear para siempre en el cliente.
+PATRON_VARIANTE = re.compile(r"\.(thumb|medium|full)\.([0-9a-f]{16})\.(webp|jpg)$")
+
+def url_media(path: str) -> str:
+    rel = os.path.relpath(path, STORAGE_DIR).replace(os.sep, "/")
+    return f"/media/{rel}"
+
+def _stem(path: str) -> str:
+    return os.path.splitext(path)[0]
+
+def rutas_variantes(path: str) -> list:
+    stem = _stem(path)
+    rutas = glob.glob(f"{glob.escape(stem)}.*.*.*")
+    return [r for r in rutas if PATRON_VARIANTE.fullmatch(r[len(stem):])]
+
+def _como_dict(stem: str, rutas: list) -> dict:
+    variantes = {}
+    for r in rutas:
+        tamanio, _, ext = PATRON_VARIANTE.fullmatch(r[len(stem):]).groups()
+        variantes.setdefault(tamanio, {})[ext] = url_media(r)
+    return variantes
+
+def generar_variantes(path: str, data: bytes = None) -> dict:
+    """Genera thumb/medium/full en WebP y JPEG al lado del original y devuelve sus URLs.
+    `data` es el contenido de `path` si ya está en memoria (se evita volver a leerlo)."""
+    if data is None:
+        with open(path, "rb") as f:
+            data = f.read()
+    hash_original = hashlib.sha256(data).hexdigest()[:16]
+    stem = _stem(path)
+    rutas = []
+    with Image.open(BytesIO(data)) as img:
+        if img.format == "JPEG":
+            img.draft("RGB", (TAMANIOS["full"], TAMANIOS["full"]))
+        ImageOps.exif_transpose(img, in_place=True)
+        actual = img.convert("RGB") if img.mode != "RGB" else img
+        # De mayor a menor: cada variante se achica a partir de la anterior
+        for tamanio, lado in TAMANIOS.items():
+            actual = actual.copy()
+            actual.thumbnail((lado, lado), Image.LANCZOS)
+            for ext, (formato, opciones) in FORMATOS.items():
+                destino = f"{stem}.{tamanio}.{hash_original}.{ext}"
+                if not os.path.exists(destino):
+                    buf = BytesIO()
+                    actual.save(buf, format=formato, **opciones)
+                    # Nombre único: con el almacén dos requests pueden generar las variantes del mismo archivo a la vez
+                    tmp = f"{destino}.{uuid.uuid4().hex}.tmp"
+                    with open(tmp, "wb") as f:
+                        f.write(buf.getvalue())
+                    os.replace(tmp, destino)
+                rutas.append(destino)
+    return _como_dict(stem, rutas)
+
+def generar_variantes_seguro(path: str, data: bytes = None):
+    try:
+        return generar_variantes(path, data)
+    except Exception as e:
+        print(f"❌ No se pudieron generar variantes de {path}: {e}")
+        return None
+
+def enlazar_variantes(origen: str, destino: str) -> dict:
+    """Enlaza las variantes ya generadas de `origen` con el nombre base de `destino`."""
+    stem_origen, stem_destino = _stem(origen), _stem(destino)
+    rutas = []
+    for r in rutas_variantes(origen):
+        nueva = stem_destino + r[len(stem_origen):]
+        if not os.path.exists(nueva):
+            enlazar_o_copiar(r, nueva)
+        # Como en Almacen.publicar: el enlace recién hecho no puede heredar una fecha vieja
+        os.utime(nueva)
+        rutas.append(nueva)
+    return _como_dict(stem_destino, rutas)
+
+def borrar_variantes(path: str):
+    for r in rutas_variantes(path):
+        try:
+            os.remove(r)
+        except OSError:
+            pass
+
+def _borrar_con_variantes(path: str):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+    borrar_variantes(path)
+
+async def borrar_con_variantes(path: str):
+    await run_in_threadpool(_borrar_con_variantes, path)
+
+_borrados_pendientes = set()
+
+def borrar_en_segundo_plano(*paths: str):
+    """Borra archivos (y sus variantes) sin que el request espere al disco."""
+    for path in paths:
+        tarea = asyncio.create_task(borrar_con_variantes(path))
+        # Referencia fuerte hasta que termine, si no el GC puede cancelar la tarea
+        _borrados_pendientes.add(tarea)
+        tarea.add_done_callback(_borrados_pendientes.discard)